@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import UserProfile, Conversation, Message
+from django.utils import timezone
+from .models import UserProfile, Conversation, Message, DailyUsage, ArchivedMessageBlock, Task, PrecomputedAnswer
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -8,6 +9,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ('class_level', 'created_at')
     search_fields = ('user__username', 'user__email', 'phone')
     readonly_fields = ('created_at',)
+    list_select_related = ('user',)
 
 class MessageInline(admin.TabularInline):
     """Afficher les messages dans la page de conversation"""
@@ -19,23 +21,22 @@ class MessageInline(admin.TabularInline):
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     """Administration des conversations"""
-    list_display = ('id', 'user', 'created_at', 'updated_at', 'message_count')
+    list_display = ('id', 'user', 'title', 'created_at', 'updated_at', 'message_count', 'archived_at')
     list_filter = ('created_at', 'updated_at')
-    search_fields = ('user__username',)
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('user__username', 'title')
+    # message_count est tenu à jour par le chat (messages archivés compris)
+    readonly_fields = ('created_at', 'updated_at', 'archived_at', 'message_count', 'summary_message_count')
     inlines = [MessageInline]
-    
-    def message_count(self, obj):
-        return obj.messages.count()
-    message_count.short_description = 'Nombre de messages'
+    list_select_related = ('user',)
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     """Administration des messages"""
-    list_display = ('id', 'conversation', 'is_user_display', 'content_preview', 'timestamp')
+    list_display = ('id', 'conversation', 'is_user_display', 'content_preview', 'timestamp', 'completion_tokens', 'llm_latency_ms')
     list_filter = ('is_user', 'timestamp', 'class_level', 'subject')
     search_fields = ('content',)
-    readonly_fields = ('timestamp',)
+    readonly_fields = ('timestamp', 'prompt_tokens', 'completion_tokens', 'llm_latency_ms')
+    list_select_related = ('conversation__user',)
     
     def is_user_display(self, obj):
         return '👤 User' if obj.is_user else '🤖 AI'
@@ -43,4 +44,44 @@ class MessageAdmin(admin.ModelAdmin):
     
     def content_preview(self, obj):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
-    content_preview.short_description = 'Contenu'
\ No newline at end of file
+    content_preview.short_description = 'Contenu'
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(admin.ModelAdmin):
+    """Consommation quotidienne de l'IA"""
+    list_display = ('user', 'date', 'requests', 'prompt_tokens', 'completion_tokens', 'llm_latency_ms')
+    list_filter = ('date',)
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'date', 'requests', 'prompt_tokens', 'completion_tokens', 'llm_latency_ms')
+
+@admin.register(ArchivedMessageBlock)
+class ArchivedMessageBlockAdmin(admin.ModelAdmin):
+    """Blocs de messages archivés (contenu compressé)"""
+    list_display = ('id', 'conversation', 'message_count', 'first_timestamp', 'last_timestamp', 'raw_size', 'archived_at')
+    list_filter = ('archived_at',)
+    list_select_related = ('conversation__user',)
+    exclude = ('data',)
+    readonly_fields = ('conversation', 'first_message_id', 'last_message_id', 'message_count',
+                       'first_timestamp', 'last_timestamp', 'raw_size', 'archived_at')
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """File des tâches d'arrière-plan"""
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'finished_at', 'locked_by')
+    list_filter = ('status', 'name')
+    search_fields = ('idempotency_key', 'last_error')
+    readonly_fields = ('created_at', 'locked_at', 'locked_by', 'finished_at', 'last_error')
+    actions = ['retry']
+    
+    @admin.action(description="Relancer les tâches sélectionnées")
+    def retry(self, request, queryset):
+        queryset.update(status=Task.PENDING, run_at=timezone.now(), attempts=0)
+
+@admin.register(PrecomputedAnswer)
+class PrecomputedAnswerAdmin(admin.ModelAdmin):
+    """Réponses précalculées (manage.py warm_answers) ; supprimer une réponse la retire du chat"""
+    list_display = ('question', 'class_level', 'subject', 'frequency', 'model', 'generated_at', 'expires_at')
+    list_filter = ('class_level', 'subject', 'model')
+    search_fields = ('question', 'answer')
+    readonly_fields = ('question_key', 'model', 'frequency', 'prompt_tokens', 'completion_tokens', 'created_at', 'generated_at')
@@ -2,4 +2,13 @@ from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Enregistre les gestionnaires de la file de tâches (api.taskqueue)
+        from . import purge, summaries, usage  # noqa: F401
+        # Invalidation du cache des profils à chaque sauvegarde
+        from . import profile_cache  # noqa: F401
+        # Contrôles de configuration (manage.py check)
+        from . import checks  # noqa: F401
@@ -0,0 +1,111 @@
+"""
+Archivage des messages froids.
+
+Les messages des conversations inactives sont déplacés de la table `Message`
+(écrite et lue à chaque échange) vers `ArchivedMessageBlock` : des blocs de
+messages consécutifs, sérialisés en JSON compact puis compressés avec zlib.
+Les lectures (`ConversationSerializer`, export) recomposent la conversation
+à partir des blocs puis des messages encore « chauds ».
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedMessageBlock, Conversation, Message
+
+# Ordre des colonnes dans un bloc (une liste par message, pas de noms répétés)
+ARCHIVED_FIELDS = (
+    'id', 'content', 'is_user', 'timestamp', 'class_level', 'subject',
+    'prompt_tokens', 'completion_tokens', 'llm_latency_ms',
+)
+# Taille des listes IN des suppressions (limite de variables de SQLite)
+DELETE_BATCH_SIZE = 500
+
+
+def pack_messages(messages):
+    """(données compressées, taille brute) d'une liste de messages"""
+    rows = [
+        [getattr(message, field) if field != 'timestamp' else message.timestamp.isoformat()
+         for field in ARCHIVED_FIELDS]
+        for message in messages
+    ]
+    raw = json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode()
+    return zlib.compress(raw, 9), len(raw)
+
+
+def unpack_block(block):
+    """Messages (non enregistrés) d'un bloc d'archive"""
+    messages = []
+    for row in json.loads(zlib.decompress(bytes(block.data))):
+        values = dict(zip(ARCHIVED_FIELDS, row))
+        values['timestamp'] = parse_datetime(values['timestamp'])
+        messages.append(Message(conversation_id=block.conversation_id, **values))
+    return messages
+
+
+def archived_messages(conversation):
+    """Messages archivés d'une conversation, dans l'ordre"""
+    if conversation.archived_at is None:
+        return []
+    messages = []
+    # .all() pour profiter d'un éventuel prefetch_related('archive_blocks')
+    for block in sorted(conversation.archive_blocks.all(), key=lambda block: block.first_message_id):
+        messages.extend(unpack_block(block))
+    return messages
+
+
+def idle_conversations(days):
+    """Conversations sans activité depuis `days` jours et ayant encore des messages chauds"""
+    cutoff = timezone.now() - timedelta(days=days)
+    return (
+        Conversation.objects
+        .filter(updated_at__lt=cutoff, messages__isnull=False)
+        .distinct()
+        .order_by('updated_at')
+    )
+
+
+def archive_conversation(conversation, block_size):
+    """
+    Déplace tous les messages chauds de la conversation dans des blocs compressés.
+    Retourne (messages archivés, octets bruts, octets compressés).
+    """
+    with transaction.atomic():
+        messages = list(
+            Message.objects.select_for_update()
+            .filter(conversation=conversation)
+            .order_by('timestamp', 'id')
+        )
+        if not messages:
+            return 0, 0, 0
+
+        blocks = []
+        raw_total = compressed_total = 0
+        for start in range(0, len(messages), block_size):
+            chunk = messages[start:start + block_size]
+            data, raw_size = pack_messages(chunk)
+            blocks.append(ArchivedMessageBlock(
+                conversation=conversation,
+                first_message_id=chunk[0].id,
+                last_message_id=chunk[-1].id,
+                message_count=len(chunk),
+                first_timestamp=chunk[0].timestamp,
+                last_timestamp=chunk[-1].timestamp,
+                raw_size=raw_size,
+                data=data,
+            ))
+            raw_total += raw_size
+            compressed_total += len(data)
+        ArchivedMessageBlock.objects.bulk_create(blocks)
+
+        ids = [message.id for message in messages]
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            Message.objects.filter(id__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+        # update() plutôt que save() : l'archivage ne modifie pas updated_at
+        Conversation.objects.filter(pk=conversation.pk).update(archived_at=timezone.now())
+
+    return len(messages), raw_total, compressed_total
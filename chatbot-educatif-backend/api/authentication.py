@@ -1,23 +1,26 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
+from . import profile_cache, provisioning, replicas, tracing
 from .models import UserProfile
-from .serializers import UserSerializer
+import csv
 import logging
 
   # Ajouter pour logout
 from .models import UserProfile
-from .serializers import UserSerializer
 import logging
 
 logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@tracing.traced('view.register')
 def register(request):
     """
     Inscription d'un nouvel utilisateur
@@ -80,8 +83,11 @@ def register(request):
         
         # Générer les tokens JWT
         refresh = RefreshToken.for_user(user)
+        access = str(refresh.access_token)
+        # Le compte n'est peut-être pas encore répliqué : premières lectures sur le primaire
+        replicas.stick_to_primary(f'Bearer {access}')
         
-        logger.info(f"Nouvel utilisateur inscrit: {username}")
+        logger.info("Nouvel utilisateur inscrit: %s", username)
         
         return Response({
             'message': 'Inscription réussie ! Bienvenue ! 🎉',
@@ -93,19 +99,76 @@ def register(request):
             },
             'tokens': {
                 'refresh': str(refresh),
-                'access': str(refresh.access_token),
+                'access': access,
             }
         }, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        logger.error(f"Erreur lors de l'inscription: {e}")
+        logger.error("Erreur lors de l'inscription: %s", e)
         return Response(
             {'error': 'Erreur lors de l\'inscription'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@tracing.traced('view.bulk_register')
+def bulk_register(request):
+    """
+    Inscription d'une classe entière (personnel uniquement)
+    
+    POST /api/auth/bulk-register/?class_level=cm1
+    Headers: Authorization: Bearer <access_token>
+    Body JSON: {"class_level": "cm1", "students": [{"username", "password", "email", "phone", "class_level"}, ...]}
+    ou CSV (Content-Type: text/csv, ou fichier `file`) avec l'en-tête username,email,password,phone,class_level
+    Réponse: {"created": 38, "failed": 2, "results": [{"row": 0, "username": "...", "status": "created", "id": 12}, ...]}
+    """
+    try:
+        rows = provisioning.parse_rows(request)
+    except (provisioning.InvalidPayload, UnicodeDecodeError, csv.Error) as e:
+        return Response({'error': f'Liste invalide: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not rows or len(rows) > settings.BULK_REGISTER_MAX_ROWS:
+        return Response(
+            {'error': f'Entre 1 et {settings.BULK_REGISTER_MAX_ROWS} élèves par envoi'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    default_class_level = request.query_params.get('class_level')
+    # Corps CSV brut : request.data n'est pas lisible (pas de parser text/csv)
+    if not default_class_level and not request.content_type.startswith('text/csv') and isinstance(request.data, dict):
+        default_class_level = request.data.get('class_level')
+    
+    valid, errors = provisioning.validate(rows, default_class_level)
+    try:
+        created = provisioning.create_accounts(valid) if valid else {}
+    except IntegrityError:
+        # Un nom a été pris entre la validation et l'insertion : rien n'a été créé
+        return Response(
+            {'error': 'Un compte a été créé en même temps, réessayez'},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    results = []
+    for index, row in enumerate(rows):
+        result = {'row': index, 'username': str(row.get('username') or '')}
+        if index in created:
+            result.update(status='created', id=created[index])
+        else:
+            result.update(status='error', errors=errors[index])
+        results.append(result)
+    
+    logger.info("Inscription groupée: %d comptes créés, %d refusés", len(created), len(errors))
+    
+    return Response({
+        'created': len(created),
+        'failed': len(errors),
+        'results': results,
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@tracing.traced('view.login')
 def login(request):
     """
     Connexion d'un utilisateur
@@ -137,16 +200,16 @@ def login(request):
     # Générer les tokens JWT
     refresh = RefreshToken.for_user(user)
     
-    # Récupérer le profil
-    profile = None
-    if hasattr(user, 'profile'):
+    # Récupérer le profil (cache des profils, sans accès paresseux à user.profile)
+    profile = profile_cache.get(user.id)['profile']
+    if profile is not None:
         profile = {
-            'phone': user.profile.phone,
-            'class_level': user.profile.class_level,
-            'avatar': user.profile.avatar,
+            'phone': profile['phone'],
+            'class_level': profile['class_level'],
+            'avatar': profile['avatar'],
         }
     
-    logger.info(f"Utilisateur connecté: {username}")
+    logger.info("Utilisateur connecté: %s", username)
     
     return Response({
         'message': 'Connexion réussie ! 👋',
@@ -163,6 +226,7 @@ def login(request):
     }, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
+@tracing.traced('view.logout')
 def logout(request):
     """
     Déconnexion (blacklist du refresh token)
@@ -184,20 +248,21 @@ def logout(request):
         token = RefreshToken(refresh_token)
         token.blacklist()
         
-        logger.info(f"Utilisateur déconnecté")
+        logger.info("Utilisateur déconnecté")
         
         return Response(
             {'message': 'Déconnexion réussie 👋'},
             status=status.HTTP_200_OK
         )
     except Exception as e:
-        logger.error(f"Erreur lors de la déconnexion: {e}")
+        logger.error("Erreur lors de la déconnexion: %s", e)
         return Response(
             {'error': 'Erreur lors de la déconnexion'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
 @api_view(['GET'])
+@tracing.traced('view.get_profile')
 def get_profile(request):
     """
     Récupérer le profil de l'utilisateur connecté
@@ -211,10 +276,10 @@ def get_profile(request):
             status=status.HTTP_401_UNAUTHORIZED
         )
     
-    serializer = UserSerializer(request.user)
-    return Response(serializer.data)
+    return Response(profile_cache.get(request.user.id))
 
 @api_view(['PUT'])
+@tracing.traced('view.update_profile')
 def update_profile(request):
     """
     Mettre à jour le profil de l'utilisateur
@@ -233,31 +298,38 @@ def update_profile(request):
             status=status.HTTP_401_UNAUTHORIZED
         )
     
-    user = request.user
-    
-    # Mettre à jour l'email
-    email = request.data.get('email')
-    if email and email != user.email:
-        if User.objects.filter(email=email).exclude(id=user.id).exists():
-            return Response(
-                {'error': 'Cet email est déjà utilisé'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        user.email = email
-        user.save()
-    
-    # Mettre à jour le profil
-    profile = user.profile
-    if request.data.get('phone'):
-        profile.phone = request.data.get('phone')
-    if request.data.get('class_level'):
-        profile.class_level = request.data.get('class_level')
-    if request.data.get('avatar'):
-        profile.avatar = request.data.get('avatar')
-    profile.save()
+    # Utilisateur et profil mis à jour ensemble (ou pas du tout)
+    with transaction.atomic():
+        user = User.objects.select_related('profile').get(pk=request.user.pk)
+        
+        # Mettre à jour l'email
+        email = request.data.get('email')
+        if email and email != user.email:
+            if User.objects.filter(email=email).exclude(id=user.id).exists():
+                return Response(
+                    {'error': 'Cet email est déjà utilisé'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            user.email = email
+            user.save(update_fields=['email'])
+        
+        # Mettre à jour le profil
+        try:
+            profile = user.profile
+        except UserProfile.DoesNotExist:
+            profile = UserProfile(user=user)
+        changed = [field for field in ('phone', 'class_level', 'avatar') if request.data.get(field)]
+        for field in changed:
+            setattr(profile, field, request.data.get(field))
+        if profile.pk is None:
+            profile.save()
+        elif changed:
+            profile.save(update_fields=changed)
+        
+        # Écriture directe dans le cache des profils à la validation
+        data = profile_cache.store(user)
     
-    serializer = UserSerializer(user)
     return Response({
         'message': 'Profil mis à jour avec succès ✅',
-        'user': serializer.data
+        'user': data
     })
\ No newline at end of file
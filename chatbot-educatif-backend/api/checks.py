@@ -0,0 +1,46 @@
+"""
+Contrôles de configuration (manage.py check ; lancés aussi par migrate et runserver).
+"""
+import ipaddress
+
+from django.conf import settings
+from django.core import checks
+
+# Caches propres à chaque processus : invisibles des autres workers
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def shared_cache():
+    """Vrai si le cache par défaut est commun à tous les workers"""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+@checks.register()
+def check_usage_cache(app_configs, **kwargs):
+    if not (settings.USAGE_USER_DAILY_TOKENS or settings.USAGE_CLASS_DAILY_TOKENS) or shared_cache():
+        return []
+    return [checks.Error(
+        "Budgets quotidiens configurés avec un cache local au processus : "
+        "chaque worker gunicorn compte de son côté et le budget est multiplié.",
+        hint="Définir CACHE_URL (Redis ou Memcached) ; avec un seul worker, "
+             "ajouter 'api.E001' à SILENCED_SYSTEM_CHECKS.",
+        id='api.E001',
+    )]
+
+
+@checks.register()
+def check_tracing_proxies(app_configs, **kwargs):
+    errors = []
+    for proxy in settings.TRACING_TRUSTED_PROXIES:
+        try:
+            ipaddress.ip_network(proxy, strict=False)
+        except ValueError:
+            errors.append(checks.Error(
+                f"TRACING_TRUSTED_PROXIES : adresse ou réseau invalide {proxy!r}",
+                hint="Adresses IP ou réseaux CIDR séparés par des virgules, ex: 10.0.0.0/8,127.0.0.1",
+                id='api.E002',
+            ))
+    return errors
@@ -0,0 +1,40 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified) pour les endpoints de lecture.
+
+Les ETags sont calculés à partir de versions bon marché (dates de mise à
+jour, compteurs) avant toute sérialisation : si le client possède déjà la
+bonne version, on répond 304 sans corps.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """ETag fort à partir des éléments qui déterminent le contenu de la réponse"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def variant_etag(etag, encoding):
+    """ETag propre à une représentation compressée (un ETag fort désigne des octets précis)"""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Réponse 304 si la version du client est à jour, sinon None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Ajoute ETag / Last-Modified et oblige le client à revalider"""
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'
+    return response
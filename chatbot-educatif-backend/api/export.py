@@ -0,0 +1,110 @@
+"""
+Export complet de l'historique d'un utilisateur en NDJSON (une ligne JSON
+par objet), produit au fil de l'eau.
+
+Conversations, blocs d'archive et messages sont lus par curseur
+(`.iterator(chunk_size=...)`) et fusionnés dans l'ordre des conversations :
+la mémoire utilisée ne dépend pas de la taille de l'historique (sur
+PostgreSQL, curseurs côté serveur ; le pilote MySQL, lui, charge chaque
+résultat côté client).
+"""
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .archive import unpack_block
+from .models import ArchivedMessageBlock, Conversation, Message
+
+CONVERSATION_FIELDS = ('id', 'created_at', 'updated_at')
+MESSAGE_FIELDS = ('id', 'conversation_id', 'content', 'is_user', 'timestamp', 'class_level', 'subject')
+
+# Les blocs d'archive contiennent chacun des centaines de messages
+ARCHIVE_CHUNK_SIZE = 20
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _line(kind, data):
+    return _encoder.encode({'type': kind, **data}) + '\n'
+
+
+class _Cursor:
+    """Itérateur trié par conversation, consommé conversation par conversation"""
+
+    def __init__(self, iterator, key):
+        self.iterator = iterator
+        self.key = key
+        self.current = next(iterator, None)
+
+    def take(self, conversation_id):
+        # Les lignes d'une conversation absente du curseur principal sont ignorées
+        while self.current is not None and self.key(self.current) <= conversation_id:
+            if self.key(self.current) == conversation_id:
+                yield self.current
+            self.current = next(self.iterator, None)
+
+
+def export_records(user, chunk_size=None):
+    """Lignes NDJSON de l'historique de `user` : utilisateur, puis chaque conversation suivie de ses messages"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    yield _line('user', {'id': user.id, 'username': user.username, 'email': user.email})
+
+    conversations = (
+        Conversation.objects.filter(user=user)
+        .order_by('id')
+        .values(*CONVERSATION_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    blocks = _Cursor(
+        ArchivedMessageBlock.objects.filter(conversation__user=user, conversation__deleted_at__isnull=True)
+        .order_by('conversation_id', 'first_message_id')
+        .iterator(chunk_size=ARCHIVE_CHUNK_SIZE),
+        key=lambda block: block.conversation_id,
+    )
+    messages = _Cursor(
+        Message.objects.filter(conversation__user=user, conversation__deleted_at__isnull=True)
+        .order_by('conversation_id', 'id')
+        .values(*MESSAGE_FIELDS)
+        .iterator(chunk_size=chunk_size),
+        key=lambda message: message['conversation_id'],
+    )
+
+    for conversation in conversations:
+        yield _line('conversation', conversation)
+        # Messages archivés d'abord (plus anciens), puis messages chauds
+        for block in blocks.take(conversation['id']):
+            for message in unpack_block(block):
+                yield _line('message', {field: getattr(message, field) for field in MESSAGE_FIELDS})
+        for message in messages.take(conversation['id']):
+            yield _line('message', message)
+
+
+def _buffered(lines, size):
+    """Regroupe les lignes en blocs d'environ `size` octets"""
+    buffer, length = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_export(user, compress=False):
+    """Blocs d'octets de l'export, compressés au fil de l'eau en gzip si demandé"""
+    chunks = _buffered(export_records(user), settings.EXPORT_BUFFER_SIZE)
+    if not compress:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 : en-tête gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
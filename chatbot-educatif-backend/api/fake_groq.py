@@ -0,0 +1,141 @@
+"""
+Serveur HTTP local imitant l'API Groq (compatible OpenAI) pour les tests de charge.
+
+Répond à POST /openai/v1/chat/completions avec une réponse fixe après une
+latence réglable, en JSON ou en flux SSE (`"stream": true`), et peut
+injecter des erreurs (429 / 500) avec une probabilité donnée. Le client
+Groq de l'application y est dirigé par GROQ_BASE_URL.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+ANSWER = (
+    "Pour additionner 12 et 7, on commence par les unités : 2 + 7 = 9. "
+    "On garde la dizaine : 12 + 7 = 19. Essaie maintenant avec 15 + 4 !"
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        options = self.server.options
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            request = {}
+        self.server.record(self.headers)
+
+        if self.path.split('?')[0] != COMPLETIONS_PATH:
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        delay = max(0.0, random.gauss(options['latency'], options['jitter']))
+        if random.random() < options['error_rate']:
+            time.sleep(delay / 4)
+            status = random.choice((429, 500))
+            self._send_json(status, {'error': {'message': 'erreur injectée', 'type': 'fake_groq_error'}})
+            return
+
+        words = ANSWER.split(' ')
+        usage = {
+            'prompt_tokens': sum(len(m.get('content') or '') for m in request.get('messages', [])) // 4,
+            'completion_tokens': len(words),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        model = request.get('model') or 'fake'
+
+        if not request.get('stream'):
+            time.sleep(delay)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        # Flux SSE : premier fragment après la latence, puis un mot par fragment
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(delay)
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if not index else ' ' + word}, 'finish_reason': None}],
+            }
+            if index == len(words) - 1:
+                chunk['choices'][0]['finish_reason'] = 'stop'
+                chunk['x_groq'] = {'usage': usage}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            if options['chunk_interval']:
+                time.sleep(options['chunk_interval'])
+        self.wfile.write(b'data: [DONE]\n\n')
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    """
+    `FakeGroqServer(latency=0.5).start()` : serveur dans un thread, `url`
+    à passer comme GROQ_BASE_URL ; `stop()` l'arrête.
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.5, jitter=0.1, error_rate=0.0, chunk_interval=0.01):
+        super().__init__((host, port), _Handler)
+        self.options = {
+            'latency': latency,
+            'jitter': jitter,
+            'error_rate': error_rate,
+            'chunk_interval': chunk_interval,
+        }
+        self.requests = 0
+        # En-têtes du dernier appel (request id et traceparent transmis par l'application)
+        self.last_headers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, headers):
+        with self._lock:
+            self.requests += 1
+            self.last_headers = dict(headers)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-groq', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
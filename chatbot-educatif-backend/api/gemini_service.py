@@ -1,20 +1,35 @@
 import os
+import threading
+import time
 from groq import Groq
 from decouple import config
 import logging
 
+from . import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
+FALLBACK_RESPONSE = "Désolé, je n'ai pas pu traiter votre demande. Pouvez-vous reformuler ?"
+
 class GeminiService:
     """
     Service pour l'API Groq (Llama 3 gratuit, ultra-rapide, sans téléphone)
     Garde le même nom de classe pour compatibilité totale.
     """
 
-    def __init__(self):
-        self.api_key = os.environ.get('GROQ_API_KEY') or config('GROQ_API_KEY', default='')
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key or os.environ.get('GROQ_API_KEY') or config('GROQ_API_KEY', default='')
+        # Autre serveur compatible (tests de charge : manage.py fake_groq)
+        self.base_url = base_url or config('GROQ_BASE_URL', default='') or None
         self.client = None
         self.model_name = None
+        # Disjoncteur : après N échecs consécutifs, on n'appelle plus Groq
+        # pendant `circuit_cooldown` secondes
+        self.circuit_threshold = config('GROQ_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+        self.circuit_cooldown = config('GROQ_CIRCUIT_COOLDOWN', default=30, cast=float)
+        self._failures = 0
+        self._opened_at = None
+        self._circuit_lock = threading.Lock()
         self.configure()
 
     def configure(self):
@@ -24,37 +39,152 @@ class GeminiService:
                 logger.warning("Clé API Groq non configurée. Mode démo.")
                 return
 
-            self.client = Groq(api_key=self.api_key)
+            self.client = Groq(api_key=self.api_key, base_url=self.base_url)
             # Modèle recommandé : Llama 3 70B (gratuit, très performant)
             self.model_name = "groq/compound-mini"  # ou "llama3-8b-8192" pour plus de rapidité
-            logger.info(f"Groq configuré avec succès (modèle: {self.model_name})")
+            logger.info("Groq configuré avec succès (modèle: %s)", self.model_name)
 
         except Exception as e:
-            logger.error(f"Erreur configuration Groq: {e}")
+            logger.error("Erreur configuration Groq: %s", e)
             self.client = None
 
+    def circuit_state(self) -> str:
+        """État du disjoncteur : 'closed', 'open' ou 'half_open'"""
+        with self._circuit_lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.circuit_cooldown:
+                return 'half_open'
+            return 'open'
+
+    def _record_success(self):
+        with self._circuit_lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def _record_failure(self):
+        with self._circuit_lock:
+            self._failures += 1
+            if self._failures >= self.circuit_threshold:
+                if self._opened_at is None:
+                    logger.warning("Disjoncteur Groq ouvert après %d échecs", self._failures)
+                self._opened_at = time.monotonic()
+
     def generate_response(self, message: str, context: dict = None) -> str:
+        response_text, _ = self.generate_response_with_usage(message, context)
+        return response_text
+
+    def generate_response_with_usage(self, message: str, context: dict = None) -> tuple:
+        """
+        Génère une réponse et retourne aussi la consommation de l'appel :
+        (texte, {'prompt_tokens', 'completion_tokens', 'latency_ms'}).
+        Les compteurs valent None quand aucun appel Groq n'a abouti.
+        """
+        usage = {'prompt_tokens': None, 'completion_tokens': None, 'latency_ms': None}
         try:
             if not self.client or not self.model_name:
-                return self._demo_response(message)
+                return self._demo_response(message), usage
+
+            if self.circuit_state() == 'open':
+                metrics.LLM_REQUESTS.inc(model=self.model_name, outcome='circuit_open')
+                return FALLBACK_RESPONSE, usage
 
             system_prompt = self._create_system_prompt(context)
 
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
+            response, elapsed = self._complete(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": message}
                 ],
                 temperature=0.7,
                 max_tokens=500
             )
+            usage['latency_ms'] = int(elapsed * 1000)
+
+            if response.usage is not None:
+                usage['prompt_tokens'] = response.usage.prompt_tokens
+                usage['completion_tokens'] = response.usage.completion_tokens
 
-            return response.choices[0].message.content
+            return response.choices[0].message.content, usage
 
         except Exception as e:
-            logger.error(f"Erreur Groq: {e}")
-            return "Désolé, je n'ai pas pu traiter votre demande. Pouvez-vous reformuler ?"
+            logger.error("Erreur Groq: %s", e)
+            return FALLBACK_RESPONSE, usage
+
+    def _complete(self, messages, **options):
+        """Appel Groq instrumenté (métriques, disjoncteur, span) : (réponse, durée en secondes)"""
+        with tracing.span('groq.chat.completions', tracing.KIND_CLIENT, **{
+            'gen_ai.system': 'groq',
+            'gen_ai.request.model': self.model_name,
+            'gen_ai.request.max_tokens': options.get('max_tokens'),
+        }) as span:
+            # Request id (et contexte de trace) transmis à Groq
+            headers = tracing.outgoing_headers()
+            if headers:
+                options['extra_headers'] = headers
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    **options
+                )
+            except Exception as e:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - started, model=self.model_name)
+                metrics.LLM_REQUESTS.inc(model=self.model_name, outcome='error')
+                metrics.LLM_ERRORS.inc(model=self.model_name, error=type(e).__name__)
+                self._record_failure()
+                raise
+            elapsed = time.perf_counter() - started
+            self._record_success()
+            metrics.LLM_LATENCY.observe(elapsed, model=self.model_name)
+            metrics.LLM_REQUESTS.inc(model=self.model_name, outcome='success')
+            if response.usage is not None:
+                span.set_attribute('gen_ai.usage.input_tokens', response.usage.prompt_tokens)
+                span.set_attribute('gen_ai.usage.output_tokens', response.usage.completion_tokens)
+        return response, elapsed
+
+    def summarize(self, previous_summary: str, messages: list) -> dict:
+        """
+        Titre et résumé d'une conversation : {'title', 'summary'}.
+        `messages` : messages ajoutés depuis `previous_summary` (mise à jour incrémentale).
+        Lève une exception si Groq n'est pas disponible (la tâche sera relancée).
+        """
+        if not self.client or not self.model_name:
+            raise RuntimeError("Groq non configuré")
+        if self.circuit_state() == 'open':
+            raise RuntimeError("disjoncteur Groq ouvert")
+
+        transcript = "\n".join(
+            f"{'Élève' if message.is_user else 'Assistant'}: {message.content[:500]}" for message in messages
+        )
+        prompt = (
+            f"Résumé actuel: {previous_summary or '(aucun)'}\n\n"
+            f"Nouveaux messages:\n{transcript}\n\n"
+            "Réponds exactement sur deux lignes :\n"
+            "Titre: <titre de la conversation, 8 mots maximum>\n"
+            "Résumé: <résumé mis à jour, 2 phrases maximum>"
+        )
+        response, _ = self._complete(
+            [
+                {"role": "system", "content": "Tu résumes des conversations entre un élève et un assistant éducatif."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=150
+        )
+
+        result = {'title': '', 'summary': ''}
+        for line in (response.choices[0].message.content or '').splitlines():
+            label, _, value = line.partition(':')
+            label = label.strip().lower()
+            if label == 'titre':
+                result['title'] = value.strip()
+            elif label in ('résumé', 'resume'):
+                result['summary'] = value.strip()
+        if not result['summary']:
+            raise ValueError("réponse de résumé illisible")
+        return result
 
     # ------------------------------------------------------------
     # Méthodes _create_system_prompt et _demo_response 
@@ -0,0 +1,72 @@
+"""
+Hachage des mots de passe en parallèle (inscription groupée, api.provisioning).
+
+Le pool de processus est créé au premier lot et gardé ensuite. Ses processus
+sont démarrés par « spawn » et non par fork : un fork du worker web copierait
+ses connexions ouvertes, ses verrous et ses threads (logs, traces). Ils
+importent ce module avant que Django soit configuré (DJANGO_SETTINGS_MODULE,
+sans les réglages modifiés en cours d'exécution) : il ne doit dépendre
+d'aucun modèle.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+logger = logging.getLogger(__name__)
+
+# En dessous, l'envoi au pool coûte plus que le hachage
+MIN_PARALLEL_PASSWORDS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_hasher():
+    # Processus démarrés par « spawn » : Django n'y est pas encore configuré
+    if not settings.configured:
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monprojet.settings')
+        django.setup()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_hasher,
+            )
+        return _pool
+
+
+def _forget_pool():
+    # Après un fork (gunicorn --preload), les processus du pool appartiennent au parent
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def hash_passwords(passwords):
+    """Hachés avec le hacheur par défaut, en parallèle au-delà de quelques mots de passe"""
+    workers = settings.BULK_REGISTER_HASH_WORKERS or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < MIN_PARALLEL_PASSWORDS:
+        return [make_password(password) for password in passwords]
+    pool = _get_pool(workers)
+    try:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    except BrokenProcessPool as e:
+        # Processus du pool tué (mémoire...) : pool recréé au prochain lot
+        logger.warning("Pool de hachage indisponible, hachage séquentiel: %s", e)
+        with _pool_lock:
+            if _pool is pool:
+                _forget_pool()
+        pool.shutdown(wait=False)
+        return [make_password(password) for password in passwords]
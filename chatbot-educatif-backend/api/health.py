@@ -0,0 +1,108 @@
+"""
+Sondes de santé : vivacité (le processus répond) et disponibilité (le worker
+peut servir : base de données, cache, client Groq).
+
+Le résultat de la disponibilité est mis en cache dans le processus pendant
+HEALTH_CACHE_SECONDS pour que les sondes du load balancer n'ajoutent pas de charge.
+
+Seules la base principale et le cache rendent le worker indisponible (503).
+Un réplica en panne ou le disjoncteur Groq ouvert laissent le worker servir
+(lectures sur le primaire, réponse de repli) : l'état est « degraded ».
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+
+from . import replicas
+from .gemini_service import get_gemini_service
+
+logger = logging.getLogger(__name__)
+
+_cached = None
+_cached_until = 0.0
+_lock = threading.Lock()
+
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {'vendor': connection.vendor}
+
+
+def check_replicas():
+    """Réplicas en lecture (DATABASE_REPLICA_URLS) : un réplica en panne est écarté des lectures de tous les workers"""
+    aliases = replicas.replica_aliases()
+    for alias in aliases:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except Exception as e:
+            replicas.mark_unavailable(alias, e)
+        else:
+            replicas.set_available(alias, True)
+    unavailable = replicas.unavailable_replicas(aliases)
+    return {'status': 'degraded' if unavailable else 'ok', 'count': len(aliases), 'unavailable': unavailable}
+
+
+def check_cache():
+    key = f'health:{os.getpid()}'
+    cache.set(key, 1, 10)
+    if cache.get(key) != 1:
+        raise RuntimeError('lecture du cache impossible')
+    return {}
+
+
+def check_llm():
+    service = get_gemini_service()
+    state = service.circuit_state()
+    # Disjoncteur ouvert ou sans clé API (mode démo) : le worker répond quand même
+    return {
+        'status': 'degraded' if state == 'open' else 'ok',
+        'configured': service.client is not None,
+        'circuit': state,
+    }
+
+
+CHECKS = {
+    'database': check_database,
+    'replicas': check_replicas,
+    'cache': check_cache,
+    'llm': check_llm,
+}
+
+
+def _run_checks():
+    results = {}
+    for name, check in CHECKS.items():
+        started = time.perf_counter()
+        try:
+            details = check()
+            result = {'status': 'ok', **details}
+        except Exception as e:
+            logger.warning("Sonde de disponibilité '%s' en échec: %s", name, e)
+            result = {'status': 'error', 'error': str(e)}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        results[name] = result
+    statuses = {r['status'] for r in results.values()}
+    return {
+        'status': 'error' if 'error' in statuses else 'degraded' if 'degraded' in statuses else 'ok',
+        'checks': results,
+    }
+
+
+def readiness():
+    """Résultat des vérifications de disponibilité (mis en cache quelques secondes)"""
+    global _cached, _cached_until
+    with _lock:
+        now = time.monotonic()
+        if _cached is None or now >= _cached_until:
+            _cached = _run_checks()
+            _cached_until = now + settings.HEALTH_CACHE_SECONDS
+        return _cached
@@ -0,0 +1,505 @@
+"""
+Tests de charge de bout en bout (manage.py seed_loadtest, manage.py loadtest).
+
+`seed` crée des élèves, conversations et messages réalistes (préfixe
+`bench_`, supprimés par `clear`). `run` simule des élèves connectés en
+parallèle qui enchaînent un scénario (inscription/connexion, chat,
+historique, lecture d'une conversation), soit dans le processus (client
+de test Django, appels Groq dirigés vers api.fake_groq), soit contre un
+serveur lancé à part (`url`). `report` produit un rapport JSON stable
+(p50/p95/p99, débit, requêtes SQL par endpoint) à comparer entre commits
+avec `compare`.
+"""
+import http.client
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.urls import resolve, reverse
+
+from . import gemini_service, metrics, summaries
+from .fake_groq import FakeGroqServer
+from .models import Conversation, Message, UserProfile
+
+PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+REPORT_VERSION = 1
+
+CLASS_LEVELS = ['cp1', 'cp2', 'ce1', 'ce2', 'cm1', 'cm2', '6e', '5e', '4e', '3e', 'seconde', 'premiere', 'terminale']
+SUBJECTS = ['francais', 'mathematiques', 'sciences', 'histoire', 'geographie', 'emc']
+QUESTIONS = [
+    "Comment fait-on une addition avec retenue ?",
+    "Pourquoi le ciel est-il bleu ?",
+    "Qui était Thomas Sankara ?",
+    "Peux-tu m'expliquer les fractions avec des mangues ?",
+    "Quelle est la différence entre un nom et un verbe ?",
+    "Comment calcule-t-on l'aire d'un rectangle ?",
+    "Pourquoi le fleuve Mouhoun est-il important pour le Burkina Faso ?",
+    "C'est quoi la photosynthèse ?",
+    "Comment accorder le participe passé avec avoir ?",
+    "Quels sont mes droits et mes devoirs à l'école ?",
+]
+ANSWER_SENTENCES = [
+    "Bonne question, regardons cela ensemble.",
+    "Imagine que tu as trois mangues et que ton ami t'en donne deux.",
+    "On commence toujours par les unités, puis on passe aux dizaines.",
+    "Au marché de Ouagadougou, on utilise ce calcul tous les jours.",
+    "Retiens surtout la règle : elle revient souvent dans les exercices.",
+    "Essaie maintenant avec un autre exemple pour vérifier que tu as compris.",
+    "Si tu bloques, relis la première étape et refais-la lentement.",
+    "C'est exactement ce que ton maître attend dans un devoir.",
+]
+
+
+# ---------------------------------------------------------------
+# Données
+# ---------------------------------------------------------------
+def _answer(rng):
+    return ' '.join(rng.choice(ANSWER_SENTENCES) for _ in range(rng.randint(2, 8)))
+
+
+def seed(users=100, conversations=5, messages=10, rng_seed=0, batch_size=500):
+    """
+    Crée `users` élèves (mot de passe PASSWORD) ayant chacun en moyenne
+    `conversations` conversations de `messages` messages ; retourne les nombres créés.
+    """
+    rng = random.Random(rng_seed)
+    password = make_password(PASSWORD)  # un seul hachage : il domine sinon le temps de création
+    start = User.objects.filter(username__startswith=f'{PREFIX}user').count()
+    counts = {'users': 0, 'conversations': 0, 'messages': 0}
+
+    for offset in range(0, users, batch_size):
+        chunk = [
+            User(username=f'{PREFIX}user{start + n}', email=f'{PREFIX}user{start + n}@exemple.bf', password=password)
+            for n in range(offset, min(offset + batch_size, users))
+        ]
+        User.objects.bulk_create(chunk)
+        # MySQL ne renvoie pas les ids des lignes insérées par lot
+        user_ids = list(User.objects.filter(username__in=[u.username for u in chunk]).values_list('id', flat=True))
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=user_id, class_level=rng.choice(CLASS_LEVELS)) for user_id in user_ids
+        ])
+
+        plans = []
+        for user_id in user_ids:
+            for _ in range(max(0, round(rng.gauss(conversations, conversations / 3)))):
+                questions = [rng.choice(QUESTIONS) for _ in range(max(1, round(rng.gauss(messages, messages / 3)) // 2))]
+                plans.append((user_id, rng.choice(SUBJECTS), questions))
+        Conversation.objects.bulk_create([
+            Conversation(
+                user_id=user_id,
+                title=summaries.heuristic_title(questions[0]),
+                summary=summaries.shorten(questions[-1], summaries.SUMMARY_MAX_CHARS),
+                message_count=len(questions) * 2,
+            )
+            for user_id, _, questions in plans
+        ], batch_size=batch_size)
+        conversation_ids = list(
+            Conversation.objects.filter(user_id__in=user_ids).order_by('id').values_list('id', flat=True)
+        )
+
+        rows = []
+        for conversation_id, (user_id, subject, questions) in zip(conversation_ids, plans):
+            for question in questions:
+                rows.append(Message(conversation_id=conversation_id, content=question, is_user=True, subject=subject))
+                rows.append(Message(
+                    conversation_id=conversation_id, content=_answer(rng), is_user=False, subject=subject,
+                    prompt_tokens=rng.randint(150, 400), completion_tokens=rng.randint(60, 500),
+                    llm_latency_ms=rng.randint(300, 2500),
+                ))
+        Message.objects.bulk_create(rows, batch_size=batch_size * 2)
+
+        counts['users'] += len(user_ids)
+        counts['conversations'] += len(conversation_ids)
+        counts['messages'] += len(rows)
+    return counts
+
+
+def clear():
+    """Supprime les comptes créés par `seed` et par les tests de charge (et leurs données)"""
+    return User.objects.filter(username__startswith=PREFIX).delete()[0]
+
+
+# ---------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessClient:
+    """Client de test Django : mesure l'application et la base, sans réseau ni serveur HTTP"""
+
+    def __init__(self):
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h and h != '*'), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+
+    def request(self, method, path, body=None, token=None):
+        """(statut, JSON de la réponse, nombre de requêtes SQL)"""
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.client.generic(
+                method, path, json.dumps(body) if body is not None else '',
+                content_type='application/json', secure=True, **headers,
+            )
+        try:
+            data = json.loads(response.content) if response.content else None
+        except ValueError:
+            data = None
+        return response.status_code, data, counter.count
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpClient:
+    """Client HTTP (connexion persistante par élève simulé) vers un serveur lancé à part"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.prefix = parts.path.rstrip('/')
+        factory = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = factory(parts.netloc, timeout=60)
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        payload = json.dumps(body).encode() if body is not None else None
+        try:
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0, None, None
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        return response.status, data, None
+
+    def close(self):
+        self.connection.close()
+
+
+@contextmanager
+def fake_llm(latency=0.5, error_rate=0.0):
+    """Dirige les appels Groq de ce processus vers un FakeGroqServer pendant le bloc"""
+    server = FakeGroqServer(latency=latency, jitter=latency / 10, error_rate=error_rate).start()
+    previous = gemini_service._gemini_service
+    gemini_service._gemini_service = gemini_service.GeminiService(api_key='loadtest', base_url=server.url)
+    try:
+        yield server
+    finally:
+        gemini_service._gemini_service = previous
+        server.stop()
+
+
+# ---------------------------------------------------------------
+# Scénarios
+# ---------------------------------------------------------------
+class VirtualUser:
+    """Élève simulé : connecté avec un compte `seed`, enchaîne les étapes d'un scénario"""
+
+    def __init__(self, client, index, rng, record):
+        self.client = client
+        self.index = index
+        self.rng = rng
+        self.record = record
+        self.token = None
+        self.conversation_ids = []
+        self.current_conversation = None
+        self.exchanges = 0
+        self.registered = 0
+
+    def call(self, name, method, path, body=None, token=None, expected=(200,)):
+        started = time.perf_counter()
+        status, data, queries = self.client.request(method, path, body, token)
+        self.record(name, time.perf_counter() - started, status in expected, queries)
+        return status, data
+
+    def login(self, username, record=True):
+        """Jeton d'accès de `username` (None si la connexion échoue)"""
+        body = {'username': username, 'password': PASSWORD}
+        if record:
+            status, data = self.call('login', 'POST', reverse('login'), body)
+        else:
+            status, data, _ = self.client.request('POST', reverse('login'), body)
+        return data['tokens']['access'] if status == 200 else None
+
+    def start(self, seeded_users):
+        """Connexion initiale (non mesurée) et ids des conversations de l'élève"""
+        if not seeded_users:
+            return
+        self.token = self.login(seeded_users[self.index % len(seeded_users)], record=False)
+        if self.token is None:
+            raise RuntimeError("Connexion impossible : lancer d'abord manage.py seed_loadtest")
+        status, data, _ = self.client.request('GET', reverse('get_user_conversations') + '?compact=1', token=self.token)
+        if status == 200:
+            self.conversation_ids = [c['id'] for c in data]
+
+    def auth(self):
+        # Nouvel élève : inscription puis connexion (l'élève simulé garde son propre compte)
+        self.registered += 1
+        # Unique d'une exécution à l'autre : les comptes des tests précédents restent en base
+        username = f'{PREFIX}lt{self.index}_{self.registered}_{uuid.uuid4().hex[:12]}'
+        body = {'username': username, 'password': PASSWORD, 'email': f'{username}@exemple.bf'}
+        status, _ = self.call('register', 'POST', reverse('register'), body, expected=(201,))
+        if status == 201:
+            self.login(username)
+
+    def chat(self):
+        # Une conversation dure quelques échanges, puis l'élève en commence une autre
+        if self.current_conversation is None or self.exchanges >= self.rng.randint(2, 6):
+            self.current_conversation, self.exchanges = None, 0
+        body = {'message': self.rng.choice(QUESTIONS), 'subject': self.rng.choice(SUBJECTS)}
+        if self.current_conversation:
+            body['conversation_id'] = self.current_conversation
+        status, data = self.call('chat', 'POST', reverse('chat'), body, self.token)
+        if status == 200:
+            self.current_conversation = data['conversation_id']
+            self.exchanges += 1
+            if self.current_conversation not in self.conversation_ids:
+                self.conversation_ids.append(self.current_conversation)
+
+    def history(self):
+        self.call('get_user_conversations', 'GET', reverse('get_user_conversations'), token=self.token)
+
+    def conversation(self):
+        if not self.conversation_ids:
+            return self.history()
+        conversation_id = self.rng.choice(self.conversation_ids)
+        self.call('get_conversation', 'GET', reverse('get_conversation', args=[conversation_id]), token=self.token)
+
+
+# nom -> [(étape, poids)]
+SCENARIOS = {
+    'auth': [('auth', 1)],
+    'chat': [('chat', 1)],
+    'history': [('history', 1)],
+    'conversation': [('conversation', 1)],
+    # Répartition observée : surtout des lectures, un message sur quatre
+    'mixed': [('history', 3), ('conversation', 4), ('chat', 2), ('auth', 1)],
+}
+
+
+# ---------------------------------------------------------------
+# Exécution et rapport
+# ---------------------------------------------------------------
+def percentile(values, pct):
+    """Centile par rang le plus proche (valeurs triées)"""
+    if not values:
+        return None
+    rank = max(1, min(len(values), math.ceil(pct / 100 * len(values))))
+    return values[rank - 1]
+
+
+def run(scenario='mixed', concurrency=10, duration=30.0, requests_per_user=None, url=None, rng_seed=0):
+    """
+    Exécute un scénario ; retourne les échantillons
+    [(endpoint, durée en s, succès, requêtes SQL ou None)] et la durée réelle.
+    """
+    steps = SCENARIOS[scenario]
+    names, weights = [name for name, _ in steps], [weight for _, weight in steps]
+    seeded_users = list(
+        User.objects.filter(username__startswith=f'{PREFIX}user').order_by('id').values_list('username', flat=True)[:concurrency]
+    )
+    if scenario != 'auth' and not seeded_users:
+        raise RuntimeError("Aucun compte de test : lancer d'abord manage.py seed_loadtest")
+
+    samples = []
+    lock = threading.Lock()
+    errors = []
+    ready = threading.Barrier(concurrency + 1)
+    deadline = [None]
+
+    def record(name, elapsed, ok, queries):
+        with lock:
+            samples.append((name, elapsed, ok, queries))
+
+    def worker(index):
+        client = HttpClient(url) if url else InProcessClient()
+        user = VirtualUser(client, index, random.Random(f'{rng_seed}:{index}'), record)
+        try:
+            try:
+                user.start(seeded_users)
+            finally:
+                ready.wait()
+            done = 0
+            while time.monotonic() < deadline[0] and (requests_per_user is None or done < requests_per_user):
+                getattr(user, user.rng.choices(names, weights)[0])()
+                done += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,), name=f'loadtest-{index}') for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Connexions initiales terminées : le chronomètre démarre pour tous en même temps
+    deadline[0] = time.monotonic() + (duration if requests_per_user is None else float('inf'))
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors and not samples:
+        raise errors[0]
+    return samples, elapsed
+
+
+def route_label(name):
+    """Étiquette `route` des métriques (api.middleware.route_name) d'un endpoint"""
+    path = reverse(name, args=[1]) if name == 'get_conversation' else reverse(name)
+    return '/' + resolve(path).route
+
+
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def read_counters(name, url=None):
+    """
+    {((étiquette, valeur), ...): valeur} d'une série des métriques, lue dans
+    ce processus ou sur /api/metrics/ d'un serveur (avec plusieurs workers,
+    METRICS_DIR doit être configuré).
+    """
+    if url is None:
+        text = metrics.render_latest()
+    else:
+        client = HttpClient(url)
+        headers = {'X-Metrics-Token': settings.METRICS_TOKEN} if settings.METRICS_TOKEN else {}
+        try:
+            client.connection.request('GET', client.prefix + reverse('metrics'), headers=headers)
+            response = client.connection.getresponse()
+            text = response.read().decode() if response.status == 200 else ''
+        except (OSError, http.client.HTTPException):
+            text = ''
+        finally:
+            client.close()
+
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith(name + '{') and not line.startswith(name + ' '):
+            continue
+        series, _, value = line.rpartition(' ')
+        values[tuple(_LABEL.findall(series[len(name):]))] = float(value)
+    return values
+
+
+def scrape_query_counts(url):
+    """{route: (somme, nombre)} de db_queries_per_request sur un serveur"""
+    totals = {}
+    for position, suffix in enumerate(('_sum', '_count')):
+        for labels, value in read_counters(f'db_queries_per_request{suffix}', url).items():
+            totals.setdefault(dict(labels).get('route'), [0.0, 0.0])[position] = value
+    return totals
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, timeout=5).stdout.strip())
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    return commit or None, dirty
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def _summary(durations, failures, elapsed, queries):
+    durations = sorted(durations)
+    return {
+        'requests': len(durations),
+        'errors': failures,
+        'error_rate': _round(failures / len(durations), 4) if durations else None,
+        'throughput_rps': _round(len(durations) / elapsed) if elapsed else None,
+        'mean_ms': _round(sum(durations) / len(durations) * 1000) if durations else None,
+        'p50_ms': _round(percentile(durations, 50) * 1000) if durations else None,
+        'p95_ms': _round(percentile(durations, 95) * 1000) if durations else None,
+        'p99_ms': _round(percentile(durations, 99) * 1000) if durations else None,
+        'max_ms': _round(durations[-1] * 1000) if durations else None,
+        'queries_per_request': _round(sum(queries) / len(queries)) if queries else None,
+    }
+
+
+def report(samples, elapsed, options, server_queries=None):
+    """
+    Rapport JSON : mêmes clés et mêmes unités d'un commit à l'autre.
+    `server_queries` : {endpoint: requêtes par requête} relevées sur le serveur (mode HTTP).
+    """
+    commit, dirty = _git_commit()
+    endpoints = {}
+    for name in sorted({sample[0] for sample in samples}):
+        rows = [sample for sample in samples if sample[0] == name]
+        endpoints[name] = _summary(
+            [row[1] for row in rows], sum(1 for row in rows if not row[2]), elapsed,
+            [row[3] for row in rows if row[3] is not None],
+        )
+        if server_queries and name in server_queries:
+            endpoints[name]['queries_per_request'] = _round(server_queries[name])
+
+    total = _summary(
+        [sample[1] for sample in samples], sum(1 for sample in samples if not sample[2]), elapsed,
+        [sample[3] for sample in samples if sample[3] is not None],
+    )
+    if server_queries:
+        measured = [(row['requests'], row['queries_per_request']) for row in endpoints.values() if row['queries_per_request'] is not None]
+        total['queries_per_request'] = _round(sum(n * q for n, q in measured) / sum(n for n, _ in measured))
+
+    return {
+        'version': REPORT_VERSION,
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'date': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'target': options.get('url') or 'in-process',
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            **{key: value for key, value in options.items() if key != 'url'},
+        },
+        'elapsed_s': _round(elapsed),
+        'total': total,
+        'endpoints': endpoints,
+    }
+
+
+COMPARED_FIELDS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request', 'error_rate')
+
+
+def compare(baseline, current):
+    """[(endpoint, champ, avant, après, variation en %)] entre deux rapports"""
+    rows = []
+    for name in sorted(set(baseline['endpoints']) | set(current['endpoints'])):
+        before, after = baseline['endpoints'].get(name, {}), current['endpoints'].get(name, {})
+        for field in COMPARED_FIELDS:
+            old, new = before.get(field), after.get(field)
+            change = _round((new - old) / old * 100, 1) if old and new is not None else None
+            rows.append((name, field, old, new, change))
+    return rows
@@ -0,0 +1,146 @@
+"""
+Journalisation structurée et non bloquante.
+
+Les vues appellent le logger comme d'habitude ; le handler se contente de
+déposer l'enregistrement dans une file, et un thread d'arrière-plan le
+formate en JSON et l'écrit. Chaque enregistrement porte le request id,
+l'utilisateur et la route de la requête en cours.
+
+Ce module est chargé par LOGGING (settings) : il ne doit importer aucun modèle.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import metrics
+
+current_request = contextvars.ContextVar('current_request', default=None)
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributs standard d'un LogRecord (le reste vient de `extra=`)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_CONTEXT_ATTRS = {'request_id', 'user_id', 'route'}
+
+
+def truncate(text, limit=None):
+    """Tronque un contenu utilisateur avant de le journaliser"""
+    if limit is None:
+        limit = settings.LOG_CONTENT_MAX_CHARS
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} car.)"
+
+
+def sample_content():
+    """Vrai pour la fraction LOG_CONTENT_SAMPLE_RATE des requêtes dont on journalise le contenu"""
+    rate = settings.LOG_CONTENT_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _current_user_id(request):
+    user = getattr(request, 'user', None)
+    # Ne pas déclencher l'évaluation paresseuse de request.user (requête en base) :
+    # DRF remplace l'objet par l'utilisateur JWT une fois authentifié
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return user.id if user.is_authenticated else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute request_id, user_id et route de la requête en cours"""
+
+    def filter(self, record):
+        request = current_request.get()
+        record.request_id = request_id.get()
+        record.user_id = _current_user_id(request) if request is not None else None
+        match = getattr(request, 'resolver_match', None)
+        record.route = f'/{match.route}' if match is not None else None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for attr in _CONTEXT_ATTRS:
+            value = getattr(record, attr, None)
+            if value is not None:
+                data[attr] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in _CONTEXT_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BackgroundStreamHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler dont le formatage et l'écriture se font dans un thread
+    d'arrière-plan. Si la file est pleine, l'enregistrement est abandonné
+    (compté dans log_dropped_total) plutôt que de bloquer la requête.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        self.queue_size = queue_size
+        self.target = logging.StreamHandler(stream)
+        super().__init__(queue.Queue(queue_size))
+        self._start_listener()
+        atexit.register(self._stop_listener)
+        # Après un fork (gunicorn --preload), le thread d'écriture n'existe plus
+        os.register_at_fork(after_in_child=self._restart_listener)
+
+    def _start_listener(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop_listener(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def _restart_listener(self):
+        self.queue = queue.Queue(self.queue_size)
+        self._start_listener()
+
+    def setFormatter(self, fmt):
+        # Le formatage a lieu dans le thread d'écriture
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Figer le message (les arguments peuvent changer après l'appel) ;
+        # le formatage JSON est laissé au thread d'écriture
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_DROPPED.inc()
+
+    def emit(self, record):
+        started = time.perf_counter()
+        super().emit(record)
+        metrics.LOG_EMIT_SECONDS.inc(time.perf_counter() - started)
+        metrics.LOG_RECORDS.inc(level=record.levelname)
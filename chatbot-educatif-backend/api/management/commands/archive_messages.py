@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from api.archive import archive_conversation, idle_conversations
+from api.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = "Archive (blocs compressés) les messages des conversations inactives depuis N jours"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Inactivité minimale (jours)")
+        parser.add_argument('--block-size', type=int, default=200, help="Messages par bloc compressé")
+        parser.add_argument('--limit', type=int, default=None, help="Nombre maximum de conversations à archiver")
+        parser.add_argument('--dry-run', action='store_true', help="Afficher ce qui serait archivé sans rien modifier")
+
+    def handle(self, *args, **options):
+        conversations = idle_conversations(options['days'])
+        if options['limit']:
+            conversations = conversations[:options['limit']]
+
+        if options['dry_run']:
+            stats = (
+                Message.objects.filter(conversation__in=conversations.values('id'))
+                .aggregate(conversations=Count('conversation', distinct=True), messages=Count('id'))
+            )
+            self.stdout.write(
+                f"{stats['conversations']} conversations, {stats['messages']} messages seraient archivés"
+            )
+            return
+
+        rows_before = Message.objects.count()
+        size_before = self._table_size(Message._meta.db_table)
+        latency_before = self._hot_query_latency()
+
+        archived_conversations = archived_messages = raw_total = compressed_total = 0
+        for conversation in conversations.iterator():
+            count, raw_size, compressed_size = archive_conversation(conversation, options['block_size'])
+            if count:
+                archived_conversations += 1
+                archived_messages += count
+                raw_total += raw_size
+                compressed_total += compressed_size
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{archived_messages} messages archivés ({archived_conversations} conversations)"
+        ))
+        if raw_total:
+            self.stdout.write(
+                f"  JSON brut: {raw_total / 1e6:.2f} Mo -> compressé: {compressed_total / 1e6:.2f} Mo "
+                f"({1 - compressed_total / raw_total:.0%} d'économie)"
+            )
+        self.stdout.write(f"  Table Message: {rows_before} -> {Message.objects.count()} lignes")
+
+        size_after = self._table_size(Message._meta.db_table)
+        if size_before is not None and size_after is not None:
+            self.stdout.write(
+                f"  Taille de la table Message (données + index): {size_before / 1e6:.2f} Mo -> {size_after / 1e6:.2f} Mo"
+                " (l'espace est rendu après VACUUM / OPTIMIZE TABLE)"
+            )
+        latency_after = self._hot_query_latency()
+        if latency_before is not None:
+            self.stdout.write(
+                f"  Lecture d'une conversation récente: {latency_before:.2f} ms -> {latency_after:.2f} ms"
+            )
+
+    def _hot_query_latency(self, repeat=20):
+        """Temps moyen (ms) de lecture des messages de la conversation la plus récente"""
+        conversation = Conversation.objects.order_by('-updated_at').first()
+        if conversation is None:
+            return None
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(Message.objects.filter(conversation=conversation).order_by('timestamp'))
+        return (time.perf_counter() - started) * 1000 / repeat
+
+    def _table_size(self, table):
+        """Taille de la table et de ses index (octets) si le moteur sait la donner"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT data_length + index_length FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+        return row[0] if row else None
@@ -0,0 +1,58 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from monprojet.backends.pool import discard_pool
+
+POOLED_ENGINES = {
+    'postgresql': 'monprojet.backends.postgresql',
+    'mysql': 'monprojet.backends.mysql',
+}
+
+
+class Command(BaseCommand):
+    help = "Mesure le coût de connexion par requête, avec et sans le pool de connexions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        vendor = connections[options['database']].vendor
+        if vendor not in POOLED_ENGINES:
+            raise CommandError(f"Pas de pool pour la base '{vendor}' (PostgreSQL ou MySQL uniquement)")
+
+        iterations = options['iterations']
+        plain_engine = f'django.db.backends.{vendor}'
+        results = {}
+        for name, engine in (('sans pool', plain_engine), ('avec pool', POOLED_ENGINES[vendor])):
+            database = copy.deepcopy(settings_dict)
+            database.update(ENGINE=engine, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+            database.setdefault('POOL', {'MAX_SIZE': 1})
+            wrapper = load_backend(engine).DatabaseWrapper(database, alias='bench_db_connect')
+            try:
+                results[name] = self._measure(wrapper, iterations)
+            finally:
+                wrapper.close()
+                discard_pool('bench_db_connect')
+
+        self.stdout.write(f"{iterations} requêtes (connexion, SELECT 1, fermeture) sur {vendor}")
+        for name, per_request in results.items():
+            self.stdout.write(f"  {name}: {per_request:.3f} ms par requête")
+        self.stdout.write(self.style.SUCCESS(
+            f"Surcoût de connexion évité: {results['sans pool'] - results['avec pool']:.3f} ms par requête"
+        ))
+
+    def _measure(self, wrapper, iterations):
+        # Même cycle qu'une requête HTTP avec CONN_MAX_AGE = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            wrapper.close()
+        return (time.perf_counter() - started) * 1000 / iterations
@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import export
+from api.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = "Mesure la mémoire et le débit de l'export NDJSON (GET /api/export/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Utilisateur à exporter")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Crée un utilisateur temporaire avec ce nombre de messages (supprimé ensuite)")
+        parser.add_argument('--messages-per-conversation', type=int, default=50)
+        parser.add_argument('--gzip', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            user = self._seed(options['seed'], options['messages_per_conversation'])
+        elif options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable: {options['user']}")
+        else:
+            raise CommandError('Indiquer --user ou --seed')
+
+        try:
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = lines = 0
+            for chunk in export.stream_export(user, compress=options['gzip']):
+                size += len(chunk)
+                if not options['gzip']:
+                    lines += chunk.count(b'\n')
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            if options['seed']:
+                user.delete()
+
+        self.stdout.write(f"Export de {user.username}: {size / 1e6:.1f} Mo en {elapsed:.2f} s")
+        if lines:
+            self.stdout.write(f"  {lines} lignes, {lines / elapsed:.0f} lignes/s")
+        self.stdout.write(f"  Pic mémoire Python: {peak / 1e6:.1f} Mo")
+
+    def _seed(self, count, per_conversation):
+        with transaction.atomic():
+            user = User.objects.create_user(f'bench_export_{int(time.time())}', password=None)
+            for start in range(0, count, per_conversation):
+                conversation = Conversation.objects.create(user=user)
+                Message.objects.bulk_create([
+                    Message(conversation=conversation, content=f"Message {i} : comment calcule-t-on l'aire d'un rectangle ?", is_user=i % 2 == 0)
+                    for i in range(start, min(start + per_conversation, count))
+                ])
+        return user
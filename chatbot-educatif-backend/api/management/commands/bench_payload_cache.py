@@ -0,0 +1,66 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+
+from api import payload_cache
+from api.conditional import make_etag
+from api.models import Conversation
+from api.serializers import ConversationSerializer
+
+
+class Command(BaseCommand):
+    help = "Mesure le temps CPU et la taille d'une lecture de conversation, avec et sans le cache compressé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', type=int, help='Conversation à lire (défaut: la plus longue)')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        conversations = Conversation.objects.select_related('user__profile')
+        if options['conversation']:
+            conversation = conversations.filter(id=options['conversation']).first()
+        else:
+            conversation = conversations.annotate(n=Count('messages')).order_by('-n').first()
+        if conversation is None:
+            raise CommandError('Aucune conversation à mesurer')
+
+        iterations = options['iterations']
+        version = make_etag(conversation.id, conversation.updated_at.isoformat())
+
+        def uncached():
+            # Chemin sans cache : messages relus, sérialisés et rendus en JSON à chaque lecture
+            fresh = Conversation.objects.select_related('user__profile').get(id=conversation.id)
+            return JSONRenderer().render(ConversationSerializer(fresh).data)
+
+        def cached():
+            return payload_cache.body_for(payload_cache.get_payload(conversation, version), 'gzip')
+
+        body = uncached()
+        payload_cache.invalidate(conversation.id)
+        payload = payload_cache.get_payload(conversation, version)
+
+        results = {}
+        for name, read in (('sans cache', uncached), ('cache (gzip)', cached)):
+            started = time.process_time()
+            for _ in range(iterations):
+                read()
+            results[name] = (time.process_time() - started) * 1000 / iterations
+
+        self.stdout.write(f"Conversation {conversation.id} ({conversation.messages.count()} messages), {iterations} lectures")
+        for name, cpu_ms in results.items():
+            self.stdout.write(f"  CPU par lecture, {name}: {cpu_ms:.3f} ms")
+        self.stdout.write(f"  Taille JSON: {len(body)} octets")
+        self.stdout.write(f"  Taille gzip: {len(payload['gzip'])} octets ({len(payload['gzip']) / len(body):.0%})")
+        if 'br' in payload:
+            self.stdout.write(f"  Taille brotli: {len(payload['br'])} octets ({len(payload['br']) / len(body):.0%})")
+        self.stdout.write(f"  Décompression gzip (clients sans gzip): {self._time(lambda: gzip.decompress(payload['gzip']), iterations):.3f} ms")
+        payload_cache.invalidate(conversation.id)
+
+    def _time(self, func, iterations):
+        started = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - started) * 1000 / iterations
@@ -0,0 +1,63 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import loadtest, tracing
+
+MODES = (
+    ('sans traces', {'TRACING_EXPORT': ''}),
+    ('échantillonnage 0', {'TRACING_SAMPLE_RATE': 0.0}),
+    ('échantillonnage 1', {'TRACING_SAMPLE_RATE': 1.0}),
+)
+
+
+class Command(BaseCommand):
+    help = "Mesure le surcoût des traces par requête (route --route, par défaut get_profile)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', default='get_profile', help='Route GET sans argument')
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200, help='Requêtes par mode et par tour')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username__startswith=loadtest.PREFIX).order_by('id').first()
+        if user is None:
+            raise CommandError("Aucun compte de test : lancer d'abord manage.py seed_loadtest")
+        token = str(RefreshToken.for_user(user).access_token)
+        path = reverse(options['route'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            export = os.path.join(directory, 'traces.jsonl')
+            timings = {name: [] for name, _ in MODES}
+            # Modes alternés à chaque tour : la dérive de la machine touche les trois
+            for _ in range(options['rounds']):
+                for name, overrides in MODES:
+                    with override_settings(**{'TRACING_EXPORT': export, **overrides}):
+                        client = loadtest.InProcessClient()
+                        client.request('GET', path, token=token)  # chargement du middleware
+                        started = time.perf_counter()
+                        for _ in range(options['requests']):
+                            status, _, _ = client.request('GET', path, token=token)
+                            if status != 200:
+                                raise CommandError(f"Réponse {status} sur {path}")
+                        timings[name].append((time.perf_counter() - started) * 1000 / options['requests'])
+                        tracing.get_exporter().flush()
+            exported = os.path.getsize(export) if os.path.exists(export) else 0
+
+        # Meilleur tour et médiane : le meilleur tour est le moins perturbé par le reste de la machine
+        baseline = min(timings[MODES[0][0]])
+        self.stdout.write(f"{options['rounds']} x {options['requests']} lectures de {path} par mode (par requête)")
+        for name, _ in MODES:
+            best = min(timings[name])
+            self.stdout.write(
+                f"  {name:<18} meilleur tour {best:7.3f} ms ({(best - baseline) / baseline:+.2%}), "
+                f"médiane {statistics.median(timings[name]):7.3f} ms"
+            )
+        self.stdout.write(f"Traces exportées: {exported / 1024:.0f} Kio")
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import replicas, traces
+
+
+class Command(BaseCommand):
+    help = "Exporte une trace de trafic anonymisée (JSON Lines, .gz pour compresser) à partir des conversations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Fichier de sortie (ex. trace.jsonl.gz)')
+        parser.add_argument('--days', type=int, default=7, help='Messages des N derniers jours (0 : tout)')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        # Lecture seule : sur les réplicas s'il y en a
+        with replicas.use_replicas():
+            header, events = traces.export_trace(since=since)
+        traces.write_trace(options['output'], header, events)
+        self.stdout.write(self.style.SUCCESS(
+            f"{header['events']} messages de {header['users']} élèves ({header['conversations']} conversations, "
+            f"{header['span_seconds'] / 3600:.1f} h) écrits dans {options['output']}"
+        ))
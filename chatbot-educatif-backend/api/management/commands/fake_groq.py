@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.fake_groq import FakeGroqServer
+
+
+class Command(BaseCommand):
+    help = "Lance un faux serveur Groq local (à indiquer au serveur testé avec GROQ_BASE_URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency-ms', type=float, default=500, help="Latence moyenne d'une réponse")
+        parser.add_argument('--jitter-ms', type=float, default=100, help='Écart type de la latence')
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Part des appels en erreur (429/500), entre 0 et 1")
+        parser.add_argument('--chunk-ms', type=float, default=10, help='Intervalle entre deux fragments en mode flux')
+
+    def handle(self, *args, **options):
+        server = FakeGroqServer(
+            options['host'], options['port'],
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            chunk_interval=options['chunk_ms'] / 1000,
+        ).start()
+        self.stdout.write(self.style.SUCCESS(f"Faux Groq sur {server.url} (GROQ_BASE_URL={server.url}) — Ctrl+C pour arrêter"))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f"{server.requests} appels reçus")
@@ -0,0 +1,102 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import loadtest
+
+
+class Command(BaseCommand):
+    help = "Test de charge : p50/p95/p99, débit et requêtes SQL par endpoint, rapport JSON comparable entre commits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=sorted(loadtest.SCENARIOS), default='mixed')
+        parser.add_argument('--concurrency', type=int, default=10, help='Élèves simulés en parallèle')
+        parser.add_argument('--duration', type=float, default=30, help='Durée du test (secondes)')
+        parser.add_argument('--requests', type=int, default=None,
+                            help='Requêtes par élève simulé (remplace --duration : charge identique entre deux exécutions)')
+        parser.add_argument('--url', default=None,
+                            help="Serveur à tester (ex. http://127.0.0.1:8000) ; par défaut l'application dans ce processus")
+        parser.add_argument('--llm-latency-ms', type=float, default=500, help='Latence du faux Groq (dans le processus)')
+        parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Erreurs injectées par le faux Groq')
+        parser.add_argument('--real-groq', action='store_true', help='Appelle le vrai Groq au lieu du faux serveur')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Fichier du rapport JSON')
+        parser.add_argument('--compare', help='Rapport JSON précédent à comparer')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        url = options['url']
+        settings_used = {
+            'url': url,
+            'scenario': options['scenario'],
+            'concurrency': options['concurrency'],
+            'duration_s': None if options['requests'] else options['duration'],
+            'requests_per_user': options['requests'],
+            'seed': options['seed'],
+        }
+
+        if url or options['real_groq']:
+            llm = nullcontext()
+            settings_used['llm'] = 'real' if options['real_groq'] else 'server'
+        else:
+            llm = loadtest.fake_llm(options['llm_latency_ms'] / 1000, options['llm_error_rate'])
+            settings_used['llm'] = {'latency_ms': options['llm_latency_ms'], 'error_rate': options['llm_error_rate']}
+
+        before = loadtest.scrape_query_counts(url) if url else None
+        try:
+            with llm:
+                samples, elapsed = loadtest.run(
+                    options['scenario'], options['concurrency'], options['duration'], options['requests'], url, options['seed'],
+                )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        server_queries = None
+        if url:
+            # Requêtes SQL relevées par le serveur (métriques), différence avant/après le test
+            after = loadtest.scrape_query_counts(url)
+            server_queries = {}
+            for name in {sample[0] for sample in samples}:
+                label = loadtest.route_label(name)
+                total, count = (a - b for a, b in zip(after.get(label, (0, 0)), before.get(label, (0, 0))))
+                if count:
+                    server_queries[name] = total / count
+
+        result = loadtest.report(samples, elapsed, settings_used, server_queries)
+        self._print(result)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Rapport écrit dans {options['output']}")
+        if baseline:
+            self._print_comparison(baseline, result)
+
+    def _print(self, result):
+        self.stdout.write(
+            f"{result['meta']['scenario']} — {result['meta']['concurrency']} élèves, {result['elapsed_s']} s, "
+            f"cible {result['meta']['target']} ({result['meta']['database']})"
+        )
+        self.stdout.write(f"{'endpoint':<24}{'req':>7}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}")
+        for name, row in [*result['endpoints'].items(), ('total', result['total'])]:
+            self.stdout.write(
+                f"{name:<24}{row['requests']:>7}{row['errors']:>6}{self._fmt(row['throughput_rps']):>9}"
+                f"{self._fmt(row['p50_ms']):>9}{self._fmt(row['p95_ms']):>9}{self._fmt(row['p99_ms']):>9}"
+                f"{self._fmt(row['queries_per_request'], 1):>6}"
+            )
+
+    def _print_comparison(self, baseline, result):
+        self.stdout.write(f"Comparaison avec {baseline['meta'].get('commit')} (latences en ms) :")
+        for name, field, old, new, change in loadtest.compare(baseline, result):
+            if old is None and new is None:
+                continue
+            delta = f"{change:+.1f} %" if change is not None else ''
+            self.stdout.write(f"  {name:<24}{field:<22}{self._fmt(old):>10} -> {self._fmt(new):>10}  {delta}")
+
+    def _fmt(self, value, digits=1):
+        return '-' if value is None else f'{value:.{digits}f}'
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import precomputed, replicas
+
+
+class Command(BaseCommand):
+    help = "Taux de réponses précalculées (première heure et journée) et appels à l'IA évités"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help='Jour (AAAA-MM-JJ, défaut: aujourd\'hui)')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['day']) if options['day'] else None
+        except ValueError:
+            raise CommandError('Date attendue au format AAAA-MM-JJ')
+        # Lecture seule : sur les réplicas s'il y en a
+        with replicas.use_replicas():
+            report = precomputed.hit_report(day)
+
+        self.stdout.write(f"Réponses du {report['day']} (première à {report['first_answer_at'] or '-'})")
+        for label, key in (('Première heure', 'first_hour'), ('Journée', 'whole_day')):
+            rates = report[key]
+            rate = '-' if rates['hit_rate'] is None else f"{rates['hit_rate']:.1%}"
+            self.stdout.write(f"  {label}: {rates['hits']}/{rates['answers']} réponses précalculées ({rate})")
+        reduction = '-' if report['upstream_reduction'] is None else f"{report['upstream_reduction']:.1%}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Appels à l'IA évités: {report['upstream_calls_avoided']} ({reduction}), "
+            f"environ {report['tokens_saved_estimate']} jetons"
+        ))
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.models import Conversation
+from api.purge import Purge
+
+
+class Command(BaseCommand):
+    help = "Efface par lots les conversations supprimées (suppression logique) et leurs messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=None,
+                            help="Ne purger que les conversations supprimées depuis au moins N minutes "
+                                 "(défaut: PURGE_GRACE_PERIOD)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lignes supprimées par lot (maximum)")
+        parser.add_argument('--max-batch-ms', type=float, default=200,
+                            help="Durée visée d'un lot ; au-delà la taille des lots est réduite")
+        parser.add_argument('--pause-ms', type=float, default=50, help="Attente entre deux lots")
+        parser.add_argument('--time-budget', type=float, default=None,
+                            help="Durée maximale de l'exécution (secondes)")
+
+    def handle(self, *args, **options):
+        pending = Conversation.all_objects.filter(deleted_at__isnull=False).count()
+        purge = Purge(
+            grace=timedelta(minutes=options['grace_minutes']) if options['grace_minutes'] is not None else None,
+            batch_size=options['batch_size'],
+            max_batch_seconds=options['max_batch_ms'] / 1000,
+            pause=options['pause_ms'] / 1000,
+            time_budget=options['time_budget'],
+        )
+        stats = purge.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['conversations']}/{pending} conversations supprimées purgées "
+            f"en {stats['batches']} lots (lot le plus long: {stats['slowest_batch_ms']:.1f} ms)"
+        ))
+        for table, rows in stats['rows'].items():
+            self.stdout.write(f"  {table}: {rows} lignes")
+        if not purge.finished:
+            self.stdout.write(self.style.WARNING("Budget de temps épuisé : relancer pour continuer"))
@@ -0,0 +1,55 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import loadtest, traces
+
+
+class Command(BaseCommand):
+    help = "Rejoue une trace de trafic (manage.py export_trace) contre l'API, en temps réel ou accéléré"
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace', help='Trace à rejouer')
+        parser.add_argument('--speed', type=float, default=1.0, help='Accélération (60 : une heure de trafic en une minute)')
+        parser.add_argument('--max-gap', type=float, default=None,
+                            help='Silences de la trace (nuits...) ramenés à N secondes au plus')
+        parser.add_argument('--limit', type=int, default=None, help='Rejoue seulement les N premiers messages')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requêtes simultanées au plus')
+        parser.add_argument('--url', default=None,
+                            help="Serveur à tester ; par défaut l'application dans ce processus avec le faux Groq")
+        parser.add_argument('--llm-latency-ms', type=float, default=500, help='Latence du faux Groq (dans le processus)')
+        parser.add_argument('--output', help='Fichier du rapport JSON')
+
+    def handle(self, *args, **options):
+        try:
+            header, events = traces.read_trace(options['trace'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Trace illisible: {e}")
+        events = events[:options['limit']] if options['limit'] else events
+        if not events:
+            raise CommandError('Trace vide')
+
+        replayer = traces.Replayer(events, options['speed'], options['max_gap'], options['concurrency'], options['url'])
+        llm = nullcontext() if options['url'] else loadtest.fake_llm(options['llm_latency_ms'] / 1000)
+        span = traces.compress_gaps(events, options['max_gap'])[-1] / options['speed']
+        self.stdout.write(f"Rejeu de {len(events)} messages (trace du {header['start']}) en {span:.0f} s environ")
+        with llm:
+            result = replayer.run()
+
+        total, lag = result['total'], result['lag']
+        self.stdout.write(
+            f"chat: {total['requests']} requêtes, {total['errors']} erreurs, p50 {total['p50_ms']} ms, "
+            f"p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms, {total['queries_per_request']} requêtes SQL"
+        )
+        self.stdout.write(f"Retard sur la trace: p50 {lag['p50_ms']} ms, p95 {lag['p95_ms']} ms, max {lag['max_ms']} ms")
+        for name, cache in result['cache'].items():
+            rate = '-' if cache['hit_rate'] is None else f"{cache['hit_rate']:.1%}"
+            self.stdout.write(f"Cache {name}: {cache['hits']} succès, {cache['misses']} échecs ({rate})")
+        for name, count in result['tasks_enqueued'].items():
+            self.stdout.write(f"Tâches {name}: {count} enfilées")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Rapport écrit dans {options['output']}")
@@ -0,0 +1,55 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import metrics
+from api.taskqueue import Worker
+
+# Entretien (tâches bloquées, tâches terminées anciennes) toutes les N secondes
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches d'arrière-plan enfilées en base (api.taskqueue)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Traiter les tâches prêtes puis s'arrêter")
+        parser.add_argument('--only', default='', help="Noms de tâches à traiter, séparés par des virgules")
+        parser.add_argument('--batch-size', type=int, default=None, help="Tâches d'un même type par lot")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['only'].split(',') if name.strip()]
+        worker = Worker(names=names or None, batch_size=options['batch_size'])
+
+        if options['once']:
+            worker.requeue_stale()
+            count = worker.drain()
+            self.stdout.write(self.style.SUCCESS(f"{count} tâches traitées"))
+            return
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        self.stdout.write(f"Worker {worker.worker_id} démarré")
+
+        last_maintenance = 0.0
+        while not self.stopping:
+            # Le worker vit longtemps : ne pas garder une connexion coupée par le serveur
+            close_old_connections()
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                worker.requeue_stale()
+                worker.delete_finished()
+                last_maintenance = time.monotonic()
+
+            if not worker.run_once():
+                time.sleep(settings.TASKS_POLL_INTERVAL)
+            metrics.write_snapshot()
+
+        self.stdout.write("Worker arrêté")
+
+    def _stop(self, signum, frame):
+        # Terminer le lot en cours avant de s'arrêter
+        self.stopping = True
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import loadtest
+
+
+class Command(BaseCommand):
+    help = "Crée des élèves, conversations et messages de test (préfixe bench_) pour les tests de charge"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--conversations', type=int, default=5, help='Conversations par élève (moyenne)')
+        parser.add_argument('--messages', type=int, default=10, help='Messages par conversation (moyenne)')
+        parser.add_argument('--seed', type=int, default=0, help='Graine aléatoire (mêmes données à chaque exécution)')
+        parser.add_argument('--clear', action='store_true', help='Supprime les données de test existantes avant')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f"{loadtest.clear()} lignes de test supprimées")
+        started = time.perf_counter()
+        counts = loadtest.seed(options['users'], options['conversations'], options['messages'], options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['users']} élèves, {counts['conversations']} conversations, {counts['messages']} messages "
+            f"créés en {time.perf_counter() - started:.1f} s (mot de passe: {loadtest.PASSWORD})"
+        ))
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import precomputed
+from api.gemini_service import get_gemini_service
+
+
+class Command(BaseCommand):
+    help = "Précalcule les réponses aux questions les plus fréquentes par niveau et matière (heures creuses)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Historique analysé (jours)")
+        parser.add_argument('--per-group', type=int, default=20, help='Questions retenues par (niveau, matière)')
+        parser.add_argument('--min-count', type=int, default=3, help='Occurrences minimales pour retenir une question')
+        parser.add_argument('--concurrency', type=int, default=None, help='Appels simultanés (défaut: PRECOMPUTED_WARM_CONCURRENCY)')
+        parser.add_argument('--rate', type=float, default=None, help='Appels par minute (défaut: PRECOMPUTED_WARM_RATE)')
+        parser.add_argument('--max-calls', type=int, default=None, help='Appels au plus (défaut: PRECOMPUTED_WARM_MAX_CALLS)')
+        parser.add_argument('--force', action='store_true', help='Lance même en dehors de PRECOMPUTED_WARM_WINDOW')
+        parser.add_argument('--dry-run', action='store_true', help='Affiche les questions retenues sans appeler l\'IA')
+
+    def handle(self, *args, **options):
+        inside, window_end = precomputed.warm_window()
+        if not inside and not options['force'] and not options['dry_run']:
+            raise CommandError(
+                f"En dehors des heures creuses ({settings.PRECOMPUTED_WARM_WINDOW}) : relancer avec --force"
+            )
+
+        candidates = precomputed.top_questions(options['days'], options['per_group'], options['min_count'])
+        self.stdout.write(f"{len(candidates)} questions fréquentes retenues")
+        if options['dry_run']:
+            for candidate in candidates:
+                self.stdout.write(
+                    f"  {candidate['frequency']:>5}  {candidate['class_level'] or '-':<10}{candidate['subject'] or '-':<15}"
+                    f"{candidate['question'][:70]}"
+                )
+            return
+
+        service = get_gemini_service()
+        if not service.client:
+            raise CommandError("Groq non configuré (GROQ_API_KEY) : aucune réponse à précalculer")
+
+        deleted = precomputed.delete_expired()
+        warmer = precomputed.Warmer(
+            service,
+            concurrency=options['concurrency'] or settings.PRECOMPUTED_WARM_CONCURRENCY,
+            rate=options['rate'] or settings.PRECOMPUTED_WARM_RATE,
+            max_calls=options['max_calls'] if options['max_calls'] is not None else settings.PRECOMPUTED_WARM_MAX_CALLS,
+            deadline=window_end if inside else None,
+        )
+        stats = warmer.run(candidates)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['stored']} réponses enregistrées, {stats['fresh']} encore valides, "
+            f"{stats['failed']} échecs, {stats['calls']} appels ; {deleted} réponses expirées supprimées"
+        ))
+        if stats['stopped']:
+            self.stdout.write(self.style.WARNING(f"Arrêt avant la fin: {stats['stopped']}"))
@@ -0,0 +1,293 @@
+"""
+Métriques de l'API exposées au format texte Prometheus (/api/metrics/).
+
+Chaque processus tient ses métriques en mémoire. Quand METRICS_DIR est
+configuré (plusieurs workers gunicorn), chaque worker écrit périodiquement
+un instantané dans `METRICS_DIR/metrics_<pid>_<id>.json` (un nouveau worker
+qui reprend le pid d'un worker terminé n'écrase pas ses compteurs) et
+l'endpoint additionne les fichiers de tous les workers. Le hook `on_starting`
+de gunicorn.conf.py vide ce dossier au démarrage du serveur.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = {}
+_lock = threading.Lock()
+_last_write = 0.0
+# (pid, nom du fichier d'instantané) : recalculé dans un processus issu d'un fork
+_snapshot_name = (None, None)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _snapshot(self):
+        return {
+            'kind': self.kind,
+            'doc': self.documentation,
+            'labelnames': list(self.labelnames),
+            'values': [[list(key), value] for key, value in self._values.items()],
+        }
+
+
+class Counter(_Metric):
+    """Compteur monotone"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valeur instantanée (additionnée entre les workers vivants)"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Histogramme à seaux fixes"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [effectifs par seau (non cumulés, dernier = +Inf), somme, nombre]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _snapshot(self):
+        snapshot = super()._snapshot()
+        snapshot['values'] = [[key, [list(value[0]), value[1], value[2]]] for key, value in snapshot['values']]
+        snapshot['buckets'] = list(self.buckets)
+        return snapshot
+
+
+# ---------------------------------------------------------------
+# Métriques de l'application
+# ---------------------------------------------------------------
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Requêtes HTTP traitées', ['route', 'method', 'status'])
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Durée des requêtes HTTP', ['route', 'method'])
+DB_QUERIES = Histogram(
+    'db_queries_per_request', 'Nombre de requêtes SQL par requête HTTP', ['route'],
+    buckets=COUNT_BUCKETS)
+DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Temps passé en base par requête HTTP', ['route'])
+LLM_LATENCY = Histogram(
+    'llm_request_duration_seconds', 'Durée des appels Groq', ['model'])
+LLM_REQUESTS = Counter(
+    'llm_requests_total', 'Appels Groq', ['model', 'outcome'])
+LLM_ERRORS = Counter(
+    'llm_errors_total', 'Erreurs des appels Groq', ['model', 'error'])
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Lectures de cache applicatif', ['cache', 'result'])
+LOG_RECORDS = Counter(
+    'log_records_total', 'Enregistrements de journal émis', ['level'])
+LOG_EMIT_SECONDS = Counter(
+    'log_emit_seconds_total', 'Temps passé à journaliser dans le thread de la requête')
+LOG_DROPPED = Counter(
+    'log_dropped_total', 'Enregistrements abandonnés (file de journalisation pleine)')
+TASKS_PROCESSED = Counter(
+    'tasks_processed_total', "Tâches d'arrière-plan traitées", ['task', 'outcome'])
+TASK_DURATION = Histogram(
+    'task_batch_duration_seconds', "Durée d'exécution d'un lot de tâches", ['task'])
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', "Attente d'une connexion du pool", ['alias'])
+DB_POOL_SIZE = Gauge(
+    'db_pool_connections', 'Connexions ouvertes par le pool', ['alias'])
+DB_POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'Connexions du pool prêtées à une requête', ['alias'])
+DB_POOL_CONNECTS = Counter(
+    'db_pool_connects_total', 'Nouvelles connexions ouvertes par le pool', ['alias'])
+DB_POOL_TIMEOUTS = Counter(
+    'db_pool_timeouts_total', 'Attentes du pool abandonnées (pool plein)', ['alias'])
+DB_POOL_DISCARDED = Counter(
+    'db_pool_discarded_total', 'Connexions fermées par le pool', ['alias', 'reason'])
+TRACES_EXPORTED = Counter(
+    'traces_exported_total', 'Traces échantillonnées exportées, en erreur ou abandonnées (file pleine)', ['result'])
+
+
+def record_cache(cache_name, hit):
+    """Compte une lecture de cache (hit/miss) pour le ratio de succès"""
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+# ---------------------------------------------------------------
+# Agrégation multi-processus
+# ---------------------------------------------------------------
+def _snapshot_all():
+    with _lock:
+        return {name: metric._snapshot() for name, metric in _registry.items()}
+
+
+def _snapshot_path(directory):
+    global _snapshot_name
+    pid = os.getpid()
+    if _snapshot_name[0] != pid:
+        _snapshot_name = (pid, f'metrics_{pid}_{uuid.uuid4().hex[:12]}.json')
+    return os.path.join(directory, _snapshot_name[1])
+
+
+def clear_snapshots():
+    """Supprime les instantanés d'un lancement précédent (démarrage du serveur)"""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json*')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshot(force=False):
+    """Écrit l'instantané du processus dans METRICS_DIR (au plus toutes les METRICS_FLUSH_INTERVAL s)"""
+    global _last_write
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_write < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_write = now
+
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot_all(), f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(into, snapshot, alive):
+    for name, metric in snapshot.items():
+        # Les jauges des workers terminés ne reflètent plus rien
+        if metric['kind'] == 'gauge' and not alive:
+            continue
+        merged = into.setdefault(name, {**metric, 'values': {}})
+        for key, value in metric['values']:
+            key = tuple(key)
+            current = merged['values'].get(key)
+            if metric['kind'] == 'histogram':
+                if current is None:
+                    merged['values'][key] = [list(value[0]), value[1], value[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+            else:
+                merged['values'][key] = (current or 0) + value
+
+
+def collect():
+    """Métriques agrégées de tous les workers"""
+    merged = {}
+    directory = settings.METRICS_DIR
+    if not directory:
+        _merge(merged, _snapshot_all(), alive=True)
+        return merged
+
+    write_snapshot(force=True)
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        try:
+            pid = int(os.path.basename(path)[len('metrics_'):-len('.json')].split('_')[0])
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (ValueError, OSError):
+            continue
+        _merge(merged, snapshot, alive=_pid_alive(pid))
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labelnames, key, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_latest():
+    """Rendu au format d'exposition texte de Prometheus"""
+    lines = []
+    for name, metric in sorted(collect().items()):
+        lines.append(f"# HELP {name} {metric['doc']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric['labelnames']
+        for key, value in sorted(metric['values'].items()):
+            if metric['kind'] == 'histogram':
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(metric['buckets']) + [float('inf')], counts):
+                    cumulative += bucket_count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{name}_bucket{_labels(labelnames, key, le)} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labelnames, key)} {_number(count)}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
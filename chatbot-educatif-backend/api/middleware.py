@@ -0,0 +1,136 @@
+import logging
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import logs, metrics
+from .profiling import QueryRecorder, find_n_plus_one
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('api.access')
+
+# X-Request-ID repris du client seulement s'il a cette forme (journaux, en-têtes sortants)
+_REQUEST_ID_RE = re.compile(r'[A-Za-z0-9-]{1,64}')
+
+
+def route_name(request):
+    """Route Django (motif d'URL) de la requête, pour regrouper les métriques"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route if match.route else match.view_name
+
+
+class _QueryTimer:
+    """execute_wrapper comptant les requêtes SQL et leur durée"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class RequestContextMiddleware:
+    """
+    Attribue un identifiant à chaque requête (en-tête X-Request-ID, repris du
+    client s'il est fourni et valide), le rend disponible aux journaux et
+    écrit une ligne d'accès avec la latence.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rid = request.headers.get('X-Request-ID', '')
+        if not _REQUEST_ID_RE.fullmatch(rid):
+            rid = uuid.uuid4().hex
+        request.request_id = rid
+        request_token = logs.request_id.set(rid)
+        current_token = logs.current_request.set(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            response['X-Request-ID'] = rid
+            access_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    'status': response.status_code,
+                    'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+                },
+            )
+            return response
+        finally:
+            logs.current_request.reset(current_token)
+            logs.request_id.reset(request_token)
+
+
+class MetricsMiddleware:
+    """
+    Mesure chaque requête : latence par route, nombre de requêtes SQL et
+    temps passé en base.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        route = route_name(request)
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        metrics.HTTP_LATENCY.observe(duration, route=route, method=request.method)
+        metrics.DB_QUERIES.observe(timer.count, route=route)
+        metrics.DB_TIME.observe(timer.duration, route=route)
+        metrics.write_snapshot()
+
+        return response
+
+
+class QueryProfilerMiddleware:
+    """
+    Profilage SQL (développement / tests, activé par QUERY_PROFILER_ENABLED).
+    Ajoute les en-têtes X-Query-Count / X-Query-Time-Ms et journalise les
+    requêtes répétées (N+1) avec la ligne du projet qui les déclenche.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(len(recorder.queries))
+        response['X-Query-Time-Ms'] = f"{recorder.total_time * 1000:.1f}"
+
+        for group in find_n_plus_one(recorder.queries):
+            logger.warning(
+                "N+1 probable sur %s %s : %d x %s (%.1f ms) depuis %s",
+                request.method, route_name(request), group['count'], group['sql'],
+                group['duration'] * 1000, ', '.join(group['origins'][:3]),
+            )
+
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedMessageBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('raw_size', models.PositiveIntegerField(help_text='Taille du JSON avant compression (octets)')),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_blocks', to='api.conversation')),
+            ],
+            options={
+                'ordering': ['conversation', 'first_message_id'],
+                'indexes': [models.Index(fields=['conversation', 'first_message_id'], name='api_archive_convers_b4919f_idx')],
+            },
+        ),
+    ]
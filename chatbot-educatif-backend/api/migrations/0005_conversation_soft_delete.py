@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_message_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:18
+
+import json
+import re
+import zlib
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+BATCH_SIZE = 500
+
+# Copies figées de api.summaries et api.archive : la migration ne doit pas
+# changer quand ces modules évoluent
+TITLE_MAX_CHARS = 80
+SUMMARY_MAX_CHARS = 200
+ARCHIVED_FIELDS = (
+    'id', 'content', 'is_user', 'timestamp', 'class_level', 'subject',
+    'prompt_tokens', 'completion_tokens', 'llm_latency_ms',
+)
+_SENTENCE_END = re.compile(r'(?<=[.?!])\s')
+
+
+def shorten(text, limit):
+    text = ' '.join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0].rstrip(' ,;:') + '…'
+
+
+def heuristic_title(text):
+    return shorten(_SENTENCE_END.split(' '.join(text.split()), 1)[0], TITLE_MAX_CHARS)
+
+
+def first_archived_question(block):
+    for row in json.loads(zlib.decompress(bytes(block.data))):
+        values = dict(zip(ARCHIVED_FIELDS, row))
+        if values['is_user']:
+            return values['content']
+    return None
+
+
+def backfill(apps, schema_editor):
+    """Titre, aperçu et nombre de messages des conversations existantes"""
+    Conversation = apps.get_model('api', 'Conversation')
+    Message = apps.get_model('api', 'Message')
+    ArchivedMessageBlock = apps.get_model('api', 'ArchivedMessageBlock')
+
+    user_messages = Message.objects.filter(conversation=OuterRef('pk'), is_user=True)
+    conversations = Conversation.objects.order_by('id').annotate(
+        first_question=Subquery(user_messages.order_by('timestamp', 'id').values('content')[:1]),
+        last_question=Subquery(user_messages.order_by('-timestamp', '-id').values('content')[:1]),
+    )
+    last_id = 0
+    while True:
+        batch = list(conversations.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        ids = [conversation.id for conversation in batch]
+        hot = dict(
+            Message.objects.filter(conversation_id__in=ids)
+            .values_list('conversation_id').annotate(count=Count('id')).order_by()
+        )
+        archived = dict(
+            ArchivedMessageBlock.objects.filter(conversation_id__in=ids)
+            .values_list('conversation_id').annotate(count=Sum('message_count')).order_by()
+        )
+        for conversation in batch:
+            conversation.message_count = hot.get(conversation.id, 0) + archived.get(conversation.id, 0)
+            first, last = conversation.first_question, conversation.last_question
+            if first is None and conversation.id in archived:
+                # Conversation archivée : première question du premier bloc
+                block = ArchivedMessageBlock.objects.filter(conversation_id=conversation.id).order_by('first_message_id').first()
+                first = first_archived_question(block)
+                last = last or first
+            if first:
+                conversation.title = heuristic_title(first)
+                conversation.summary = shorten(last, SUMMARY_MAX_CHARS)
+        Conversation.objects.bulk_update(batch, ['message_count', 'title', 'summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='title',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop, elidable=True),
+    ]
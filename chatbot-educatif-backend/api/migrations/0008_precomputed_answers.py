@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='precomputed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PrecomputedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_key', models.CharField(max_length=64)),
+                ('class_level', models.CharField(blank=True, default='', max_length=10)),
+                ('subject', models.CharField(blank=True, default='', max_length=50)),
+                ('question', models.TextField()),
+                ('answer', models.TextField()),
+                ('model', models.CharField(max_length=100)),
+                ('frequency', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('completion_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('generated_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'unique_together': {('question_key', 'class_level', 'subject')},
+            },
+        ),
+    ]
@@ -12,11 +12,30 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile de {self.user.username}"
 
+class ConversationManager(models.Manager):
+    """Conversations non supprimées (voir purge.py pour l'effacement réel)"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Conversation(models.Model):
     """Conversations de l'utilisateur"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Renseigné quand des messages ont été déplacés vers ArchivedMessageBlock
+    archived_at = models.DateTimeField(null=True, blank=True)
+    # Suppression logique : la conversation est masquée, les lignes sont purgées plus tard
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Titre et résumé pour l'écran d'historique (voir summaries.py)
+    title = models.CharField(max_length=120, blank=True, default='')
+    summary = models.TextField(blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+    # Nombre de messages couverts par le dernier résumé généré par l'IA
+    summary_message_count = models.PositiveIntegerField(default=0)
+    
+    objects = ConversationManager()
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['-updated_at']
@@ -32,10 +51,143 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     class_level = models.CharField(max_length=10, null=True, blank=True)
     subject = models.CharField(max_length=50, null=True, blank=True)
+    # Consommation de l'appel LLM (réponses de l'IA uniquement)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    llm_latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    # Réponse servie depuis PrecomputedAnswer (sans appel à l'IA)
+    precomputed = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['timestamp']
     
     def __str__(self):
         sender = "User" if self.is_user else "AI"
-        return f"{sender}: {self.content[:50]}..."
\ No newline at end of file
+        return f"{sender}: {self.content[:50]}..."
+
+class DailyUsage(models.Model):
+    """Consommation quotidienne de l'IA par utilisateur (alimentée par lots)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_usage')
+    date = models.DateField()
+    requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    llm_latency_ms = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('user', 'date')
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date}: {self.total_tokens} tokens"
+    
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+
+class Tombstone(models.Model):
+    """Trace d'une suppression, pour la synchronisation incrémentale des clients"""
+    OBJECT_TYPES = [
+        ('conversation', 'Conversation'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.object_type} {self.object_id} supprimé(e) le {self.deleted_at}"
+
+
+
+class ArchivedMessageBlock(models.Model):
+    """Bloc de messages archivés d'une conversation inactive (JSON compressé zlib)"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archive_blocks')
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    raw_size = models.PositiveIntegerField(help_text="Taille du JSON avant compression (octets)")
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['conversation', 'first_message_id']
+        indexes = [
+            models.Index(fields=['conversation', 'first_message_id']),
+        ]
+    
+    def __str__(self):
+        return f"Archive conversation {self.conversation_id} ({self.message_count} messages)"
+
+
+
+class Task(models.Model):
+    """Tâche d'arrière-plan (file en base, exécutée par `manage.py run_tasks`)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminée'),
+        (FAILED, 'Échec'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # Une seule tâche par clé : réenfiler avec la même clé est sans effet
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'name', 'run_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class PrecomputedAnswer(models.Model):
+    """Réponse calculée à l'avance pour une question fréquente (manage.py warm_answers)"""
+    # Empreinte de la question normalisée (api.precomputed.question_key)
+    question_key = models.CharField(max_length=64)
+    class_level = models.CharField(max_length=10, blank=True, default='')
+    subject = models.CharField(max_length=50, blank=True, default='')
+    question = models.TextField()
+    answer = models.TextField()
+    # Provenance : modèle, nombre d'occurrences relevées, consommation de l'appel
+    model = models.CharField(max_length=100)
+    frequency = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    generated_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('question_key', 'class_level', 'subject')
+    
+    def __str__(self):
+        return f"{self.question[:50]} ({self.class_level or '-'}/{self.subject or '-'})"
@@ -0,0 +1,92 @@
+"""
+Cache des conversations déjà sérialisées et compressées.
+
+Une conversation relue n'a pas besoin d'être resérialisée : le JSON est
+stocké compressé (gzip, et brotli si le paquet est installé) sous une clé
+par conversation, avec la version (ETag) dont il provient. Un nouveau
+message change `updated_at` donc la version : l'entrée est reconstruite à
+la lecture suivante. La suppression de la conversation efface l'entrée.
+"""
+import gzip
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .serializers import ConversationSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _key(conversation_id):
+    return f"conversation:{conversation_id}:payload"
+
+
+def _qvalues(accept):
+    """{encodage: q} d'un en-tête Accept-Encoding (q absent : 1, q illisible : 0)"""
+    values = {}
+    for part in accept.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        values[coding.lower()] = q
+    return values
+
+
+def accepted_encoding(request):
+    """Meilleur encodage accepté par le client parmi ceux que l'on stocke (q=0 : refusé)"""
+    qvalues = _qvalues(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    # À q égal, brotli (plus compact) d'abord
+    stored = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_q = None, 0.0
+    for coding in stored:
+        q = qvalues.get(coding, qvalues.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def build_payload(conversation):
+    """Sérialise et compresse une conversation (lecture non mise en cache)"""
+    body = JSONRenderer().render(ConversationSerializer(conversation).data)
+    payload = {'gzip': gzip.compress(body, compresslevel=settings.CONVERSATION_CACHE_GZIP_LEVEL)}
+    if brotli is not None:
+        payload['br'] = brotli.compress(body, quality=settings.CONVERSATION_CACHE_BROTLI_QUALITY)
+    return payload
+
+
+def get_payload(conversation, version):
+    """Corps compressé de la conversation pour `version`, depuis le cache si possible"""
+    key = _key(conversation.id)
+    entry = cache.get(key)
+    hit = entry is not None and entry['version'] == version
+    metrics.record_cache('conversation_payload', hit)
+    if hit:
+        return entry['payload']
+
+    payload = build_payload(conversation)
+    cache.set(key, {'version': version, 'payload': payload}, settings.CONVERSATION_CACHE_TIMEOUT)
+    return payload
+
+
+def body_for(payload, encoding):
+    """Corps à envoyer pour l'encodage négocié (None = non compressé)"""
+    if encoding is None:
+        return gzip.decompress(payload['gzip'])
+    return payload[encoding]
+
+
+def invalidate(conversation_id):
+    cache.delete(_key(conversation_id))
@@ -0,0 +1,278 @@
+"""
+Réponses précalculées aux questions les plus fréquentes.
+
+`manage.py warm_answers` (la nuit, hors heures de cours) relève dans
+l'historique les questions les plus posées par (niveau, matière), en
+demande la réponse à l'IA avec une concurrence et un débit bornés, et les
+enregistre dans PrecomputedAnswer avec leur provenance et une date
+d'expiration. Le chat consulte ces réponses avant d'appeler Groq : une
+question identique (après normalisation) du même niveau et de la même
+matière reçoit la réponse précalculée, sans appel à l'IA.
+"""
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Q
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from . import metrics
+from .gemini_service import FALLBACK_RESPONSE
+from .models import Message, PrecomputedAnswer
+
+logger = logging.getLogger(__name__)
+
+# Au-delà, une question n'est presque jamais reposée à l'identique
+MAX_QUESTION_CHARS = 300
+# Une réponse qui expire dans moins d'un jour est recalculée
+REFRESH_MARGIN = timedelta(days=1)
+KEYS_CACHE_KEY = 'precomputed:keys'
+# Les nouvelles réponses sont servies au plus tard après ce délai (secondes)
+KEYS_CACHE_TIMEOUT = 300
+
+
+def normalize_question(text):
+    """Question comparable : casse, espaces et ponctuation finale ignorés"""
+    text = ' '.join(unicodedata.normalize('NFC', text).lower().split())
+    return text.rstrip(' ?!.…')
+
+
+def question_key(text):
+    return hashlib.sha256(normalize_question(text).encode()).hexdigest()
+
+
+def valid_keys():
+    """
+    Clés (empreinte, niveau, matière) des réponses valides, gardées en cache :
+    une question sans réponse précalculée ne coûte aucune requête SQL.
+    """
+    keys = cache.get(KEYS_CACHE_KEY)
+    if keys is None:
+        keys = set(
+            PrecomputedAnswer.objects.filter(expires_at__gt=timezone.now())
+            .values_list('question_key', 'class_level', 'subject')
+        )
+        cache.set(KEYS_CACHE_KEY, keys, KEYS_CACHE_TIMEOUT)
+    return keys
+
+
+def lookup(message, class_level=None, subject=None):
+    """Réponse précalculée valide pour ce message, ou None"""
+    if not settings.PRECOMPUTED_ANSWERS_ENABLED or len(message) > MAX_QUESTION_CHARS:
+        return None
+    key = (question_key(message), class_level or '', subject or '')
+    answer = None
+    if key in valid_keys():
+        answer = (
+            PrecomputedAnswer.objects
+            .filter(question_key=key[0], class_level=key[1], subject=key[2], expires_at__gt=timezone.now())
+            .only('id', 'answer')
+            .first()
+        )
+    metrics.record_cache('precomputed_answers', answer is not None)
+    return answer
+
+
+def top_questions(days=30, per_group=20, min_count=3):
+    """
+    Questions les plus fréquentes des `days` derniers jours, par (niveau, matière) :
+    [{'class_level', 'subject', 'question', 'key', 'frequency'}], les plus fréquentes d'abord.
+    """
+    since = timezone.now() - timedelta(days=days)
+    rows = (
+        Message.objects
+        .filter(is_user=True, timestamp__gte=since)
+        .alias(length=Length('content'))
+        .filter(length__lte=MAX_QUESTION_CHARS)
+        .values_list('class_level', 'subject', 'content')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    counts, samples = Counter(), {}
+    for class_level, subject, content, n in rows.iterator():
+        normalized = normalize_question(content)
+        if not normalized:
+            continue
+        group = (class_level or '', subject or '', normalized)
+        counts[group] += n
+        samples.setdefault(group, content.strip())
+
+    per_group_counts = Counter()
+    selected = []
+    for (class_level, subject, normalized), frequency in counts.most_common():
+        if frequency < min_count:
+            break
+        if per_group_counts[class_level, subject] >= per_group:
+            continue
+        per_group_counts[class_level, subject] += 1
+        selected.append({
+            'class_level': class_level,
+            'subject': subject,
+            'question': samples[class_level, subject, normalized],
+            'key': question_key(normalized),
+            'frequency': frequency,
+        })
+    return selected
+
+
+def warm_window(now=None):
+    """(dans la fenêtre creuse, fin de la fenêtre) d'après PRECOMPUTED_WARM_WINDOW (« 22:00-06:00 »)"""
+    now = timezone.localtime(now)
+    start, end = (datetime.strptime(value.strip(), '%H:%M').time() for value in settings.PRECOMPUTED_WARM_WINDOW.split('-'))
+    if start <= end:
+        inside = start <= now.time() < end
+    else:
+        inside = now.time() >= start or now.time() < end
+    window_end = now.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+    if window_end <= now:
+        window_end += timedelta(days=1)
+    return inside, window_end
+
+
+class Warmer:
+    """
+    Calcule les réponses de `candidates` (top_questions) avec au plus
+    `concurrency` appels simultanés et `rate` appels par minute ; aucun
+    nouvel appel après `deadline` ni au-delà de `max_calls`.
+    """
+
+    def __init__(self, service, concurrency=2, rate=30, max_calls=None, deadline=None, ttl=None):
+        self.service = service
+        self.concurrency = concurrency
+        self.interval = 60.0 / rate if rate else 0.0
+        self.max_calls = max_calls
+        self.deadline = deadline
+        self.ttl = ttl or timedelta(days=settings.PRECOMPUTED_TTL_DAYS)
+        self.stats = {'candidates': 0, 'fresh': 0, 'calls': 0, 'stored': 0, 'failed': 0, 'stopped': None}
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _fresh_keys(self):
+        keep_until = timezone.now() + REFRESH_MARGIN
+        return set(
+            PrecomputedAnswer.objects.filter(expires_at__gt=keep_until)
+            .values_list('question_key', 'class_level', 'subject')
+        )
+
+    def _generate(self, candidate):
+        try:
+            context = {'class_level': candidate['class_level'] or None, 'subject': candidate['subject'] or None}
+            return self.service.generate_response_with_usage(candidate['question'], context)
+        finally:
+            self._slots.release()
+
+    def _store(self, candidate, result):
+        text, usage = result
+        if text == FALLBACK_RESPONSE or usage['completion_tokens'] is None:
+            self.stats['failed'] += 1
+            return
+        now = timezone.now()
+        PrecomputedAnswer.objects.update_or_create(
+            question_key=candidate['key'], class_level=candidate['class_level'], subject=candidate['subject'],
+            defaults={
+                'question': candidate['question'],
+                'answer': text,
+                'model': self.service.model_name,
+                'frequency': candidate['frequency'],
+                'prompt_tokens': usage['prompt_tokens'],
+                'completion_tokens': usage['completion_tokens'],
+                'generated_at': now,
+                'expires_at': now + self.ttl,
+            },
+        )
+        self.stats['stored'] += 1
+
+    def _stop_reason(self):
+        if self.max_calls is not None and self.stats['calls'] >= self.max_calls:
+            return 'max_calls'
+        if self.deadline is not None and timezone.now() >= self.deadline:
+            return 'deadline'
+        if self.service.circuit_state() == 'open':
+            return 'circuit_open'
+        return None
+
+    def run(self, candidates):
+        """Calcule et enregistre les réponses ; écritures en base dans le thread appelant"""
+        fresh = self._fresh_keys()
+        todo = [c for c in candidates if (c['key'], c['class_level'], c['subject']) not in fresh]
+        self.stats['candidates'] = len(candidates)
+        self.stats['fresh'] = len(candidates) - len(todo)
+
+        pending = []
+        next_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for candidate in todo:
+                self._slots.acquire()
+                self.stats['stopped'] = self._stop_reason()
+                if self.stats['stopped']:
+                    self._slots.release()
+                    break
+                delay = next_start - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_start = time.monotonic() + self.interval
+                pending.append((candidate, executor.submit(self._generate, candidate)))
+                self.stats['calls'] += 1
+
+                # Enregistre au fil de l'eau (une interruption ne perd que les appels en cours)
+                done = [(c, f) for c, f in pending if f.done()]
+                pending = [(c, f) for c, f in pending if not f.done()]
+                for c, future in done:
+                    self._collect(c, future)
+            for c, future in pending:
+                self._collect(c, future)
+        cache.delete(KEYS_CACHE_KEY)
+        logger.info("Réponses précalculées: %s", self.stats)
+        return self.stats
+
+    def _collect(self, candidate, future):
+        try:
+            self._store(candidate, future.result())
+        except Exception as e:
+            logger.error("Réponse précalculée non générée (%s): %s", candidate['key'][:12], e)
+            self.stats['failed'] += 1
+
+
+def delete_expired():
+    cache.delete(KEYS_CACHE_KEY)
+    return PrecomputedAnswer.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def _rates(messages):
+    counts = messages.aggregate(answers=Count('id'), hits=Count('id', filter=Q(precomputed=True)))
+    counts['hit_rate'] = round(counts['hits'] / counts['answers'], 4) if counts['answers'] else None
+    return counts
+
+
+def hit_report(day=None):
+    """
+    Taux de réponses précalculées d'une journée (par défaut aujourd'hui) :
+    première heure d'activité et journée entière, appels à l'IA évités.
+    """
+    day = day or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    answers = Message.objects.filter(is_user=False, timestamp__gte=start, timestamp__lt=start + timedelta(days=1))
+    first = answers.order_by('timestamp').values_list('timestamp', flat=True).first()
+
+    whole_day = _rates(answers)
+    first_hour = _rates(answers.filter(timestamp__lt=first + timedelta(hours=1))) if first else _rates(answers.none())
+    # Consommation moyenne d'un appel réel ce jour-là : estimation des jetons économisés
+    average = answers.filter(precomputed=False, completion_tokens__isnull=False).aggregate(
+        tokens=Avg(F('prompt_tokens') + F('completion_tokens')),
+    )['tokens'] or 0
+    return {
+        'day': day.isoformat(),
+        'first_answer_at': timezone.localtime(first).isoformat(timespec='minutes') if first else None,
+        'first_hour': first_hour,
+        'whole_day': whole_day,
+        'upstream_calls_avoided': whole_day['hits'],
+        'upstream_reduction': whole_day['hit_rate'],
+        'tokens_saved_estimate': int(average * whole_day['hits']),
+    }
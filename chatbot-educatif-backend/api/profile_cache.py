@@ -0,0 +1,80 @@
+"""
+Cache des utilisateurs sérialisés (utilisateur + profil).
+
+`get(user_id)` retourne le JSON de UserSerializer depuis le cache ; en cas
+d'absence, l'utilisateur est relu avec son profil en une seule requête
+(select_related) au lieu de l'accès paresseux à `user.profile`. Le profil,
+la connexion et l'utilisateur imbriqué de chaque conversation passent par
+ce cache.
+
+Une modification du profil par l'API réécrit l'entrée à la validation de
+la transaction (`store`) ; toute autre sauvegarde d'un User ou d'un
+UserProfile (admin, inscription groupée...) efface l'entrée, elle aussi à
+la validation : une lecture faite entre-temps par un autre worker
+remettrait sinon l'ancienne version en cache.
+
+L'écriture et l'effacement ne touchent que le cache de ce processus si le
+cache n'est pas partagé (CACHE_URL) : PROFILE_CACHE_TIMEOUT est alors
+court par défaut.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics, serializers
+from .models import UserProfile
+
+# Sauvegardes qui ne changent pas le JSON (connexion) : l'entrée est gardée
+UNSERIALIZED_FIELDS = {'last_login', 'password'}
+
+
+def _key(user_id):
+    return f"user:{user_id}:payload"
+
+
+def _serialize(user):
+    return serializers.UserSerializer(user).data
+
+
+def get(user_id):
+    """JSON de l'utilisateur (id, username, email, profile), depuis le cache si possible"""
+    key = _key(user_id)
+    data = cache.get(key)
+    metrics.record_cache('user_profile', data is not None)
+    if data is None:
+        data = _serialize(User.objects.select_related('profile').get(pk=user_id))
+        # add : une écriture directe (store) faite entre-temps n'est pas écrasée
+        cache.add(key, data, settings.PROFILE_CACHE_TIMEOUT)
+    return data
+
+
+def store(user):
+    """Sérialise `user` (profil chargé) et l'écrit dans le cache à la validation de la transaction"""
+    data = _serialize(user)
+    transaction.on_commit(lambda: cache.set(_key(user.pk), data, settings.PROFILE_CACHE_TIMEOUT))
+    return data
+
+
+def invalidate(user_id):
+    cache.delete(_key(user_id))
+
+
+def _invalidate_on_commit(user_id, using):
+    transaction.on_commit(lambda: invalidate(user_id), using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= UNSERIALIZED_FIELDS:
+        return
+    _invalidate_on_commit(instance.pk, using)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _profile_changed(sender, instance, using, **kwargs):
+    _invalidate_on_commit(instance.user_id, using)
@@ -0,0 +1,89 @@
+"""
+Profilage SQL par requête (développement / tests).
+
+Chaque requête SQL est enregistrée avec sa durée et la ligne du projet qui
+l'a déclenchée ; les requêtes sont regroupées par forme normalisée pour
+repérer les motifs N+1 (la même requête répétée pour chaque objet d'une liste).
+"""
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+_PROJECT_DIR = str(settings.BASE_DIR)
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def normalize_sql(sql):
+    """Forme canonique d'une requête : littéraux et listes IN remplacés"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """Première ligne du projet (hors dépendances) dans la pile d'appel"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(_PROJECT_DIR) and filename != _THIS_FILE
+                and 'site-packages' not in filename):
+            return f"{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return '?'
+
+
+class QueryRecorder:
+    """execute_wrapper qui conserve chaque requête, sa durée et son origine"""
+
+    def __init__(self, with_origin=True):
+        self.with_origin = with_origin
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'duration': time.perf_counter() - started,
+                'origin': query_origin() if self.with_origin else None,
+            })
+
+    @property
+    def total_time(self):
+        return sum(query['duration'] for query in self.queries)
+
+
+def group_queries(queries):
+    """
+    Regroupe des requêtes (dicts avec au moins 'sql') par forme normalisée.
+    Retourne [{'sql', 'count', 'duration', 'origins'}] du plus répété au moins répété.
+    """
+    groups = OrderedDict()
+    for query in queries:
+        key = normalize_sql(query['sql'])
+        group = groups.setdefault(key, {'sql': key, 'count': 0, 'duration': 0.0, 'origins': []})
+        group['count'] += 1
+        group['duration'] += float(query.get('duration') or query.get('time') or 0)
+        origin = query.get('origin')
+        if origin and origin not in group['origins']:
+            group['origins'].append(origin)
+    return sorted(groups.values(), key=lambda group: group['count'], reverse=True)
+
+
+def find_n_plus_one(queries, threshold=None):
+    """Groupes de requêtes répétées au moins `threshold` fois"""
+    if threshold is None:
+        threshold = settings.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD
+    return [group for group in group_queries(queries) if group['count'] >= threshold]
@@ -0,0 +1,116 @@
+"""
+Inscription d'une classe entière en une requête (comptes créés par le personnel).
+
+Toutes les lignes sont validées avec une seule requête d'existence, les mots
+de passe sont hachés en parallèle sur un pool de processus (le hachage
+PBKDF2 représente l'essentiel du coût d'une inscription, voir api.hashing),
+puis les `User` et `UserProfile` sont insérés par `bulk_create` dans une
+transaction.
+"""
+import csv
+import io
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from .hashing import MIN_PARALLEL_PASSWORDS, hash_passwords  # noqa: F401
+from .models import UserProfile
+
+FIELDS = ('username', 'email', 'password', 'phone', 'class_level')
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+def parse_rows(request):
+    """Lignes (dicts) d'une requête JSON ([...] ou {"students": [...]}) ou CSV (corps ou fichier `file`)"""
+    if request.content_type.startswith('text/csv'):
+        text = request.body.decode('utf-8-sig')
+    elif 'file' in request.FILES:
+        text = request.FILES['file'].read().decode('utf-8-sig')
+    else:
+        data = request.data
+        rows = data.get('students') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise InvalidPayload("Liste d'élèves attendue")
+        return rows
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'username' not in reader.fieldnames:
+        raise InvalidPayload("En-tête CSV attendu: username,email,password,phone,class_level")
+    return list(reader)
+
+
+def _clean(row, default_class_level):
+    values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+    values['class_level'] = values['class_level'] or default_class_level or ''
+    return values
+
+
+def validate(rows, default_class_level=None):
+    """
+    Valide toutes les lignes avec une seule requête en base.
+    Retourne (lignes valides, erreurs par index de ligne).
+    """
+    cleaned = [_clean(row, default_class_level) for row in rows]
+    errors = {}
+
+    usernames = [row['username'] for row in cleaned if row['username']]
+    emails = [row['email'] for row in cleaned if row['email']]
+    taken_usernames, taken_emails = set(), set()
+    if usernames:
+        for username, email in User.objects.filter(Q(username__in=usernames) | Q(email__in=emails)).values_list('username', 'email'):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+    seen_usernames, seen_emails = set(), set()
+    for index, row in enumerate(cleaned):
+        row_errors = []
+        if not row['username'] or not row['password']:
+            row_errors.append("Nom d'utilisateur et mot de passe requis")
+        if len(row['password']) < 6:
+            row_errors.append("Le mot de passe doit contenir au moins 6 caractères")
+        if row['username']:
+            try:
+                User.username_validator(row['username'])
+                if len(row['username']) > User._meta.get_field('username').max_length:
+                    raise ValidationError('trop long')
+            except ValidationError:
+                row_errors.append("Nom d'utilisateur invalide")
+            if row['username'] in taken_usernames:
+                row_errors.append("Ce nom d'utilisateur existe déjà")
+            elif row['username'] in seen_usernames:
+                row_errors.append("Nom d'utilisateur en double dans la liste")
+            seen_usernames.add(row['username'])
+        if row['email']:
+            if row['email'] in taken_emails:
+                row_errors.append("Cet email existe déjà")
+            elif row['email'] in seen_emails:
+                row_errors.append("Email en double dans la liste")
+            seen_emails.add(row['email'])
+        if row_errors:
+            errors[index] = row_errors
+
+    valid = [(index, row) for index, row in enumerate(cleaned) if index not in errors]
+    return valid, errors
+
+
+def create_accounts(valid):
+    """Insère les comptes valides ; retourne {index de ligne: id de l'utilisateur}"""
+    hashes = hash_passwords([row['password'] for _, row in valid])
+    users = [
+        User(username=row['username'], email=row['email'], password=password)
+        for (_, row), password in zip(valid, hashes)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=500)
+        # MySQL ne renvoie pas les ids des lignes insérées par lot : on les relit
+        ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=ids[row['username']], phone=row['phone'], class_level=row['class_level'])
+            for _, row in valid
+        ], batch_size=500)
+    return {index: ids[row['username']] for index, row in valid}
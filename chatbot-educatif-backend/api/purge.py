@@ -0,0 +1,152 @@
+"""
+Purge des conversations supprimées.
+
+La suppression côté API est logique : elle renseigne `Conversation.deleted_at`
+en un seul UPDATE, quelle que soit la longueur de la conversation, et le
+manager par défaut masque ensuite la conversation. Les lignes sont effacées
+plus tard par `manage.py purge_deleted` : par lots bornés en SQL brut (le
+collecteur de cascade de Django chargerait chaque message en mémoire), chaque
+lot dans sa propre transaction pour que les verrous restent courts. La taille
+des lots s'adapte à leur durée et la purge s'arrête à la fin de son budget
+de temps ; la prochaine exécution reprend là où elle s'est arrêtée.
+
+Chaque suppression planifie une purge dans la file de tâches
+(`schedule_purge`) : une tâche au plus par heure, une fois le délai de
+grâce écoulé pour toutes les suppressions de cette heure.
+
+Les Tombstone ne sont pas purgés : ils servent à la synchronisation.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
+
+from . import taskqueue
+from .models import Conversation
+
+# Conversations traitées par tour (les lots de lignes filles sont bornés à part)
+CONVERSATION_BATCH_SIZE = 100
+MIN_BATCH_SIZE = 10
+
+
+def _child_tables():
+    """(table, colonne) des modèles supprimés en cascade avec une conversation"""
+    return [
+        (relation.related_model._meta.db_table, relation.field.column)
+        for relation in Conversation._meta.related_objects
+        if relation.on_delete is models.CASCADE
+    ]
+
+
+def _delete_rows(table, column, values, limit):
+    """Supprime au plus `limit` lignes de `table` dont `column` est dans `values` ; retourne leur nombre"""
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        # SELECT puis DELETE par clé primaire : portable (MySQL refuse LIMIT
+        # dans une sous-requête IN) et ne verrouille que les lignes du lot
+        cursor.execute(
+            f'SELECT id FROM {quote(table)} WHERE {quote(column)} IN ({placeholders}) LIMIT %s',
+            [*values, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            cursor.execute(
+                f"DELETE FROM {quote(table)} WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                ids,
+            )
+    return len(ids)
+
+
+class Purge:
+    """
+    Une exécution de la purge.
+
+    `max_batch_seconds` : durée visée d'un lot (la taille est divisée par deux
+    au-delà, puis remonte jusqu'à `batch_size`) ; `pause` : attente entre deux
+    lots, pour laisser passer les requêtes ; `time_budget` : durée maximale de
+    l'exécution (None = jusqu'à épuisement).
+    """
+
+    def __init__(self, grace=None, batch_size=1000, max_batch_seconds=0.2,
+                 pause=0.05, time_budget=None):
+        self.grace = grace if grace is not None else timedelta(seconds=settings.PURGE_GRACE_PERIOD)
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.max_batch_seconds = max_batch_seconds
+        self.pause = pause
+        self.time_budget = time_budget
+        self.stats = {'conversations': 0, 'rows': {}, 'batches': 0, 'slowest_batch_ms': 0.0}
+        self.finished = False
+
+    def expired(self):
+        return self.time_budget is not None and time.monotonic() - self.started >= self.time_budget
+
+    def run(self):
+        self.started = time.monotonic()
+        # Marge : une requête chat commencée avant la suppression peut encore écrire un message
+        cutoff = timezone.now() - self.grace
+        children = _child_tables()
+
+        while not self.expired():
+            ids = list(
+                Conversation.all_objects
+                .filter(deleted_at__lt=cutoff)
+                .order_by('deleted_at')
+                .values_list('id', flat=True)[:CONVERSATION_BATCH_SIZE]
+            )
+            if not ids:
+                self.finished = True
+                break
+            for table, column in children:
+                if not self._drain(table, column, ids):
+                    return self.stats
+            self._batch(lambda: _delete_rows(Conversation._meta.db_table, 'id', ids, len(ids)),
+                        Conversation._meta.db_table)
+            self.stats['conversations'] += len(ids)
+
+        return self.stats
+
+    def _drain(self, table, column, ids):
+        """Supprime les lignes filles des conversations `ids` ; False si le budget est épuisé avant la fin"""
+        while True:
+            if self.expired():
+                return False
+            limit = self.batch_size
+            if self._batch(lambda: _delete_rows(table, column, ids, limit), table) < limit:
+                return True
+
+    def _batch(self, delete, table):
+        started = time.monotonic()
+        deleted = delete()
+        duration = time.monotonic() - started
+
+        self.stats['batches'] += 1
+        self.stats['rows'][table] = self.stats['rows'].get(table, 0) + deleted
+        self.stats['slowest_batch_ms'] = max(self.stats['slowest_batch_ms'], duration * 1000)
+        if duration > self.max_batch_seconds:
+            self.batch_size = max(self.batch_size // 2, MIN_BATCH_SIZE)
+        elif duration < self.max_batch_seconds / 2:
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+
+        if self.pause:
+            time.sleep(self.pause)
+        return deleted
+
+
+def schedule_purge():
+    """Planifie la purge des suppressions de l'heure en cours (une tâche par heure)"""
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    run_at = hour + timedelta(seconds=settings.PURGE_GRACE_PERIOD)
+    taskqueue.enqueue('conversations.purge', key=f"purge:{hour:%Y%m%d%H}", run_at=run_at)
+
+
+@taskqueue.task('conversations.purge', atomic=False)
+def purge_task(payload):
+    purge = Purge(time_budget=settings.PURGE_TIME_BUDGET)
+    purge.run()
+    if not purge.finished:
+        # Budget épuisé : continuer plus tard sans monopoliser le worker
+        taskqueue.enqueue('conversations.purge', delay=timedelta(minutes=1))
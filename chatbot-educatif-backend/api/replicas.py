@@ -0,0 +1,179 @@
+"""
+Lectures sur les réplicas en lecture seule (DATABASE_REPLICA_URLS).
+
+Les écritures vont toujours sur `default`. Les lectures d'une requête GET
+vont sur un réplica, sauf :
+- pendant une transaction sur `default` (lire ce que l'on vient d'écrire) ;
+- si le même client (en-tête Authorization, à défaut cookie de session) a
+  écrit depuis moins de DATABASE_REPLICA_STICKY_SECONDS : il relit ses
+  propres messages sur le primaire, sans attendre la réplication.
+Hors requête HTTP (commandes, worker de tâches), tout va sur le primaire ;
+un rapport peut lire sur les réplicas avec `with use_replicas():`.
+
+La fenêtre de « collage » est stockée dans le cache : avec plusieurs
+processus, CACHES doit être partagé (Redis, Memcached) pour qu'un worker
+voie les écritures faites via un autre.
+
+Un réplica injoignable (connexion refusée par le routeur, erreur pendant
+une requête, sonde de disponibilité api.health) est écarté des lectures de
+tous les workers pendant DATABASE_REPLICA_RETRY_SECONDS, via le même cache ;
+une requête dont un réplica a échoué est rejouée sur le primaire. Sans
+réplica disponible, les lectures vont sur le primaire.
+"""
+import contextvars
+import hashlib
+import logging
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# True : les lectures peuvent aller sur un réplica
+_replicas_allowed = contextvars.ContextVar('replicas_allowed', default=False)
+
+# Réplicas choisis par le routeur pendant la requête en cours (ReplicaMiddleware)
+_routed = contextvars.ContextVar('replicas_routed', default=None)
+
+UNAVAILABLE_KEY = 'replica:down:'
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def set_available(alias, available):
+    """Écarte (ou réintègre) un réplica des lectures de tous les workers"""
+    if available:
+        cache.delete(UNAVAILABLE_KEY + alias)
+    else:
+        cache.set(UNAVAILABLE_KEY + alias, 1, settings.DATABASE_REPLICA_RETRY_SECONDS)
+
+
+def unavailable_replicas(aliases=None):
+    aliases = replica_aliases() if aliases is None else aliases
+    down = cache.get_many([UNAVAILABLE_KEY + alias for alias in aliases])
+    return sorted(alias for alias in aliases if UNAVAILABLE_KEY + alias in down)
+
+
+def mark_unavailable(alias, error):
+    """Réplica en panne : connexion fermée, lectures sur les autres bases jusqu'à la prochaine tentative"""
+    logger.warning("Réplica '%s' indisponible, lectures sur le primaire: %s", alias, error)
+    try:
+        connections[alias].close()
+    except Exception:
+        pass
+    set_available(alias, False)
+
+
+def _failed(alias):
+    """Erreur sur la connexion du réplica qui la rend inutilisable (serveur arrêté, réseau)"""
+    connection = connections[alias]
+    if not connection.errors_occurred:
+        return False
+    return connection.connection is None or not connection.is_usable()
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    """Autorise (ou interdit) les lectures sur les réplicas dans le bloc"""
+    token = _replicas_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replicas_allowed.reset(token)
+
+
+def _client_key(request):
+    """Clé de collage du client : empreinte de son jeton (jamais le jeton lui-même)"""
+    credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return client_key(credential) if credential else None
+
+
+def client_key(credential):
+    return 'replica:sticky:' + hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+def stick_to_primary(credential):
+    """Envoie les lectures de ce client sur le primaire pendant la fenêtre de collage"""
+    if replica_aliases():
+        cache.set(client_key(credential), 1, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    """Routeur (DATABASE_ROUTERS) : écritures sur `default`, lectures réparties sur les réplicas"""
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+
+    def db_for_read(self, model, **hints):
+        if (not self.replicas or not _replicas_allowed.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        down = unavailable_replicas(self.replicas)
+        available = [alias for alias in self.replicas if alias not in down]
+        random.shuffle(available)
+        for alias in available:
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError as e:
+                mark_unavailable(alias, e)
+                continue
+            routed = _routed.get()
+            if routed is not None:
+                routed.add(alias)
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mêmes données sur toutes les bases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    Autorise les réplicas pour les lectures des requêtes sûres, hors fenêtre de collage.
+    Une requête dont un réplica a perdu sa connexion est rejouée sur le primaire.
+    """
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = _client_key(request)
+        safe = request.method in SAFE_METHODS
+        allowed = safe and not (key and cache.get(key))
+        with use_replicas(allowed):
+            routed = set()
+            token = _routed.set(routed)
+            try:
+                response = self.get_response(request)
+            finally:
+                _routed.reset(token)
+        failed = [alias for alias in routed if _failed(alias)]
+        if failed:
+            for alias in failed:
+                mark_unavailable(alias, "erreur pendant la requête")
+            response.close()
+            allowed = False
+            with use_replicas(False):
+                response = self.get_response(request)
+        if not safe and key:
+            cache.set(key, 1, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        if settings.DEBUG:
+            response['X-Database-Route'] = 'replica' if allowed else 'primary'
+        return response
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from . import profile_cache
+from .archive import archived_messages
 from .models import UserProfile, Conversation, Message
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -24,12 +26,43 @@ class MessageSerializer(serializers.ModelSerializer):
 
 class ConversationSerializer(serializers.ModelSerializer):
     """Serializer pour les conversations"""
-    messages = MessageSerializer(many=True, read_only=True)
-    user = UserSerializer(read_only=True)
+    messages = serializers.SerializerMethodField()
+    user = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ['id', 'user', 'created_at', 'updated_at', 'messages']
+        fields = ['id', 'user', 'title', 'summary', 'created_at', 'updated_at', 'messages']
+    
+    def get_user(self, obj):
+        # Même JSON que UserSerializer, sans charger l'utilisateur ni son profil
+        return profile_cache.get(obj.user_id)
+    
+    def get_messages(self, obj):
+        # Messages archivés (blocs compressés) puis messages de la table Message
+        messages = list(obj.messages.all())
+        if obj.archived_at is not None:
+            messages = archived_messages(obj) + messages
+        return MessageSerializer(messages, many=True).data
+
+class ConversationSummarySerializer(serializers.ModelSerializer):
+    """Ligne de l'écran d'historique (liste compacte, sans les messages)"""
+    class Meta:
+        model = Conversation
+        fields = ['id', 'title', 'summary', 'message_count', 'created_at', 'updated_at']
+
+class ConversationSyncSerializer(serializers.ModelSerializer):
+    """Conversation sans ses messages (synchronisation incrémentale)"""
+    class Meta:
+        model = Conversation
+        fields = ['id', 'title', 'summary', 'message_count', 'created_at', 'updated_at', 'archived_at']
+
+class MessageSyncSerializer(serializers.ModelSerializer):
+    """Message avec l'identifiant de sa conversation (synchronisation incrémentale)"""
+    conversation_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Message
+        fields = ['id', 'conversation_id', 'content', 'is_user', 'timestamp', 'class_level', 'subject']
 
 class ChatRequestSerializer(serializers.Serializer):
     """Serializer pour les requêtes de chat"""
@@ -0,0 +1,105 @@
+"""
+Titres et résumés des conversations (écran d'historique).
+
+Après chaque échange, le chat renseigne sans requête supplémentaire un titre
+(première question de l'élève) et un aperçu (dernière question), calculés
+localement. Si CONVERSATION_SUMMARY_LLM est activé, un résumé est ensuite
+demandé à l'IA par la file de tâches, hors du chemin de la requête : après
+le premier échange puis tous les CONVERSATION_SUMMARY_EVERY messages, en ne
+lui envoyant que le résumé précédent et les messages ajoutés depuis.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import taskqueue
+from .archive import archived_messages
+from .gemini_service import get_gemini_service
+from .models import Conversation
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_CHARS = 80
+SUMMARY_MAX_CHARS = 200
+# Messages envoyés au plus à l'IA pour une mise à jour du résumé
+SUMMARY_MAX_MESSAGES = 20
+
+_SENTENCE_END = re.compile(r'(?<=[.?!])\s')
+
+
+def shorten(text, limit):
+    """Texte sur une ligne, coupé à un mot près au-delà de `limit` caractères"""
+    text = ' '.join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0].rstrip(' ,;:') + '…'
+
+
+def heuristic_title(text):
+    """Titre local : première phrase du message"""
+    return shorten(_SENTENCE_END.split(' '.join(text.split()), 1)[0], TITLE_MAX_CHARS)
+
+
+def record_exchange(conversation, user_message):
+    """
+    Enregistre, en une requête, titre, aperçu et nombre de messages après un
+    échange (et un nouvel updated_at) ; retourne le nouveau nombre de messages.
+    """
+    message_count = conversation.message_count + 2
+    if not conversation.title:
+        conversation.title = heuristic_title(user_message)
+    # L'aperçu local ne remplace pas un résumé produit par l'IA
+    if not conversation.summary_message_count:
+        conversation.summary = shorten(user_message, SUMMARY_MAX_CHARS)
+    # Incrément en SQL : deux échanges simultanés sur la même conversation
+    conversation.message_count = F('message_count') + 2
+    conversation.save(update_fields=['updated_at', 'title', 'summary', 'message_count'])
+    # L'instance garde l'entier vu par cet échange, pas l'expression F
+    conversation.message_count = message_count
+    return message_count
+
+
+def schedule_summary(conversation, previous_count, message_count):
+    """Enfile un résumé par l'IA au premier échange puis tous les CONVERSATION_SUMMARY_EVERY messages"""
+    if not settings.CONVERSATION_SUMMARY_LLM:
+        return
+    every = settings.CONVERSATION_SUMMARY_EVERY
+    if previous_count and previous_count // every == message_count // every:
+        return
+    taskqueue.enqueue(
+        'conversations.summarize',
+        {'conversation_id': conversation.id},
+        key=f"summary:{conversation.id}:{message_count // every}",
+    )
+
+
+@taskqueue.task('conversations.summarize', atomic=False)
+def summarize_task(payload):
+    """Résumé incrémental par l'IA (appel long : pas de transaction ouverte pendant l'appel)"""
+    conversation = Conversation.objects.filter(id=payload['conversation_id']).first()
+    if conversation is None:
+        return
+
+    messages = archived_messages(conversation) + list(conversation.messages.order_by('timestamp', 'id'))
+    new_messages = messages[conversation.summary_message_count:]
+    if not new_messages:
+        return
+
+    result = get_gemini_service().summarize(
+        conversation.summary if conversation.summary_message_count else '',
+        new_messages[-SUMMARY_MAX_MESSAGES:],
+    )
+    fields = {
+        'summary': shorten(result['summary'], SUMMARY_MAX_CHARS * 2),
+        'summary_message_count': len(messages),
+        # Nouvel ETag et visible pour la synchronisation
+        'updated_at': timezone.now(),
+    }
+    # Le titre de l'IA remplace le titre local une seule fois : il ne change plus ensuite
+    if result['title'] and not conversation.summary_message_count:
+        fields['title'] = shorten(result['title'].strip('"«» '), TITLE_MAX_CHARS)
+    Conversation.objects.filter(id=conversation.id).update(**fields)
+    logger.info("Résumé de la conversation %s mis à jour (%d messages)", conversation.id, len(messages))
@@ -0,0 +1,91 @@
+"""
+Synchronisation incrémentale pour les clients hors ligne.
+
+Le client conserve le `sync_token` de la dernière synchronisation et ne
+reçoit ensuite que les conversations et messages créés ou modifiés depuis,
+ainsi que les suppressions (tombstones). Les éléments sont identifiés par
+leur id : le client les insère ou les remplace, un doublon est sans effet.
+Les messages archivés (`archived_at` renseigné) ne sont pas renvoyés : un
+nouvel appareil récupère ces conversations via /api/conversation/<id>/.
+
+Le jeton est un curseur : l'horodatage (microsecondes depuis l'epoch) et,
+au milieu d'une pagination, l'id du dernier message reçu (« <µs>.<id> »).
+Les messages sont triés par (timestamp, id) : une page pleine de messages
+de même horodatage ne bloque pas la pagination.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Conversation, Message, Tombstone
+from .serializers import ConversationSyncSerializer, MessageSyncSerializer
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(moment, message_id=None):
+    token = str(int((moment - EPOCH) / timedelta(microseconds=1)))
+    return token if message_id is None else f'{token}.{message_id}'
+
+
+def decode_token(token):
+    """Curseur (horodatage, id du dernier message reçu ou None), ou None sans jeton"""
+    if not token:
+        return None
+    micros, _, message_id = token.partition('.')
+    try:
+        return EPOCH + timedelta(microseconds=int(micros)), int(message_id) if message_id else None
+    except (ValueError, OverflowError):
+        raise InvalidSyncToken(token)
+
+
+def changes_since(user, cursor, limit):
+    """
+    Modifications visibles par `user` depuis le curseur `cursor` (None = tout).
+    Les messages sont paginés par `limit` ; `has_more` indique qu'il faut
+    relancer la synchronisation avec le nouveau jeton.
+    """
+    since, after_id = cursor or (None, None)
+    # Marge pour les transactions encore en cours au moment de la lecture :
+    # les éléments de cette fenêtre seront renvoyés à la prochaine synchronisation
+    next_since = timezone.now() - timedelta(seconds=settings.SYNC_SAFETY_MARGIN)
+
+    conversations = Conversation.objects.filter(user=user)
+    messages = Message.objects.filter(conversation__user=user, conversation__deleted_at__isnull=True)
+    tombstones = Tombstone.objects.filter(user=user)
+    if since is not None:
+        conversations = conversations.filter(updated_at__gt=since)
+        if after_id is None:
+            messages = messages.filter(timestamp__gt=since)
+        else:
+            messages = messages.filter(Q(timestamp__gt=since) | Q(timestamp=since, id__gt=after_id))
+        tombstones = tombstones.filter(deleted_at__gt=since)
+
+    messages = list(messages.order_by('timestamp', 'id')[:limit + 1])
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[:limit]
+        # Reprendre juste après le dernier message reçu, ex aequo compris
+        sync_token = encode_token(messages[-1].timestamp, messages[-1].id)
+    elif since is not None and next_since <= since:
+        sync_token = encode_token(since, after_id)
+    else:
+        sync_token = encode_token(next_since)
+
+    return {
+        'conversations': ConversationSyncSerializer(conversations, many=True).data,
+        'messages': MessageSyncSerializer(messages, many=True).data,
+        'deleted': {
+            'conversations': list(
+                tombstones.filter(object_type='conversation').values_list('object_id', flat=True)
+            ),
+        },
+        'has_more': has_more,
+        'sync_token': sync_token,
+    }
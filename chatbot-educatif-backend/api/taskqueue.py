@@ -0,0 +1,205 @@
+"""
+File de tâches d'arrière-plan stockée en base (pas de broker externe).
+
+Une vue enfile le travail qui n'a pas besoin d'être fait avant de répondre
+(`enqueue`, un INSERT) ; le worker `manage.py run_tasks` le réserve avec
+SELECT ... FOR UPDATE SKIP LOCKED (plusieurs workers peuvent tourner) et
+l'exécute. Les tâches d'un même type peuvent être traitées par lots.
+
+Les gestionnaires sont déclarés avec `@task(...)` dans le module qui porte la
+logique (usage.py, purge.py...) ; ces modules sont importés par
+ApiConfig.ready(). Par défaut un gestionnaire s'exécute dans la même
+transaction que le passage de ses tâches à « terminée » : ses écritures en
+base ne sont jamais appliquées deux fois, même si le worker s'arrête au
+mauvais moment. Les effets extérieurs (appel HTTP...) doivent être
+idempotents : une tâche peut être rejouée.
+"""
+import logging
+import os
+import random
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+# nom -> {'handler', 'batch', 'atomic', 'max_attempts'}
+_registry = {}
+
+
+def task(name, batch=False, atomic=True, max_attempts=None):
+    """
+    Déclare un gestionnaire de tâches.
+
+    `batch=True` : le gestionnaire reçoit la liste des payloads de toutes les
+    tâches `name` prêtes (jusqu'à TASKS_BATCH_SIZE), sinon un seul payload.
+    `atomic=False` : le gestionnaire gère lui-même ses transactions (travail long).
+    """
+    def decorator(handler):
+        _registry[name] = {
+            'handler': handler,
+            'batch': batch,
+            'atomic': atomic,
+            'max_attempts': max_attempts or settings.TASKS_MAX_ATTEMPTS,
+        }
+        return handler
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=None, run_at=None):
+    """
+    Enfile une tâche (une requête INSERT). Avec `key`, une tâche portant déjà
+    cette clé (en attente ou terminée) rend l'appel sans effet.
+    """
+    if name not in _registry:
+        raise KeyError(f"Tâche inconnue: {name}")
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta(0))
+    Task.objects.bulk_create(
+        [Task(name=name, payload=payload or {}, idempotency_key=key, run_at=run_at)],
+        ignore_conflicts=key is not None,
+    )
+
+
+def retry_delay(attempts):
+    """Attente avant la tentative suivante : exponentielle, plafonnée, avec gigue"""
+    delay = min(settings.TASKS_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASKS_RETRY_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class Worker:
+    """Réserve et exécute les tâches prêtes ; `run_once()` traite un lot"""
+
+    def __init__(self, names=None, batch_size=None):
+        self.names = names
+        self.batch_size = batch_size or settings.TASKS_BATCH_SIZE
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    def _ready(self, now):
+        tasks = Task.objects.filter(status=Task.PENDING, run_at__lte=now)
+        if self.names:
+            tasks = tasks.filter(name__in=self.names)
+        return tasks
+
+    def claim(self):
+        """Réserve les prochaines tâches prêtes (toutes du même type) ; [] s'il n'y en a pas"""
+        now = timezone.now()
+        with transaction.atomic():
+            head = (
+                self._ready(now)
+                .select_for_update(skip_locked=True)
+                .order_by('run_at', 'id')
+                .first()
+            )
+            if head is None:
+                return []
+            spec = _registry.get(head.name)
+            if spec is None or not spec['batch']:
+                tasks = [head]
+            else:
+                tasks = list(
+                    self._ready(now).filter(name=head.name)
+                    .select_for_update(skip_locked=True)
+                    .order_by('run_at', 'id')[:self.batch_size]
+                )
+            Task.objects.filter(id__in=[t.id for t in tasks]).update(
+                status=Task.RUNNING, locked_at=now, locked_by=self.worker_id, attempts=F('attempts') + 1,
+            )
+        for t in tasks:
+            t.attempts += 1
+        return tasks
+
+    def run_once(self):
+        """Traite un lot ; retourne le nombre de tâches réservées"""
+        tasks = self.claim()
+        if not tasks:
+            return 0
+
+        name = tasks[0].name
+        spec = _registry.get(name)
+        started = time.perf_counter()
+        try:
+            if spec is None:
+                raise KeyError(f"Tâche inconnue: {name}")
+            payloads = [t.payload for t in tasks] if spec['batch'] else tasks[0].payload
+            if spec['atomic']:
+                with transaction.atomic():
+                    spec['handler'](payloads)
+                    self._finish(tasks)
+            else:
+                spec['handler'](payloads)
+                self._finish(tasks)
+        except Exception as e:
+            logger.error("Échec de la tâche %s (%d tâches): %s", name, len(tasks), e, exc_info=True)
+            self._fail(tasks, spec, e)
+            metrics.TASKS_PROCESSED.inc(len(tasks), task=name, outcome='error')
+        else:
+            metrics.TASKS_PROCESSED.inc(len(tasks), task=name, outcome='done')
+        metrics.TASK_DURATION.observe(time.perf_counter() - started, task=name)
+        return len(tasks)
+
+    def _finish(self, tasks):
+        Task.objects.filter(id__in=[t.id for t in tasks]).update(
+            status=Task.DONE, finished_at=timezone.now(), last_error='',
+        )
+
+    def _fail(self, tasks, spec, error):
+        now = timezone.now()
+        max_attempts = spec['max_attempts'] if spec else 1
+        for t in tasks:
+            if t.attempts >= max_attempts:
+                Task.objects.filter(id=t.id).update(status=Task.FAILED, finished_at=now, last_error=repr(error))
+            else:
+                Task.objects.filter(id=t.id).update(
+                    status=Task.PENDING, run_at=now + retry_delay(t.attempts), last_error=repr(error),
+                )
+
+    def requeue_stale(self):
+        """
+        Reprend les tâches réservées par un worker arrêté en cours de route.
+        La tentative interrompue compte (`attempts` est incrémenté à la
+        réservation) : une tâche qui fait tomber le worker à chaque essai
+        passe en échec après `max_attempts` au lieu de boucler.
+        """
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=settings.TASKS_LOCK_TIMEOUT)
+        stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff)
+        error = 'Worker arrêté pendant la tâche'
+        count = 0
+        for name in stale.values_list('name', flat=True).distinct():
+            spec = _registry.get(name)
+            max_attempts = spec['max_attempts'] if spec else 1
+            count += stale.filter(name=name, attempts__gte=max_attempts).update(
+                status=Task.FAILED, finished_at=now, last_error=error,
+            )
+            count += stale.filter(name=name, attempts__lt=max_attempts).update(
+                status=Task.PENDING, run_at=now, last_error=error,
+            )
+        return count
+
+    def delete_finished(self):
+        """Supprime (par lot) les tâches terminées depuis plus de TASKS_KEEP_FINISHED secondes"""
+        cutoff = timezone.now() - timedelta(seconds=settings.TASKS_KEEP_FINISHED)
+        ids = list(
+            Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff)
+            .values_list('id', flat=True)[:1000]
+        )
+        return Task.objects.filter(id__in=ids).delete()[0] if ids else 0
+
+    def drain(self):
+        """Traite les tâches prêtes jusqu'à ce qu'il n'y en ait plus ; retourne leur nombre"""
+        total = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return total
+            total += count
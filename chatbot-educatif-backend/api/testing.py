@@ -0,0 +1,51 @@
+"""
+Outils de test : budgets de requêtes SQL par endpoint.
+
+Chaque route de `api/urls.py` doit avoir un budget dans QUERY_BUDGETS ;
+`assert_query_budget` fait échouer le test si l'endpoint le dépasse et
+affiche les requêtes répétées (N+1) avec leur origine.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .profiling import group_queries
+
+# Nombre maximum de requêtes SQL par endpoint (nom de route -> budget),
+# authentification JWT comprise
+QUERY_BUDGETS = {
+    'register': 5,
+    'bulk_register': 7,
+    'login': 3,
+    'logout': 8,
+    'get_profile': 1,
+    'update_profile': 7,  # dont SAVEPOINT / RELEASE de la transaction sous TestCase
+    'chat': 5,
+    'get_conversation': 3,
+    'get_user_conversations': 5,
+    'delete_conversation': 4,
+    'sync': 4,
+    'export': 4,
+    'health_check': 0,
+    'health_live': 0,
+    'health_ready': 1,
+    'metrics': 0,
+}
+
+
+@contextmanager
+def assert_query_budget(testcase, route_name, budget=None):
+    """Vérifie qu'un bloc ne dépasse pas le budget de requêtes de `route_name`"""
+    if budget is None:
+        budget = QUERY_BUDGETS[route_name]
+    with CaptureQueriesContext(connection) as captured:
+        yield captured
+
+    if len(captured) > budget:
+        details = '\n'.join(
+            f"  {group['count']} x {group['sql']}" for group in group_queries(captured.captured_queries)
+        )
+        testcase.fail(
+            f"'{route_name}' a exécuté {len(captured)} requêtes SQL (budget: {budget}) :\n{details}"
+        )
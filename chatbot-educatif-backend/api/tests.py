@@ -1,3 +1,1503 @@
-from django.test import TestCase
+import gzip
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, router as db_router, transaction
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import checks, gemini_service, hashing, health, loadtest, logs, metrics, payload_cache, precomputed, profile_cache, provisioning, replicas, taskqueue, traces, tracing, usage
+from .archive import archive_conversation
+from .fake_groq import FakeGroqServer
+from .models import UserProfile, Conversation, Message, ArchivedMessageBlock, DailyUsage, PrecomputedAnswer, Task
+from .serializers import ConversationSerializer
+from .summaries import heuristic_title, record_exchange
+from .profiling import normalize_sql, find_n_plus_one
+from .purge import Purge
+from .testing import QUERY_BUDGETS, assert_query_budget
+from .urls import urlpatterns
+from monprojet.backends.pool import ConnectionPool, PoolTimeout, PooledConnectionMixin, discard_pool
+
+FAKE_LLM_RESPONSE = (
+    'Réponse de test',
+    {'prompt_tokens': 10, 'completion_tokens': 20, 'latency_ms': 5},
+)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class QueryBudgetTests(TestCase):
+    """Chaque endpoint de api/urls.py respecte son budget de requêtes SQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eleve', 'eleve@exemple.com', 'motdepasse')
+        UserProfile.objects.create(user=cls.user, class_level='cm1')
+        # Plusieurs conversations pour que les N+1 dépassent le budget
+        for _ in range(5):
+            conversation = Conversation.objects.create(user=cls.user)
+            for i in range(4):
+                Message.objects.create(conversation=conversation, content=f'message {i}', is_user=i % 2 == 0)
+        cls.conversation = conversation
+
+    def setUp(self):
+        cache.clear()
+        health._cached = None
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def tearDown(self):
+        # Ne pas écrire la consommation accumulée après la fin des tests
+        usage._pending.clear()
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - set(QUERY_BUDGETS), set(), 'Routes sans budget de requêtes')
+
+    def test_register(self):
+        with assert_query_budget(self, 'register'):
+            response = APIClient().post(reverse('register'), {
+                'username': 'nouveau', 'email': 'nouveau@exemple.com', 'password': 'motdepasse',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_register(self):
+        self.user.is_staff = True
+        self.user.save()
+        students = [{'username': f'eleve{i}', 'password': 'motdepasse'} for i in range(10)]
+        with assert_query_budget(self, 'bulk_register'):
+            response = self.client.post(reverse('bulk_register'), {'class_level': 'cm1', 'students': students}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 10)
+
+    def test_login(self):
+        with assert_query_budget(self, 'login'):
+            response = APIClient().post(reverse('login'), {
+                'username': 'eleve', 'password': 'motdepasse',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        with assert_query_budget(self, 'logout'):
+            response = self.client.post(reverse('logout'), {'refresh_token': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_profile(self):
+        profile_cache.get(self.user.id)  # en régime établi, le profil est en cache
+        with assert_query_budget(self, 'get_profile'):
+            response = self.client.get(reverse('get_profile'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_profile(self):
+        with assert_query_budget(self, 'update_profile'):
+            response = self.client.put(reverse('update_profile'), {
+                'email': 'autre@exemple.com', 'class_level': 'cm2',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('api.gemini_service.GeminiService.generate_response_with_usage', return_value=FAKE_LLM_RESPONSE)
+    def test_chat(self, _):
+        # En régime établi, les clés des réponses précalculées et le profil sont en cache
+        precomputed.valid_keys()
+        profile_cache.get(self.user.id)
+        with assert_query_budget(self, 'chat'):
+            response = self.client.post(reverse('chat'), {
+                'message': 'Comment fait-on une addition ?', 'conversation_id': self.conversation.id,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_conversation(self):
+        profile_cache.get(self.user.id)
+        with assert_query_budget(self, 'get_conversation'):
+            response = self.client.get(reverse('get_conversation', args=[self.conversation.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_user_conversations(self):
+        profile_cache.get(self.user.id)
+        with assert_query_budget(self, 'get_user_conversations'):
+            response = self.client.get(reverse('get_user_conversations'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_delete_conversation(self):
+        with assert_query_budget(self, 'delete_conversation'):
+            response = self.client.delete(reverse('delete_conversation', args=[self.conversation.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_sync(self):
+        with assert_query_budget(self, 'sync'):
+            response = self.client.get(reverse('sync'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 20)
+
+    def test_export(self):
+        with assert_query_budget(self, 'export'):
+            response = self.client.get(reverse('export'))
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response.status_code, 200)
+        # utilisateur + 5 conversations + 20 messages
+        self.assertEqual(len(lines), 26)
+
+    def test_health_check(self):
+        with assert_query_budget(self, 'health_check'):
+            response = APIClient().get(reverse('health_check'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_health_live(self):
+        with assert_query_budget(self, 'health_live'):
+            response = APIClient().get(reverse('health_live'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_health_ready(self):
+        with assert_query_budget(self, 'health_ready'):
+            response = APIClient().get(reverse('health_ready'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics(self):
+        with assert_query_budget(self, 'metrics'):
+            response = APIClient().get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, SYNC_SAFETY_MARGIN=0)
+class SyncTests(TestCase):
+    """Synchronisation incrémentale et requêtes conditionnelles"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        self.conversation = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=self.conversation, content='bonjour')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sync_returns_only_changes(self):
+        first = self.client.get(reverse('sync')).json()
+        self.assertEqual(len(first['messages']), 1)
+
+        other = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=other, content='nouveau')
+        self.client.delete(reverse('delete_conversation', args=[self.conversation.id]))
+
+        delta = self.client.get(reverse('sync'), {'since': first['sync_token']}).json()
+        self.assertEqual([m['content'] for m in delta['messages']], ['nouveau'])
+        self.assertEqual([c['id'] for c in delta['conversations']], [other.id])
+        self.assertEqual(delta['deleted']['conversations'], [self.conversation.id])
+
+    def test_sync_pagination(self):
+        for i in range(3):
+            Message.objects.create(conversation=self.conversation, content=f'suite {i}')
+        page = self.client.get(reverse('sync'), {'limit': 2}).json()
+        self.assertTrue(page['has_more'])
+        rest = self.client.get(reverse('sync'), {'since': page['sync_token'], 'limit': 10}).json()
+        self.assertFalse(rest['has_more'])
+        received = {m['id'] for m in page['messages']} | {m['id'] for m in rest['messages']}
+        self.assertEqual(len(received), 4)
+
+    def test_sync_pagination_with_identical_timestamps(self):
+        moment = timezone.now() - timedelta(minutes=5)
+        Message.objects.create(conversation=self.conversation, content='avant')
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, content=f'ex aequo {i}')
+        Message.objects.filter(conversation=self.conversation).update(timestamp=moment)
+
+        received, token = [], None
+        for _ in range(10):
+            page = self.client.get(reverse('sync'), {'since': token or '', 'limit': 2}).json()
+            received += [m['id'] for m in page['messages']]
+            token = page['sync_token']
+            if not page['has_more']:
+                break
+        self.assertFalse(page['has_more'])
+        self.assertEqual(sorted(received), sorted(Message.objects.values_list('id', flat=True)))
+        self.assertEqual(len(received), 7)
+
+    def test_export_groups_messages_by_conversation(self):
+        other = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=other, content='deuxième')
+        Message.objects.create(conversation=self.conversation, content='suite')
+
+        response = self.client.get(reverse('export'), {'gzip': '1'})
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([r['type'] for r in records], ['user', 'conversation', 'message', 'message', 'conversation', 'message'])
+        self.assertEqual([r['content'] for r in records if r['type'] == 'message'], ['bonjour', 'suite', 'deuxième'])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('sync'), {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conversation_etag(self):
+        url = reverse('get_conversation', args=[self.conversation.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.conversation.save(update_fields=['updated_at'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_conversation_compressed_payload(self):
+        url = reverse('get_conversation', args=[self.conversation.id])
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+
+        # Un nouveau message change la version : l'entrée du cache est reconstruite
+        Message.objects.create(conversation=self.conversation, content='encore')
+        self.conversation.save(update_fields=['updated_at'])
+        self.assertEqual(len(self.client.get(url).json()['messages']), 2)
+
+    def test_accepted_encoding_honours_qvalues(self):
+        def accepted(header, with_brotli=True):
+            with mock.patch('api.payload_cache.brotli', mock.Mock() if with_brotli else None):
+                return payload_cache.accepted_encoding(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header))
+
+        self.assertEqual(accepted('gzip, deflate, br'), 'br')
+        self.assertEqual(accepted('gzip, deflate, br', with_brotli=False), 'gzip')
+        self.assertEqual(accepted('GZIP'), 'gzip')
+        self.assertEqual(accepted('br;q=0, gzip'), 'gzip')
+        self.assertEqual(accepted('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertIsNone(accepted('gzip;q=0, deflate'))
+        self.assertIsNone(accepted('gzip;q=0.000, br;q=abc'))
+        self.assertEqual(accepted('*;q=0.1, br;q=0'), 'gzip')
+        self.assertIsNone(accepted(''))
+
+    def test_conversation_list_etag(self):
+        url = reverse('get_user_conversations')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.delete(reverse('delete_conversation', args=[self.conversation.id]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ArchiveTests(TestCase):
+    """Les conversations archivées se lisent comme les autres"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        self.conversation = Conversation.objects.create(user=self.user)
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, content=f'message {i}', is_user=i % 2 == 0,
+                                   subject='mathematiques')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_archived_conversation_reads_identically(self):
+        url = reverse('get_conversation', args=[self.conversation.id])
+        before = self.client.get(url).json()
+        export_before = b''.join(self.client.get(reverse('export')).streaming_content)
+
+        count, raw_size, compressed_size = archive_conversation(self.conversation, block_size=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(self.conversation.archive_blocks.count(), 3)
+        self.assertFalse(Message.objects.exists())
+
+        cache.clear()
+        self.assertEqual(self.client.get(url).json(), before)
+        self.assertEqual(self.client.get(reverse('get_user_conversations')).json(), [before])
+        self.assertEqual(b''.join(self.client.get(reverse('export')).streaming_content), export_before)
+
+    def test_new_messages_follow_archived_ones(self):
+        archive_conversation(self.conversation, block_size=10)
+        self.conversation.refresh_from_db()
+        Message.objects.create(conversation=self.conversation, content='après archivage')
+        contents = [m['content'] for m in ConversationSerializer(self.conversation).data['messages']]
+        self.assertEqual(contents[-1], 'après archivage')
+        self.assertEqual(len(contents), 6)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SoftDeleteTests(TestCase):
+    """Suppression logique puis purge par lots"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        self.conversation = Conversation.objects.create(user=self.user)
+        for i in range(25):
+            Message.objects.create(conversation=self.conversation, content=f'message {i}')
+        archive_conversation(self.conversation, block_size=10)
+        Message.objects.create(conversation=self.conversation, content='après archivage')
+        self.kept = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=self.kept, content='à garder')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.delete(reverse('delete_conversation', args=[self.conversation.id]))
+
+    def test_deleted_conversation_is_hidden(self):
+        self.assertTrue(Conversation.all_objects.filter(id=self.conversation.id).exists())
+        self.assertEqual(self.client.get(reverse('get_conversation', args=[self.conversation.id])).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('delete_conversation', args=[self.conversation.id])).status_code, 404)
+        self.assertEqual([c['id'] for c in self.client.get(reverse('get_user_conversations')).json()], [self.kept.id])
+        self.assertEqual(len(self.client.get(reverse('sync')).json()['messages']), 1)
+        lines = b''.join(self.client.get(reverse('export')).streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_purge_respects_grace_period(self):
+        stats = Purge(pause=0).run()
+        self.assertEqual(stats['conversations'], 0)
+        self.assertTrue(Conversation.all_objects.filter(id=self.conversation.id).exists())
+
+    def test_purge_deletes_in_batches(self):
+        stats = Purge(grace=timedelta(0), batch_size=10, pause=0).run()
+        self.assertEqual(stats['conversations'], 1)
+        self.assertEqual(stats['rows'][Message._meta.db_table], 1)
+        self.assertEqual(stats['rows'][ArchivedMessageBlock._meta.db_table], 3)
+        self.assertFalse(Conversation.all_objects.filter(id=self.conversation.id).exists())
+        self.assertFalse(ArchivedMessageBlock.objects.exists())
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['à garder'])
+        # Les tombstones restent pour la synchronisation
+        self.assertEqual(self.user.tombstones.count(), 1)
+
+    def test_purge_stops_at_time_budget(self):
+        purge = Purge(grace=timedelta(0), pause=0, time_budget=0)
+        purge.run()
+        self.assertFalse(purge.finished)
+        self.assertTrue(Conversation.all_objects.filter(id=self.conversation.id).exists())
+
+
+class TaskQueueTests(TestCase):
+    """File de tâches en base : idempotence, lots, nouvelles tentatives"""
+
+    def setUp(self):
+        usage._pending.clear()
+        self.calls = []
+        registry = mock.patch.dict(taskqueue._registry)
+        registry.start()
+        self.addCleanup(registry.stop)
+        taskqueue.task('tests.collect', batch=True)(self.calls.append)
+        taskqueue.task('tests.fail', max_attempts=2)(self._fail)
+
+    def _fail(self, payload):
+        UserProfile.objects.create(user=User.objects.create_user('annule'))
+        raise RuntimeError('échec')
+
+    def test_enqueue_with_key_is_idempotent(self):
+        taskqueue.enqueue('tests.collect', {'n': 1}, key='unique')
+        taskqueue.enqueue('tests.collect', {'n': 2}, key='unique')
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_same_type_tasks_run_as_one_batch(self):
+        for n in range(3):
+            taskqueue.enqueue('tests.collect', {'n': n})
+        taskqueue.enqueue('tests.collect', {'n': 9}, delay=timedelta(hours=1))
+
+        self.assertEqual(taskqueue.Worker().run_once(), 3)
+        self.assertEqual(self.calls, [[{'n': 0}, {'n': 1}, {'n': 2}]])
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 3)
+        self.assertEqual(taskqueue.Worker().run_once(), 0)
+
+    def test_failed_task_is_rolled_back_and_retried(self):
+        taskqueue.enqueue('tests.fail')
+        worker = taskqueue.Worker()
+        worker.run_once()
+
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertFalse(User.objects.filter(username='annule').exists())
+
+        Task.objects.update(run_at=timezone.now())
+        worker.run_once()
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    @override_settings(TASKS_LOCK_TIMEOUT=60)
+    def test_stale_tasks_count_as_attempts(self):
+        taskqueue.enqueue('tests.fail')
+        taskqueue.enqueue('tests.collect')
+        worker = taskqueue.Worker()
+        for attempt in (1, 2):
+            # Le worker réserve les tâches puis meurt avant de les terminer
+            self.assertEqual(len(worker.claim()) + len(worker.claim()), 2)
+            Task.objects.update(locked_at=timezone.now() - timedelta(minutes=2))
+            self.assertEqual(worker.requeue_stale(), 2)
+        statuses = dict(Task.objects.values_list('name', 'status'))
+        self.assertEqual(statuses, {'tests.fail': Task.FAILED, 'tests.collect': Task.PENDING})
+        self.assertEqual(Task.objects.get(name='tests.fail').attempts, 2)
+
+    def test_usage_is_written_by_the_worker(self):
+        user = User.objects.create_user('eleve')
+        for _ in range(2):
+            usage.record_usage(user.id, 'cm1', {'prompt_tokens': 10, 'completion_tokens': 5, 'latency_ms': 100})
+            usage.flush_usage()
+        self.assertFalse(DailyUsage.objects.exists())
+
+        taskqueue.Worker().drain()
+        daily = DailyUsage.objects.get(user=user)
+        self.assertEqual((daily.requests, daily.total_tokens, daily.llm_latency_ms), (2, 30, 200))
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_delete_schedules_one_purge(self):
+        user = User.objects.create_user('eleve')
+        client = APIClient()
+        client.force_authenticate(user)
+        for _ in range(2):
+            conversation = Conversation.objects.create(user=user)
+            client.delete(reverse('delete_conversation', args=[conversation.id]))
+        self.assertEqual(Task.objects.filter(name='conversations.purge').count(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, USAGE_USER_DAILY_TOKENS=0, USAGE_CLASS_DAILY_TOKENS={})
+class UsageBudgetTests(TestCase):
+    """Budgets quotidiens : refus avant toute écriture, niveau du profil, compteurs reconstitués"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve')
+        UserProfile.objects.create(user=self.user, class_level='cm1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        usage._pending.clear()
+        usage._pending_classes.clear()
+
+    def chat(self, **body):
+        with mock.patch('api.gemini_service.GeminiService.generate_response_with_usage',
+                        return_value=FAKE_LLM_RESPONSE) as generate:
+            response = self.client.post(reverse('chat'), {'message': 'Bonjour', **body}, format='json')
+        return response, generate
+
+    def test_user_budget(self):
+        with override_settings(USAGE_USER_DAILY_TOKENS=30):
+            self.assertEqual(self.chat()[0].status_code, 200)  # 30 jetons consommés
+            response, generate = self.chat()
+        self.assertEqual(response.status_code, 429)
+        generate.assert_not_called()
+        # Aucune conversation vide laissée par le refus
+        self.assertEqual(Conversation.objects.filter(user=self.user).count(), 1)
+
+    def test_class_budget_uses_profile_level(self):
+        classmate = User.objects.create_user('camarade')
+        UserProfile.objects.create(user=classmate, class_level='cm1')
+        usage.record_usage(classmate.id, 'cm1', {'prompt_tokens': 40, 'completion_tokens': 10})
+        with override_settings(USAGE_CLASS_DAILY_TOKENS={'cm1': 50}):
+            # Sans class_level (ou avec un autre niveau) dans la requête, le budget du profil s'applique
+            self.assertEqual(self.chat()[0].status_code, 429)
+            self.assertEqual(self.chat(class_level='cp1')[0].status_code, 429)
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_counters_survive_cache_loss(self):
+        DailyUsage.objects.create(user=self.user, date=timezone.localdate(), prompt_tokens=20, completion_tokens=5)
+        usage.record_usage(self.user.id, 'cm1', {'prompt_tokens': 3, 'completion_tokens': 2})
+        cache.clear()  # redémarrage, éviction
+        with override_settings(USAGE_USER_DAILY_TOKENS=31, USAGE_CLASS_DAILY_TOKENS={'cm1': 100}):
+            self.assertIsNone(usage.check_budget(self.user.id, 'cm1'))
+            self.assertEqual(cache.get(usage._user_key(self.user.id, timezone.localdate())), 30)
+            self.assertEqual(cache.get(usage._class_key('cm1', timezone.localdate())), 30)
+            usage.record_usage(self.user.id, 'cm1', {'prompt_tokens': 1, 'completion_tokens': 0})
+            self.assertIsNotNone(usage.check_budget(self.user.id, 'cm1'))
+
+    @override_settings(USAGE_USER_DAILY_TOKENS=1000)
+    def test_record_and_flush(self):
+        usage.record_usage(self.user.id, 'cm1', {'prompt_tokens': 10, 'completion_tokens': 5, 'latency_ms': 100})
+        usage.record_usage(self.user.id, 'cm1', {'prompt_tokens': None, 'completion_tokens': None, 'latency_ms': None})
+        today = timezone.localdate()
+        self.assertEqual(usage._pending[self.user.id, today], [2, 10, 5, 100])
+        self.assertEqual(cache.get(usage._user_key(self.user.id, today)), 15)
+
+        self.assertEqual(usage.flush_usage(), 1)
+        self.assertEqual((usage._pending, usage._pending_classes), ({}, {}))
+        task = Task.objects.get(name='usage.flush')
+        self.assertEqual(task.payload['rows'], [[self.user.id, today.isoformat(), 2, 10, 5, 100]])
+        self.assertEqual(usage.flush_usage(), 0)
+
+    def test_budgets_require_shared_cache(self):
+        self.assertEqual(checks.check_usage_cache(None), [])
+        with override_settings(USAGE_USER_DAILY_TOKENS=1000):
+            self.assertEqual([error.id for error in checks.check_usage_cache(None)], ['api.E001'])
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+                self.assertEqual(checks.check_usage_cache(None), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SummaryTests(TestCase):
+    """Titres, aperçus et résumés des conversations"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        usage._pending.clear()
+
+    def chat(self, message, conversation_id=None):
+        with mock.patch('api.gemini_service.GeminiService.generate_response_with_usage',
+                        return_value=FAKE_LLM_RESPONSE):
+            response = self.client.post(reverse('chat'), {
+                'message': message, 'conversation_id': conversation_id,
+            }, format='json')
+        return response.json()['conversation_id']
+
+    def test_heuristic_title(self):
+        self.assertEqual(heuristic_title("Comment fait-on une addition ? Je ne comprends pas."),
+                         "Comment fait-on une addition ?")
+        self.assertTrue(heuristic_title('mot ' * 50).endswith('…'))
+        self.assertLessEqual(len(heuristic_title('mot ' * 50)), 81)
+
+    def test_record_exchange_keeps_an_integer_count(self):
+        conversation = Conversation.objects.create(user=self.user, message_count=2)
+        self.assertEqual(record_exchange(conversation, 'Et la soustraction ?'), 4)
+        self.assertEqual(conversation.message_count, 4)
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.message_count, conversation.title), (4, 'Et la soustraction ?'))
+
+    def test_backfill_reads_archived_blocks(self):
+        backfill = importlib.import_module('api.migrations.0007_conversation_summary').backfill
+        conversation = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=conversation, content='Bonjour !', is_user=False)
+        Message.objects.create(conversation=conversation, content="C'est quoi un verbe ? Merci", is_user=True)
+        Message.objects.create(conversation=conversation, content='Un mot qui exprime une action.', is_user=False)
+        archive_conversation(conversation, block_size=2)
+
+        backfill(apps, None)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 3)
+        self.assertEqual((conversation.title, conversation.summary), ("C'est quoi un verbe ?", "C'est quoi un verbe ? Merci"))
+
+    def test_chat_sets_title_and_preview(self):
+        conversation_id = self.chat("C'est quoi une fraction ? Merci")
+        self.chat('Et un dénominateur ?', conversation_id)
+        conversation = Conversation.objects.get(id=conversation_id)
+        self.assertEqual(conversation.title, "C'est quoi une fraction ?")
+        self.assertEqual(conversation.summary, 'Et un dénominateur ?')
+        self.assertEqual(conversation.message_count, 4)
+        self.assertFalse(Task.objects.exists())
+
+    def test_compact_list(self):
+        conversation_id = self.chat('Bonjour')
+        with assert_query_budget(self, 'get_user_conversations', budget=3):
+            response = self.client.get(reverse('get_user_conversations'), {'compact': '1'})
+        self.assertEqual(response.json(), [{
+            'id': conversation_id, 'title': 'Bonjour', 'summary': 'Bonjour', 'message_count': 2,
+            'created_at': response.json()[0]['created_at'], 'updated_at': response.json()[0]['updated_at'],
+        }])
+        self.assertNotEqual(response['ETag'], self.client.get(reverse('get_user_conversations'))['ETag'])
+
+    @override_settings(CONVERSATION_SUMMARY_LLM=True, CONVERSATION_SUMMARY_EVERY=4)
+    @mock.patch('api.gemini_service.GeminiService.summarize',
+                return_value={'title': 'Les fractions', 'summary': "L'élève découvre les fractions."})
+    def test_llm_summary_runs_off_the_request_path(self, summarize):
+        conversation_id = self.chat('Une fraction ?')
+        self.chat('Un dénominateur ?', conversation_id)
+        self.chat('Un numérateur ?', conversation_id)
+        # Après le premier échange, puis en franchissant 4 messages
+        self.assertEqual(Task.objects.filter(name='conversations.summarize').count(), 2)
+        summarize.assert_not_called()
+
+        taskqueue.Worker().drain()
+        conversation = Conversation.objects.get(id=conversation_id)
+        self.assertEqual(conversation.title, 'Les fractions')
+        self.assertEqual(conversation.summary, "L'élève découvre les fractions.")
+        self.assertEqual(conversation.summary_message_count, 6)
+
+        # Incrémental : seuls les messages ajoutés depuis le dernier résumé sont envoyés
+        self.chat('Et une division ?', conversation_id)
+        taskqueue.Worker().drain()
+        previous_summary, messages = summarize.call_args.args
+        self.assertEqual(previous_summary, "L'élève découvre les fractions.")
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(Conversation.objects.get(id=conversation_id).summary, "L'élève découvre les fractions.")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkRegisterTests(TestCase):
+    """Inscription d'une classe par le personnel"""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user('enseignant', 'prof@exemple.com', 'motdepasse', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_staff_only(self):
+        self.teacher.is_staff = False
+        self.teacher.save()
+        response = self.client.post(reverse('bulk_register'), [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_per_row_results(self):
+        response = self.client.post(reverse('bulk_register'), {'class_level': 'cm2', 'students': [
+            {'username': 'awa', 'password': 'motdepasse', 'email': 'awa@exemple.com'},
+            {'username': 'enseignant', 'password': 'motdepasse'},
+            {'username': 'awa', 'password': 'motdepasse'},
+            {'username': 'ali', 'password': '123'},
+            {'username': 'issa', 'password': 'motdepasse', 'email': 'prof@exemple.com'},
+            {'username': 'moussa', 'password': 'motdepasse', 'class_level': 'cm1'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 4))
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['created', 'error', 'error', 'error', 'error', 'created'])
+        awa = User.objects.get(username='awa')
+        self.assertEqual(data['results'][0]['id'], awa.id)
+        self.assertTrue(awa.check_password('motdepasse'))
+        self.assertEqual(awa.profile.class_level, 'cm2')
+        self.assertEqual(User.objects.get(username='moussa').profile.class_level, 'cm1')
+
+    # Processus « spawn » : ils lisent les réglages du projet, pas ceux surchargés par le test
+    @override_settings(BULK_REGISTER_HASH_WORKERS=2, PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_csv_with_parallel_hashing(self):
+        lines = ['username,email,password,phone,class_level']
+        lines += [f'eleve{i},,motdepasse{i},,' for i in range(provisioning.MIN_PARALLEL_PASSWORDS)]
+        response = self.client.post(reverse('bulk_register') + '?class_level=ce1', '\n'.join(lines),
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], provisioning.MIN_PARALLEL_PASSWORDS)
+        self.assertTrue(authenticate(username='eleve3', password='motdepasse3'))
+        self.assertEqual(UserProfile.objects.filter(class_level='ce1').count(), provisioning.MIN_PARALLEL_PASSWORDS)
+
+        # Pool « spawn » gardé d'une inscription à l'autre
+        pool = hashing._pool
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(hashing._forget_pool)
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+        provisioning.hash_passwords(['motdepasse'] * provisioning.MIN_PARALLEL_PASSWORDS)
+        self.assertIs(hashing._pool, pool)
+
+    def test_csv_body_without_query_parameter(self):
+        body = 'username,email,password,phone,class_level\r\nawa,,motdepasse,,cm1\r\nali,,motdepasse,,cm2\r\n'
+        response = self.client.post(reverse('bulk_register'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(User.objects.get(username='awa').profile.class_level, 'cm1')
+
+    def test_invalid_payload(self):
+        response = self.client.post(reverse('bulk_register'), 'nom;mdp\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, METRICS_DIR='', METRICS_TOKEN='')
+class MetricsTests(TestCase):
+    """Rendu Prometheus, agrégation des instantanés par processus, jeton d'accès, routes"""
+
+    def isolated_registry(self):
+        registry = mock.patch.dict(metrics._registry, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_text_rendering(self):
+        self.isolated_registry()
+        requests = metrics.Counter('demo_requests_total', 'Requêtes de démonstration', ['route'])
+        latency = metrics.Histogram('demo_duration_seconds', 'Durée', buckets=(0.1, 1))
+        metrics.Gauge('demo_in_use', 'En cours').set(3)
+        requests.inc(route='/a"b\\c')
+        requests.inc(2, route='/a"b\\c')
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+
+        self.assertEqual(metrics.render_latest().splitlines(), [
+            '# HELP demo_duration_seconds Durée',
+            '# TYPE demo_duration_seconds histogram',
+            'demo_duration_seconds_bucket{le="0.1"} 1.0',
+            'demo_duration_seconds_bucket{le="1.0"} 2.0',
+            'demo_duration_seconds_bucket{le="+Inf"} 3.0',
+            'demo_duration_seconds_sum 5.55',
+            'demo_duration_seconds_count 3.0',
+            '# HELP demo_in_use En cours',
+            '# TYPE demo_in_use gauge',
+            'demo_in_use 3.0',
+            '# HELP demo_requests_total Requêtes de démonstration',
+            '# TYPE demo_requests_total counter',
+            'demo_requests_total{route="/a\\"b\\\\c"} 3.0',
+        ])
+
+    def test_snapshots_are_merged_per_pid(self):
+        self.isolated_registry()
+        requests = metrics.Counter('demo_requests_total', 'Requêtes', ['route'])
+        in_use = metrics.Gauge('demo_in_use', 'En cours')
+        latency = metrics.Histogram('demo_duration_seconds', 'Durée', buckets=(1,))
+        requests.inc(route='/a')
+        in_use.set(2)
+        latency.observe(0.5)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(METRICS_DIR=directory.name):
+            # Instantané d'un worker terminé (même format), et un fichier illisible ignoré
+            metrics.write_snapshot(force=True)
+            with open(metrics._snapshot_path(directory.name)) as f:
+                snapshot = f.read()
+            with open(os.path.join(directory.name, 'metrics_999999999_0123456789ab.json'), 'w') as f:
+                f.write(snapshot)
+            with open(os.path.join(directory.name, 'metrics_abc.json'), 'w') as f:
+                f.write('{')
+            requests.inc(route='/a')
+            with mock.patch('api.metrics._pid_alive', side_effect=lambda pid: pid == os.getpid()):
+                merged = metrics.collect()
+
+        self.assertEqual(merged['demo_requests_total']['values'], {('/a',): 3})
+        # Jauge du worker terminé écartée ; histogrammes additionnés seau par seau
+        self.assertEqual(merged['demo_in_use']['values'], {(): 2})
+        self.assertEqual(merged['demo_duration_seconds']['values'], {(): [[2, 0], 1.0, 2]})
+
+    def test_gunicorn_hooks(self):
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', settings.BASE_DIR / 'gunicorn.conf.py')
+        gunicorn_conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(gunicorn_conf)
+        self.isolated_registry()
+        requests = metrics.Counter('demo_requests_total', 'Requêtes')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(METRICS_DIR=directory.name):
+            # Restes d'un lancement précédent, dont un pid repris par un worker actuel
+            for name in (f'metrics_{os.getpid()}.json', 'metrics_999999999_0123456789ab.json.tmp'):
+                with open(os.path.join(directory.name, name), 'w') as f:
+                    f.write('{}')
+            gunicorn_conf.on_starting(server=None)
+            self.assertEqual(os.listdir(directory.name), [])
+
+            # Arrêt d'un worker : ses derniers comptes sont écrits, quel que soit METRICS_FLUSH_INTERVAL
+            requests.inc()
+            metrics.write_snapshot(force=True)
+            requests.inc()
+            with mock.patch('api.usage.flush_usage') as flush_usage:
+                gunicorn_conf.worker_exit(server=None, worker=None)
+            flush_usage.assert_called_once()
+            self.assertEqual(os.listdir(directory.name), [os.path.basename(metrics._snapshot_path(directory.name))])
+            self.assertEqual(metrics.collect()['demo_requests_total']['values'], {(): 2})
+
+        # Nouveau processus (fork) : nouveau fichier, même si le pid a déjà servi
+        path = metrics._snapshot_path(directory.name)
+        with mock.patch('api.metrics._snapshot_name', (None, None)):
+            self.assertNotEqual(metrics._snapshot_path(directory.name), path)
+
+    def test_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(APIClient().get(reverse('metrics')).status_code, 403)
+            self.assertEqual(APIClient().get(reverse('metrics'), HTTP_X_METRICS_TOKEN='autre').status_code, 403)
+            response = APIClient().get(reverse('metrics'), HTTP_X_METRICS_TOKEN='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+
+    def test_route_labels(self):
+        user = User.objects.create_user('eleve')
+        conversation = Conversation.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get(reverse('get_conversation', args=[conversation.id]))
+        client.get('/api/inconnu/')
+
+        routes = {key[0] for key in metrics.HTTP_REQUESTS._values}
+        # Motif d'URL et non chemin concret : une série par route, pas par conversation
+        self.assertIn('/api/conversation/<int:conversation_id>/', routes)
+        self.assertNotIn(f'/api/conversation/{conversation.id}/', routes)
+        self.assertIn('unmatched', routes)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LoggingTests(TestCase):
+    """Request id, contexte des journaux, format JSON et écriture en arrière-plan"""
+
+    def record(self, msg='Message %s', args=('reçu',), **extra):
+        record = logging.LogRecord('api.tests', logging.INFO, __file__, 1, msg, args, None)
+        for key, value in extra.items():
+            setattr(record, key, value)
+        return record
+
+    def test_request_id_is_validated(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse('health_live'), HTTP_X_REQUEST_ID='abc-123')['X-Request-ID'], 'abc-123')
+        for invalid in ('', 'a' * 65, 'abc 123', 'abc\nfaux: 1', 'abc_123', '<script>'):
+            rid = client.get(reverse('health_live'), HTTP_X_REQUEST_ID=invalid)['X-Request-ID']
+            self.assertNotEqual(rid, invalid)
+            self.assertRegex(rid, r'^[0-9a-f]{32}$')
+
+    def test_context_filter(self):
+        user = User.objects.create_user('eleve')
+        request = RequestFactory().get('/api/conversations/')
+        request.user = user
+        request.resolver_match = mock.Mock(route='api/conversations/')
+        request_token, current_token = logs.request_id.set('rid-1'), logs.current_request.set(request)
+        try:
+            record = self.record()
+            self.assertTrue(logs.RequestContextFilter().filter(record))
+        finally:
+            logs.current_request.reset(current_token)
+            logs.request_id.reset(request_token)
+        self.assertEqual((record.request_id, record.user_id, record.route), ('rid-1', user.id, '/api/conversations/'))
+
+        # Hors requête : champs vides, sans erreur
+        record = self.record()
+        logs.RequestContextFilter().filter(record)
+        self.assertEqual((record.request_id, record.user_id, record.route), (None, None, None))
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self.record(request_id='rid-1', user_id=None, status=200)
+            record.exc_info = sys.exc_info()
+        data = json.loads(logs.JSONFormatter().format(record))
+        self.assertEqual((data['level'], data['logger'], data['message']), ('INFO', 'api.tests', 'Message reçu'))
+        self.assertEqual((data['request_id'], data['status']), ('rid-1', 200))
+        self.assertNotIn('user_id', data)
+        self.assertIn('ValueError: boom', data['exc'])
+
+    def test_background_handler_writes_and_drops_when_full(self):
+        stream = io.StringIO()
+        handler = logs.BackgroundStreamHandler(stream, queue_size=10)
+        handler.setFormatter(logs.JSONFormatter())
+        args = ['premier']
+        record = self.record(args=(args,))
+        handler.emit(record)
+        args.append('modifié')  # message figé au moment de l'appel
+        handler._stop_listener()
+        self.assertEqual(json.loads(stream.getvalue())['message'], "Message ['premier']")
+
+        # Thread d'écriture arrêté, file pleine : l'enregistrement est abandonné sans bloquer
+        full = logs.BackgroundStreamHandler(io.StringIO(), queue_size=1)
+        full._stop_listener()
+        dropped = metrics.LOG_DROPPED._values.get((), 0)
+        full.emit(self.record())
+        full.emit(self.record())
+        self.assertEqual(metrics.LOG_DROPPED._values.get((), 0), dropped + 1)
+
+
+@override_settings(DATABASE_REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Lectures sur les réplicas et collage au primaire après une écriture"""
+    # Pas de transaction englobante : le routeur garde sur le primaire les lectures faites dans une transaction
+
+    def setUp(self):
+        cache.clear()
+        aliases = mock.patch('api.replicas.replica_aliases', return_value=['replica1'])
+        aliases.start()
+        self.addCleanup(aliases.stop)
+        replica = mock.patch.dict(connections._connections.__dict__, {'replica1': mock.MagicMock(errors_occurred=False)})
+        replica.start()
+        self.addCleanup(replica.stop)
+        self.router = replicas.ReplicaRouter()
+        self.routes = []
+        self.middleware = replicas.ReplicaMiddleware(self.view)
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        self.routes.append(self.router.db_for_read(Conversation))
+        return HttpResponse()
+
+    def test_writes_and_background_reads_use_primary(self):
+        self.assertEqual(self.router.db_for_write(Conversation), 'default')
+        # Hors requête (commandes, worker) : primaire
+        self.assertEqual(self.router.db_for_read(Conversation), 'default')
+        with replicas.use_replicas():
+            self.assertEqual(self.router.db_for_read(Conversation), 'replica1')
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Conversation), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'api'))
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        alice = {'HTTP_AUTHORIZATION': 'Bearer alice'}
+        self.middleware(self.factory.get('/api/conversations/', **alice))
+        self.middleware(self.factory.post('/api/chat/', **alice))
+        self.middleware(self.factory.get('/api/conversations/', **alice))
+        self.middleware(self.factory.get('/api/conversations/', HTTP_AUTHORIZATION='Bearer bob'))
+        self.assertEqual(self.routes, ['replica1', 'default', 'default', 'replica1'])
+
+        cache.clear()  # fin de la fenêtre de collage
+        self.middleware(self.factory.get('/api/conversations/', **alice))
+        self.assertEqual(self.routes[-1], 'replica1')
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_new_account_reads_from_primary(self):
+        response = APIClient().post(reverse('register'), {'username': 'nouveau', 'password': 'motdepasse'}, format='json')
+        access = response.json()['tokens']['access']
+        self.middleware(self.factory.get('/api/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {access}'))
+        self.assertEqual(self.routes, ['default'])
+
+    def replica(self):
+        """Vraie connexion « replica1 » sur la base de test, utilisée par le routeur de l'ORM"""
+        default = connections['default']
+        replica = default.__class__({**default.settings_dict}, alias='replica1')
+        self.addCleanup(replica.close)
+        for patcher in (mock.patch.dict(connections._connections.__dict__, {'replica1': replica}),
+                        mock.patch.object(db_router, 'routers', [self.router])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return replica
+
+    def list_conversations(self, request):
+        # Comme les vues de l'API : une erreur de base devient une réponse 500
+        try:
+            ids = list(Conversation.objects.values_list('id', flat=True))
+        except Exception:
+            return HttpResponse(status=500)
+        return HttpResponse(json.dumps(ids))
+
+    def test_replica_lost_during_a_request(self):
+        conversation = Conversation.objects.create(user=User.objects.create_user('awa'))
+        replica = self.replica()
+        middleware = replicas.ReplicaMiddleware(self.list_conversations)
+        self.assertEqual(middleware(self.factory.get('/api/conversations/')).content, f'[{conversation.id}]'.encode())
+
+        # Le serveur du réplica s'arrête : la requête est rejouée sur le primaire
+        with mock.patch.object(replica, 'create_cursor', side_effect=sqlite_base.Database.OperationalError('serveur arrêté')), \
+                mock.patch.object(replica, 'is_usable', return_value=False):
+            response = middleware(self.factory.get('/api/conversations/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, f'[{conversation.id}]'.encode())
+
+        # Écarté pour tous les workers (cache partagé), jusqu'à DATABASE_REPLICA_RETRY_SECONDS
+        self.assertEqual(replicas.unavailable_replicas(), ['replica1'])
+        with replicas.use_replicas():
+            self.assertEqual(replicas.ReplicaRouter().db_for_read(Conversation), 'default')
+            cache.delete(replicas.UNAVAILABLE_KEY + 'replica1')  # délai écoulé
+            self.assertEqual(replicas.ReplicaRouter().db_for_read(Conversation), 'replica1')
+
+    def test_unreachable_replica_is_skipped(self):
+        replica = self.replica()
+        with mock.patch.object(replica, 'get_new_connection', side_effect=sqlite_base.Database.OperationalError('connexion refusée')), \
+                replicas.use_replicas():
+            self.assertEqual(self.router.db_for_read(Conversation), 'default')
+        self.assertEqual(replicas.unavailable_replicas(), ['replica1'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, HEALTH_CACHE_SECONDS=60)
+class HealthTests(TestCase):
+    """Sonde de disponibilité : 503 sur panne bloquante, état dégradé, cache du résultat, disjoncteur"""
+
+    def setUp(self):
+        health._cached = None
+        self.addCleanup(setattr, health, '_cached', None)
+        self.addCleanup(cache.clear)
+
+    def ready(self):
+        return APIClient().get(reverse('health_ready'))
+
+    def test_database_failure_returns_503(self):
+        with mock.patch.dict(health.CHECKS, database=mock.Mock(side_effect=RuntimeError('base injoignable'))):
+            response = self.ready()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(response.json()['checks']['database']['error'], 'base injoignable')
+
+    def test_result_is_cached(self):
+        check = mock.Mock(return_value={})
+        with mock.patch.dict(health.CHECKS, database=check):
+            self.assertEqual(self.ready().status_code, 200)
+            self.assertEqual(self.ready().status_code, 200)
+            self.assertEqual(check.call_count, 1)
+            health._cached_until = 0  # fin de HEALTH_CACHE_SECONDS
+            self.ready()
+        self.assertEqual(check.call_count, 2)
+
+    def test_open_circuit_is_degraded_not_unready(self):
+        service = mock.Mock(client=None, **{'circuit_state.return_value': 'open'})
+        with mock.patch('api.health.get_gemini_service', return_value=service):
+            response = self.ready()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'degraded')
+        self.assertEqual(response.json()['checks']['llm']['circuit'], 'open')
+
+    def test_failed_replica_falls_back_to_primary(self):
+        broken = mock.MagicMock()
+        broken.cursor.side_effect = RuntimeError('réplica injoignable')
+        with mock.patch('api.replicas.replica_aliases', return_value=['replica1']), \
+                mock.patch.dict(connections._connections.__dict__, {'replica1': broken}):
+            response = self.ready()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['checks']['replicas']['unavailable'], ['replica1'])
+            broken.close.assert_called_once()
+
+            # Hors de la transaction du test, comme dans une requête GET
+            router = replicas.ReplicaRouter()
+            with mock.patch.object(connections['default'], 'in_atomic_block', False), replicas.use_replicas():
+                self.assertEqual(router.db_for_read(Conversation), 'default')
+                replicas.set_available('replica1', True)  # sonde suivante réussie
+                self.assertEqual(router.db_for_read(Conversation), 'replica1')
+
+    def test_circuit_breaker_transitions(self):
+        service = gemini_service.GeminiService(api_key='test')
+        service.circuit_threshold, service.circuit_cooldown = 2, 30
+        service.client = mock.Mock()
+        create = service.client.chat.completions.create
+        create.side_effect = RuntimeError('Groq indisponible')
+        with mock.patch('api.gemini_service.time.monotonic', return_value=1000.0) as now:
+            service.generate_response_with_usage('Bonjour')
+            self.assertEqual(service.circuit_state(), 'closed')
+            service.generate_response_with_usage('Bonjour')
+            self.assertEqual(service.circuit_state(), 'open')
+            # Ouvert : plus d'appel à Groq
+            self.assertEqual(service.generate_response_with_usage('Bonjour')[0], gemini_service.FALLBACK_RESPONSE)
+            self.assertEqual(create.call_count, 2)
+
+            now.return_value = 1030.0
+            self.assertEqual(service.circuit_state(), 'half_open')
+            # Essai raté en demi-ouverture : rouvert pour une nouvelle période
+            service.generate_response_with_usage('Bonjour')
+            self.assertEqual((create.call_count, service.circuit_state()), (3, 'open'))
+
+            now.return_value = 1060.0
+            create.side_effect = None
+            create.return_value = mock.Mock(
+                choices=[mock.Mock(message=mock.Mock(content='Réponse'))],
+                usage=mock.Mock(prompt_tokens=1, completion_tokens=2),
+            )
+            self.assertEqual(service.generate_response_with_usage('Bonjour')[0], 'Réponse')
+            self.assertEqual(service.circuit_state(), 'closed')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    """Pool de connexions : réutilisation, taille bornée, durée de vie, vérification"""
+
+    def make_pool(self, **options):
+        return ConnectionPool('test', **{'max_size': 2, 'timeout': 0.05, 'max_lifetime': 60, 'check_after': 60, **options})
+
+    def ping(self, connection):
+        return connection.alive
+
+    def test_released_connection_is_reused(self):
+        pool = self.make_pool()
+        first = pool.acquire(FakeConnection, self.ping)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection, self.ping), first)
+        self.assertEqual(pool.stats(), {'size': 1, 'in_use': 1, 'idle': 0, 'max_size': 2})
+
+    def test_full_pool_times_out(self):
+        pool = self.make_pool()
+        held = [pool.acquire(FakeConnection, self.ping) for _ in range(2)]
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection, self.ping)
+        # Une connexion rendue libère une place
+        pool.release(held[0])
+        self.assertIs(pool.acquire(FakeConnection, self.ping), held[0])
+
+    def test_expired_and_broken_connections_are_replaced(self):
+        pool = self.make_pool(max_lifetime=0)
+        old = pool.acquire(FakeConnection, self.ping)
+        pool.release(old)
+        self.assertTrue(old.closed)
+
+        pool = self.make_pool(check_after=0)
+        broken = pool.acquire(FakeConnection, self.ping)
+        pool.release(broken)
+        broken.alive = False
+        fresh = pool.acquire(FakeConnection, self.ping)
+        self.assertIsNot(fresh, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_unusable_connection_is_not_returned(self):
+        pool = self.make_pool()
+        connection = pool.acquire(FakeConnection, self.ping)
+        pool.release(connection, reusable=False)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_database_wrapper_returns_connection_to_pool(self):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        wrapper_class = type('DatabaseWrapper', (PooledConnectionMixin, sqlite_base.DatabaseWrapper), {})
+        wrapper = wrapper_class(
+            {**connections['default'].settings_dict, 'NAME': path, 'POOL': {'MAX_SIZE': 1}}, alias='pool_test',
+        )
+        self.addCleanup(discard_pool, 'pool_test')
+
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+
+class FakeGroqTests(TestCase):
+    def setUp(self):
+        self.server = FakeGroqServer(latency=0, jitter=0).start()
+        self.addCleanup(self.server.stop)
+
+    def test_groq_client_uses_fake_server(self):
+        service = gemini_service.GeminiService(api_key='test', base_url=self.server.url)
+        text, llm_usage = service.generate_response_with_usage('Combien font 12 + 7 ?')
+        self.assertIn('19', text)
+        self.assertGreater(llm_usage['completion_tokens'], 0)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_streaming_and_injected_errors(self):
+        service = gemini_service.GeminiService(api_key='test', base_url=self.server.url)
+        chunks = service.client.chat.completions.create(model='fake', messages=[{'role': 'user', 'content': 'x'}], stream=True)
+        self.assertIn('19', ''.join(chunk.choices[0].delta.content or '' for chunk in chunks))
+
+        self.server.options['error_rate'] = 1.0
+        service.client = service.client.with_options(max_retries=0)
+        text, _ = service.generate_response_with_usage('Bonjour')
+        self.assertEqual(text, gemini_service.FALLBACK_RESPONSE)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LoadTestTests(TransactionTestCase):
+    """Données de test et scénarios de charge (dans le processus, faux Groq)"""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+    def test_seed_and_mixed_scenario_report(self):
+        counts = loadtest.seed(users=3, conversations=2, messages=4)
+        self.assertEqual(counts['users'], 3)
+        self.assertEqual(Message.objects.count(), counts['messages'])
+
+        # Régime établi : clés des réponses précalculées et profils en cache
+        precomputed.valid_keys()
+        for user_id in User.objects.filter(username__startswith=loadtest.PREFIX).values_list('id', flat=True):
+            profile_cache.get(user_id)
+        # Un seul élève à la fois : la base SQLite des tests (mémoire partagée) refuse
+        # les écritures concurrentes (« database table is locked ») au lieu de les attendre
+        with loadtest.fake_llm(latency=0):
+            samples, elapsed = loadtest.run('mixed', concurrency=1, requests_per_user=8)
+        result = loadtest.report(samples, elapsed, {'scenario': 'mixed', 'concurrency': 1})
+
+        # 8 étapes ; une étape « auth » compte deux requêtes (inscription, connexion)
+        self.assertGreaterEqual(result['total']['requests'], 8)
+        self.assertEqual(result['total']['errors'], 0)
+        for name, row in result['endpoints'].items():
+            self.assertLessEqual(row['queries_per_request'], QUERY_BUDGETS[name])
+            self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+        self.assertEqual(loadtest.compare(result, result)[0][4], 0)
+
+        loadtest.clear()
+        self.assertFalse(User.objects.filter(username__startswith=loadtest.PREFIX).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TrafficTraceTests(TransactionTestCase):
+    """Export anonymisé des conversations et rejeu contre l'API"""
+
+    def setUp(self):
+        user = User.objects.create_user('eleve', password='motdepasse')
+        UserProfile.objects.create(user=user, class_level='cm2')
+        for text in ('Comment calculer 3/4 de 12 ?', 'Et 2/3 de 9 ?', 'comment calculer 3/4  de 12 ?'):
+            conversation = Conversation.objects.create(user=user)
+            Message.objects.create(conversation=conversation, content=text, subject='mathematiques')
+            Message.objects.create(conversation=conversation, content='Réponse', is_user=False, llm_latency_ms=800)
+        archive_conversation(conversation, block_size=10)
+
+    def test_export_is_anonymous_and_keeps_repeats(self):
+        header, events = traces.export_trace()
+        self.assertEqual(header['events'], 3)
+        self.assertEqual([e['conversation'] for e in events], [0, 1, 2])
+        self.assertEqual({e['user'] for e in events}, {0})
+        self.assertEqual(events[0]['class_level'], 'cm2')
+        self.assertEqual(events[2]['llm_latency_ms'], 800)  # message archivé
+        # Même question (casse, espaces) : même empreinte ; aucun texte exporté
+        self.assertEqual(events[0]['question'], events[2]['question'])
+        self.assertNotEqual(events[0]['question'], events[1]['question'])
+        self.assertNotIn('calculer', json.dumps(events))
+
+        fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        traces.write_trace(path, header, events)
+        self.assertEqual(traces.read_trace(path), (header, events))
+
+    def test_replay_drives_chat(self):
+        _, events = traces.export_trace()
+        self.assertEqual(traces.synthetic_message('abc', 40), traces.synthetic_message('abc', 40))
+        self.assertEqual(len(traces.synthetic_message('abc', 40)), 40)
+        self.assertEqual(traces.compress_gaps([{'t': 0}, {'t': 5}, {'t': 3600}], max_gap=10), [0.0, 5.0, 15.0])
+
+        with loadtest.fake_llm(latency=0):
+            result = traces.Replayer(events, speed=1000, concurrency=2).run()
+        self.assertEqual(result['total']['requests'], 3)
+        self.assertEqual(result['total']['errors'], 0)
+        self.assertEqual(result['exceptions'], {})
+        replay_user = User.objects.get(username=f'{traces.REPLAY_PREFIX}0')
+        self.assertEqual(replay_user.profile.class_level, 'cm2')
+        self.assertEqual(replay_user.conversations.count(), 3)
+
+    def test_replay_keeps_each_students_order_and_records_exceptions(self):
+        replayer = traces.Replayer([], concurrency=4)
+        played = []
+
+        def play(event, due):
+            time.sleep(0.002 * (3 - event['n'] % 3))  # les premiers événements sont les plus lents
+            if event['n'] == 2:
+                raise ConnectionError('connexion coupée')
+            with replayer._lock:
+                played.append((event['user'], event['n']))
+
+        replayer._play = play
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for n in range(12):
+                replayer._dispatch(executor, {'user': n % 2, 'n': n}, 0.0)
+        self.assertEqual([n for user, n in played if user == 0], [0, 4, 6, 8, 10])
+        self.assertEqual([n for user, n in played if user == 1], [1, 3, 5, 7, 9, 11])
+        self.assertEqual(replayer.exceptions, {'ConnectionError': 1})
+        self.assertEqual(replayer.samples, [('chat', 0.0, False, None)])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PrecomputedAnswerTests(TestCase):
+    """Réponses précalculées : sélection des questions, calcul borné, service dans le chat"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        usage._pending.clear()
+
+    def ask(self, *questions, class_level='cm1', subject='mathematiques'):
+        conversation = Conversation.objects.create(user=self.user)
+        for question in questions:
+            Message.objects.create(conversation=conversation, content=question, class_level=class_level, subject=subject)
+
+    def test_top_questions_groups_normalized_repeats(self):
+        self.ask('Comment faire une division ?', 'comment faire une  division', 'COMMENT FAIRE UNE DIVISION ?!', 'Et 7 x 8 ?')
+        self.ask('Comment faire une division ?', class_level='cm2')
+        candidates = precomputed.top_questions(min_count=2)
+        self.assertEqual(len(candidates), 1)
+        self.assertEqual(candidates[0]['frequency'], 3)
+        self.assertEqual(candidates[0]['class_level'], 'cm1')
+        self.assertEqual(candidates[0]['key'], precomputed.question_key('comment faire une division'))
+
+    def test_warm_then_serve_without_llm_call(self):
+        self.ask(*['Comment faire une division ?'] * 3)
+        server = FakeGroqServer(latency=0, jitter=0).start()
+        self.addCleanup(server.stop)
+        service = gemini_service.GeminiService(api_key='test', base_url=server.url)
+
+        stats = precomputed.Warmer(service, rate=0).run(precomputed.top_questions())
+        self.assertEqual((stats['calls'], stats['stored']), (1, 1))
+        answer = PrecomputedAnswer.objects.get()
+        self.assertEqual((answer.frequency, answer.model), (3, service.model_name))
+        # Encore valide : pas de nouvel appel
+        self.assertEqual(precomputed.Warmer(service, rate=0).run(precomputed.top_questions())['fresh'], 1)
+        self.assertEqual(server.requests, 1)
+
+        with mock.patch('api.gemini_service.GeminiService.generate_response_with_usage',
+                        return_value=('Réponse', {'prompt_tokens': 10, 'completion_tokens': 5, 'latency_ms': 3})) as generate:
+            response = self.client.post(reverse('chat'), {
+                'message': 'comment faire une division', 'class_level': 'cm1', 'subject': 'mathematiques',
+            }, format='json')
+            other_level = self.client.post(reverse('chat'), {
+                'message': 'Comment faire une division ?', 'class_level': 'cm2', 'subject': 'mathematiques',
+            }, format='json')
+        self.assertEqual(response.json()['response'], answer.answer)
+        self.assertEqual(generate.call_count, 1)  # seulement pour l'autre niveau
+        self.assertEqual(other_level.status_code, 200)
+
+        report = precomputed.hit_report()
+        self.assertEqual(report['first_hour'], {'answers': 2, 'hits': 1, 'hit_rate': 0.5})
+        self.assertEqual(report['upstream_calls_avoided'], 1)
+
+    def test_warmer_stops_at_call_budget_and_window(self):
+        candidates = [
+            {'class_level': '', 'subject': '', 'question': f'Question {i}', 'key': str(i), 'frequency': 3}
+            for i in range(5)
+        ]
+        service = mock.Mock(model_name='fake', **{
+            'circuit_state.return_value': 'closed',
+            'generate_response_with_usage.return_value': ('Réponse', {'prompt_tokens': 1, 'completion_tokens': 2}),
+        })
+        stats = precomputed.Warmer(service, rate=0, max_calls=2).run(candidates)
+        self.assertEqual((stats['calls'], stats['stored'], stats['stopped']), (2, 2, 'max_calls'))
+
+        with override_settings(PRECOMPUTED_WARM_WINDOW='22:00-06:00'):
+            inside, end = precomputed.warm_window(timezone.make_aware(timezone.datetime(2026, 3, 2, 23, 30)))
+            self.assertTrue(inside)
+            self.assertEqual((end.day, end.hour), (3, 6))
+            self.assertFalse(precomputed.warm_window(timezone.make_aware(timezone.datetime(2026, 3, 2, 9, 0)))[0])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProfileCacheTests(TestCase):
+    """Cache des profils : lecture en une requête, écriture directe, invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve', 'eleve@exemple.com', 'motdepasse')
+        self.profile = UserProfile.objects.create(user=self.user, class_level='cm1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_get_reads_user_and_profile_once(self):
+        with self.assertNumQueries(1):
+            data = profile_cache.get(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(profile_cache.get(self.user.id), data)
+        self.assertEqual(data['profile']['class_level'], 'cm1')
+
+    def test_update_profile_writes_through(self):
+        profile_cache.get(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('update_profile'), {'class_level': 'cm2', 'phone': '+226 70000000'}, format='json')
+        self.assertEqual(response.json()['user']['profile']['class_level'], 'cm2')
+        with self.assertNumQueries(0):
+            data = profile_cache.get(self.user.id)
+        self.assertEqual((data['profile']['class_level'], data['profile']['phone']), ('cm2', '+226 70000000'))
+
+    def test_other_saves_invalidate(self):
+        profile_cache.get(self.user.id)
+        # Connexion : last_login seul, l'entrée reste valide
+        self.assertEqual(APIClient().post(reverse('login'), {'username': 'eleve', 'password': 'motdepasse'}, format='json').status_code, 200)
+        with self.assertNumQueries(0):
+            profile_cache.get(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.avatar = 'lion'
+            self.profile.save()  # admin, commande...
+        self.assertEqual(profile_cache.get(self.user.id)['profile']['avatar'], 'lion')
+
+    def test_invalidation_waits_for_commit(self):
+        profile_cache.get(self.user.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.user.email = 'nouveau@exemple.com'
+                self.user.save()  # admin : le User entier est sauvegardé
+                # Avant la validation, l'entrée est encore là : une relecture ne peut pas
+                # remettre en cache une version que d'autres connexions ne voient pas
+                with self.assertNumQueries(0):
+                    self.assertEqual(profile_cache.get(self.user.id)['email'], 'eleve@exemple.com')
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(profile_cache.get(self.user.id)['email'], 'nouveau@exemple.com')
+
+    def test_rolled_back_save_keeps_entry(self):
+        profile_cache.get(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.profile.class_level = 'cm2'
+                    self.profile.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(profile_cache.get(self.user.id)['profile']['class_level'], 'cm1')
+
+    def test_conversation_etag_follows_profile(self):
+        conversation = Conversation.objects.create(user=self.user)
+        url = reverse('get_conversation', args=[conversation.id])
+        first = self.client.get(url)
+        self.assertEqual(json.loads(first.content)['user']['profile']['class_level'], 'cm1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('update_profile'), {'class_level': 'cm2'}, format='json')
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(json.loads(second.content)['user']['profile']['class_level'], 'cm2')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, TRACING_SAMPLE_RATE=1.0)
+class TracingTests(TestCase):
+    """Spans des requêtes échantillonnées (vue, SQL, JWT, Groq) exportés en OTLP/JSON"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('eleve', password='motdepasse')
+        UserProfile.objects.create(user=self.user, class_level='cm1')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'traces.jsonl')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def tearDown(self):
+        usage._pending.clear()
+
+    def exported_spans(self):
+        tracing.get_exporter().flush()
+        with open(self.path) as f:
+            documents = [json.loads(line) for line in f]
+        return [
+            span for document in documents
+            for resource in document['resourceSpans'] for scope in resource['scopeSpans'] for span in scope['spans']
+        ]
+
+    def test_chat_turn_spans(self):
+        with override_settings(TRACING_EXPORT=self.path), loadtest.fake_llm(latency=0) as server:
+            response = self.client.post(reverse('chat'), {'message': 'Combien font 12 + 7 ?'}, format='json', HTTP_X_REQUEST_ID='req-42')
+        self.assertEqual(response.status_code, 200)
+        spans = {span['name']: span for span in self.exported_spans()}
+        root = spans['POST /api/chat/']
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual(response['X-Trace-ID'], root['traceId'])
+        self.assertIn({'key': 'request.id', 'value': {'stringValue': 'req-42'}}, root['attributes'])
+        for name in ('auth.jwt', 'view.chat', 'INSERT api_message', 'groq.chat.completions'):
+            self.assertEqual(spans[name]['traceId'], root['traceId'], name)
+        self.assertEqual(spans['groq.chat.completions']['parentSpanId'], spans['view.chat']['spanId'])
+        self.assertEqual(spans['view.chat']['parentSpanId'], root['spanId'])
+        # Le request id et le contexte de trace sont transmis à Groq
+        self.assertEqual(server.last_headers['X-Request-ID'], 'req-42')
+        self.assertIn(spans['groq.chat.completions']['spanId'], server.last_headers['traceparent'])
+
+    def test_sampling(self):
+        trace_id, parent_id = 'ab' * 16, 'cd' * 8
+        traceparent = f'00-{trace_id}-{parent_id}-01'
+        with override_settings(TRACING_EXPORT=self.path, TRACING_SAMPLE_RATE=0.0):
+            self.assertNotIn('X-Trace-ID', self.client.get(reverse('get_profile')))
+            # Client quelconque : son traceparent ne force pas le traçage
+            self.assertNotIn('X-Trace-ID', self.client.get(reverse('get_profile'), HTTP_TRACEPARENT=traceparent))
+            with override_settings(TRACING_TRUSTED_PROXIES=['10.0.0.0/8']):
+                self.assertNotIn('X-Trace-ID', self.client.get(reverse('get_profile'), HTTP_TRACEPARENT=traceparent))
+                # Appelant de confiance déjà tracé : la trace est poursuivie malgré le taux nul
+                response = self.client.get(reverse('get_profile'), HTTP_TRACEPARENT=traceparent, REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response['X-Trace-ID'], trace_id)
+        root = [span for span in self.exported_spans() if span['name'].startswith('GET')][0]
+        self.assertEqual(root['parentSpanId'], parent_id)
+
+        # Sans TRACING_EXPORT, le middleware n'est pas chargé
+        self.assertNotIn('X-Trace-ID', APIClient().get(reverse('health_check')))
+        self.assertIs(tracing.span('inutile'), tracing._NULL_SPAN)
+
+    def test_trusted_proxies_check(self):
+        with override_settings(TRACING_TRUSTED_PROXIES=['10.0.0.0/8', '::1', 'passerelle']):
+            self.assertEqual([error.id for error in checks.check_tracing_proxies(None)], ['api.E002'])
+
+
+class QueryProfilerTests(TestCase):
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_find_n_plus_one(self):
+        queries = [{'sql': f'SELECT * FROM t WHERE id = {i}', 'time': '0.001'} for i in range(6)]
+        queries.append({'sql': 'SELECT 1', 'time': '0.001'})
+        groups = find_n_plus_one(queries, threshold=5)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['count'], 6)
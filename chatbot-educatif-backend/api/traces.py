@@ -0,0 +1,330 @@
+"""
+Traces de trafic réel (manage.py export_trace, manage.py replay_trace).
+
+`export_trace` relit les messages des élèves (archives comprises) et écrit
+une trace anonymisée au format JSON Lines : instant relatif, élève et
+conversation renumérotés, niveau, matière, longueurs, et une empreinte
+salée de la question (le sel n'est pas conservé) qui permet de retrouver
+les questions répétées sans leur texte.
+
+`Replayer` rejoue la trace contre l'API (dans le processus avec le faux
+Groq, ou un serveur lancé à part), en temps réel ou accéléré, avec un texte
+de synthèse de même longueur : une même question produit le même texte,
+les caches la retrouvent comme en production. Le rapport reprend celui de
+api.loadtest, avec le retard pris sur la trace et les taux de succès des caches.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+
+from . import loadtest
+from .archive import archived_messages
+from .models import Conversation, Task, UserProfile
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+REPLAY_PREFIX = f'{loadtest.PREFIX}replay'
+
+_VOCABULARY = sorted({
+    word.strip('?,.:!').lower()
+    for sentence in loadtest.QUESTIONS + loadtest.ANSWER_SENTENCES
+    for word in sentence.split()
+    if len(word) > 2
+})
+
+
+# ---------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------
+def _fingerprint(text, salt):
+    normalized = ' '.join(text.lower().split())
+    return hmac.new(salt, normalized.encode(), hashlib.sha256).hexdigest()[:12]
+
+
+def export_trace(since=None, until=None, chunk_size=200):
+    """
+    (en-tête, événements) : un événement par message d'élève, triés dans le temps.
+    `since` / `until` bornent la date des messages.
+    """
+    salt = secrets.token_bytes(16)
+    conversations = Conversation.objects.select_related('user__profile').prefetch_related('archive_blocks', 'messages')
+    if since:
+        conversations = conversations.filter(updated_at__gte=since)
+
+    raw = []
+    for conversation in conversations.order_by('id').iterator(chunk_size=chunk_size):
+        profile = getattr(conversation.user, 'profile', None)
+        messages = archived_messages(conversation) + sorted(conversation.messages.all(), key=lambda m: (m.timestamp, m.id))
+        turn = 0
+        for index, message in enumerate(messages):
+            if not message.is_user:
+                continue
+            if (since and message.timestamp < since) or (until and message.timestamp >= until):
+                turn += 1
+                continue
+            reply = messages[index + 1] if index + 1 < len(messages) and not messages[index + 1].is_user else None
+            raw.append((message.timestamp, conversation.user_id, conversation.id, {
+                'turn': turn,
+                'class_level': message.class_level or (profile.class_level if profile else None),
+                'subject': message.subject,
+                'length': len(message.content),
+                'question': _fingerprint(message.content, salt),
+                'response_length': len(reply.content) if reply else None,
+                'llm_latency_ms': reply.llm_latency_ms if reply else None,
+            }))
+            turn += 1
+
+    raw.sort(key=lambda row: (row[0], row[2]))
+    users, conversation_numbers, events = {}, {}, []
+    start = raw[0][0] if raw else None
+    for timestamp, user_id, conversation_id, fields in raw:
+        events.append({
+            't': round((timestamp - start).total_seconds(), 3),
+            'user': users.setdefault(user_id, len(users)),
+            'conversation': conversation_numbers.setdefault(conversation_id, len(conversation_numbers)),
+            **fields,
+        })
+
+    header = {
+        'version': TRACE_VERSION,
+        'exported_at': timezone.now().isoformat(timespec='seconds'),
+        # Heure de début (sans les secondes) : garde le rythme de la journée scolaire
+        'start': start.replace(minute=0, second=0, microsecond=0).isoformat() if start else None,
+        'events': len(events),
+        'users': len(users),
+        'conversations': len(conversation_numbers),
+        'span_seconds': events[-1]['t'] if events else 0,
+    }
+    return header, events
+
+
+def _open(path, mode):
+    return gzip.open(path, mode + 't', encoding='utf-8') if path.endswith('.gz') else open(path, mode, encoding='utf-8')
+
+
+def write_trace(path, header, events):
+    with _open(path, 'w') as f:
+        f.write(json.dumps(header) + '\n')
+        for event in events:
+            f.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+
+def read_trace(path):
+    with _open(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Version de trace non prise en charge: {header.get('version')}")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------------------------------------------------------
+# Rejeu
+# ---------------------------------------------------------------
+def synthetic_message(question, length):
+    """Texte de synthèse de `length` caractères, identique pour une même empreinte"""
+    rng = random.Random(question)
+    words = []
+    size = -1
+    while size < length:
+        words.append(rng.choice(_VOCABULARY))
+        size += len(words[-1]) + 1
+    return (' '.join(words)[:max(1, length - 2)].rstrip() + ' ?').capitalize()
+
+
+def compress_gaps(events, max_gap):
+    """Instants de rejeu : les silences (nuits, week-ends) sont ramenés à `max_gap` secondes"""
+    times, previous, current = [], None, 0.0
+    for event in events:
+        if previous is not None:
+            current += min(event['t'] - previous, max_gap) if max_gap else event['t'] - previous
+        times.append(current)
+        previous = event['t']
+    return times
+
+
+def prepare_accounts(events):
+    """Comptes `bench_replay<n>` des élèves de la trace (créés s'ils n'existent pas)"""
+    levels = {}
+    for event in events:
+        levels.setdefault(event['user'], Counter())[event['class_level']] += 1
+    usernames = {user: f'{REPLAY_PREFIX}{user}' for user in levels}
+    existing = set(User.objects.filter(username__in=usernames.values()).values_list('username', flat=True))
+    missing = [user for user, username in usernames.items() if username not in existing]
+    if missing:
+        password = make_password(loadtest.PASSWORD)
+        User.objects.bulk_create([User(username=usernames[user], password=password) for user in missing], batch_size=500)
+        ids = dict(User.objects.filter(username__in=[usernames[user] for user in missing]).values_list('username', 'id'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=ids[usernames[user]], class_level=levels[user].most_common(1)[0][0])
+            for user in missing
+        ], batch_size=500)
+    return usernames
+
+
+class Replayer:
+    """Rejoue une trace ; `run()` retourne le rapport (format de api.loadtest.report)"""
+
+    def __init__(self, events, speed=1.0, max_gap=None, concurrency=50, url=None):
+        self.events = events
+        self.speed = speed
+        self.max_gap = max_gap
+        self.concurrency = concurrency
+        self.url = url
+        self.samples = []
+        self.lags = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._clients = []
+        # Événements en attente par élève, joués dans l'ordre par une seule tâche à la fois
+        self._queues = {}
+        self.exceptions = Counter()
+        self._tokens = {}
+        self._conversations = {}
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = loadtest.HttpClient(self.url) if self.url else loadtest.InProcessClient()
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _record(self, name, elapsed, ok, queries):
+        with self._lock:
+            self.samples.append((name, elapsed, ok, queries))
+
+    def _record_exception(self, exc):
+        logger.warning("Événement de la trace en échec: %r", exc)
+        with self._lock:
+            self.exceptions[type(exc).__name__] += 1
+        self._record('chat', 0.0, False, None)
+
+    def _dispatch(self, executor, event, due):
+        """Met l'événement dans la file de son élève ; lance une tâche si aucune ne la vide"""
+        with self._lock:
+            pending = self._queues.setdefault(event['user'], deque())
+            pending.append((event, due))
+            if len(pending) > 1:
+                return None
+        return executor.submit(self._drain, pending)
+
+    def _drain(self, pending):
+        """Joue les événements d'un élève dans l'ordre de la trace, jusqu'à vider sa file"""
+        while True:
+            with self._lock:
+                event, due = pending[0]
+            try:
+                self._play(event, due)
+            except Exception as e:
+                self._record_exception(e)
+            with self._lock:
+                pending.popleft()
+                if not pending:
+                    return
+
+    def _play(self, event, due):
+        with self._lock:
+            self.lags.append(max(0.0, time.monotonic() - due))
+        client = self._client()
+        token = self._tokens.get(event['user'])
+        if token is None:
+            status, data, _ = client.request(
+                'POST', reverse('login'), {'username': self.usernames[event['user']], 'password': loadtest.PASSWORD},
+            )
+            if status != 200:
+                self._record('chat', 0.0, False, None)
+                return
+            token = self._tokens[event['user']] = data['tokens']['access']
+
+        body = {'message': synthetic_message(event['question'], event['length'])}
+        if event['class_level']:
+            body['class_level'] = event['class_level']
+        if event['subject']:
+            body['subject'] = event['subject']
+        if event['conversation'] in self._conversations:
+            body['conversation_id'] = self._conversations[event['conversation']]
+
+        started = time.perf_counter()
+        status, data, queries = client.request('POST', reverse('chat'), body, token)
+        self._record('chat', time.perf_counter() - started, status == 200, queries)
+        if status == 200:
+            self._conversations.setdefault(event['conversation'], data['conversation_id'])
+
+    def run(self):
+        self.usernames = prepare_accounts(self.events)
+        times = compress_gaps(self.events, self.max_gap)
+        caches_before = loadtest.read_counters('cache_requests_total', self.url)
+        replay_started_at = timezone.now()
+
+        started = time.monotonic()
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for event, at in zip(self.events, times):
+                due = started + at / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                future = self._dispatch(executor, event, due)
+                if future is not None:
+                    futures.append(future)
+        elapsed = time.monotonic() - started
+        for future in futures:
+            if future.exception() is not None:
+                self._record_exception(future.exception())
+        for client in self._clients:
+            if isinstance(client, loadtest.HttpClient):
+                client.close()
+
+        result = loadtest.report(self.samples, elapsed, {
+            'url': self.url,
+            'scenario': 'replay',
+            'concurrency': self.concurrency,
+            'speed': self.speed,
+            'max_gap_s': self.max_gap,
+            'events': len(self.events),
+        })
+        # Retard sur la trace : le système (ou le pool de rejeu) ne suit plus la charge
+        lags = sorted(self.lags)
+        result['lag'] = {
+            'p50_ms': round(loadtest.percentile(lags, 50) * 1000, 2) if lags else None,
+            'p95_ms': round(loadtest.percentile(lags, 95) * 1000, 2) if lags else None,
+            'max_ms': round(lags[-1] * 1000, 2) if lags else None,
+        }
+        result['cache'] = _cache_rates(caches_before, loadtest.read_counters('cache_requests_total', self.url))
+        # Exceptions levées par le rejeu lui-même (réseau, client...), par type
+        result['exceptions'] = dict(sorted(self.exceptions.items()))
+        # Tâches d'arrière-plan enfilées pendant le rejeu (résumés, usage...), base locale
+        result['tasks_enqueued'] = dict(
+            Task.objects.filter(created_at__gte=replay_started_at - timedelta(seconds=1))
+            .values_list('name').annotate(n=Count('id')).order_by('name')
+        )
+        return result
+
+
+def _cache_rates(before, after):
+    counts = {}
+    for labels, value in after.items():
+        delta = value - before.get(labels, 0)
+        labels = dict(labels)
+        entry = counts.setdefault(labels.get('cache', ''), {'hits': 0, 'misses': 0})
+        entry['hits' if labels.get('result') == 'hit' else 'misses'] += int(delta)
+    for entry in counts.values():
+        total = entry['hits'] + entry['misses']
+        entry['hit_rate'] = round(entry['hits'] / total, 4) if total else None
+    return dict(sorted(counts.items()))
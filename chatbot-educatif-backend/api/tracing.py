@@ -0,0 +1,404 @@
+"""
+Traces des requêtes (spans) au format OpenTelemetry (OTLP/JSON).
+
+TracingMiddleware ouvre un span racine pour une fraction des requêtes
+(TRACING_SAMPLE_RATE) ; l'en-tête W3C `traceparent` n'est suivi que s'il
+vient d'une adresse de TRACING_TRUSTED_PROXIES (passerelle, service appelant) ;
+dans une requête échantillonnée, chaque requête SQL, l'authentification JWT,
+les vues décorées par `traced()` et les appels Groq deviennent des spans
+enfants. La trace terminée est déposée dans une file et écrite par un
+thread d'arrière-plan vers TRACING_EXPORT : un fichier (un document
+ExportTraceServiceRequest par ligne, format du « file exporter » OTel) ou
+une URL OTLP/HTTP (http://collecteur:4318/v1/traces).
+
+Hors échantillonnage, `span()` et `traced()` ne coûtent qu'une lecture de
+ContextVar ; sans TRACING_EXPORT, le middleware est retiré de la chaîne.
+
+TracedJWTAuthentication est ici et non dans api.authentication : DRF
+importe les classes d'authentification avant les vues.
+"""
+import atexit
+import contextvars
+import functools
+import ipaddress
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import logs, metrics
+from .middleware import route_name
+from .profiling import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Types de span OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# Au-delà, les spans d'une trace (N+1...) sont comptés mais pas conservés
+MAX_SPANS_PER_TRACE = 1000
+STATEMENT_MAX_CHARS = 1000
+EXPORT_BATCH_SIZE = 50
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+[`"]?(\w+)', re.IGNORECASE)
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+
+
+class _Trace:
+    """Spans terminés d'une requête échantillonnée"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.root = None
+        self.spans = []
+        self.dropped = 0
+
+
+class Span:
+    def __init__(self, trace, name, parent_id=None, kind=KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = None
+        self.events = []
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = {'code': STATUS_ERROR, 'message': str(exc)[:200]}
+        self.events.append({
+            'timeUnixNano': str(time.time_ns()),
+            'name': 'exception',
+            'attributes': _attributes({'exception.type': type(exc).__name__, 'exception.message': str(exc)[:200]}),
+        })
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.record_exception(exc)
+        _current.reset(self._token)
+        if self is self.trace.root or len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped += 1
+        return False
+
+    def to_otlp(self):
+        data = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _attributes(self.attributes),
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        if self.status:
+            data['status'] = self.status
+        if self.events:
+            data['events'] = self.events
+        return data
+
+
+class _NullSpan:
+    """Span d'une requête non échantillonnée : ne fait rien"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    `with tracing.span('chat.llm', model=...) as s:` — span enfant du span
+    en cours, ou rien si la requête n'est pas échantillonnée.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NULL_SPAN
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+def traced(name=None):
+    """Décorateur : un span autour de chaque appel (nom par défaut : module.fonction)"""
+
+    def decorator(func):
+        span_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def outgoing_headers():
+    """En-têtes à transmettre à un service appelé (request id, contexte W3C)"""
+    headers = {}
+    rid = logs.request_id.get()
+    if rid:
+        headers['X-Request-ID'] = rid
+    current = _current.get()
+    if current is not None:
+        headers['traceparent'] = f'00-{current.trace.trace_id}-{current.span_id}-01'
+    return headers
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(values):
+    return [{'key': key, 'value': _attribute_value(value)} for key, value in values.items() if value is not None]
+
+
+def to_otlp(traces):
+    """Document ExportTraceServiceRequest (OTLP/JSON) pour une liste de traces"""
+    spans = [s.to_otlp() for trace in traces for s in trace.spans]
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _attributes({
+                'service.name': settings.TRACING_SERVICE_NAME,
+                'process.pid': os.getpid(),
+            })},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }],
+    }
+
+
+# ---------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------
+class _Exporter:
+    """Écrit les traces terminées depuis un thread d'arrière-plan (file bornée, jamais bloquante)"""
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._start()
+        atexit.register(self.flush)
+        # Après un fork (gunicorn --preload), le thread d'écriture n'existe plus
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = threading.Thread(target=self._run, name='tracing-export', daemon=True)
+        self.thread.start()
+
+    def submit(self, trace):
+        try:
+            # Destination figée au dépôt de la trace
+            self.queue.put_nowait((settings.TRACING_EXPORT, trace))
+        except queue.Full:
+            metrics.TRACES_EXPORTED.inc(result='dropped')
+
+    def flush(self):
+        """Attend l'écriture des traces déjà déposées"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            targets = {}
+            for target, trace in batch:
+                targets.setdefault(target, []).append(trace)
+            try:
+                for target, traces in targets.items():
+                    self.write(target, traces)
+                metrics.TRACES_EXPORTED.inc(len(batch), result='exported')
+            except Exception as e:
+                logger.warning("Export des traces impossible: %s", e)
+                metrics.TRACES_EXPORTED.inc(len(batch), result='error')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, target, traces):
+        body = json.dumps(to_otlp(traces), separators=(',', ':'))
+        if target.startswith(('http://', 'https://')):
+            request = urllib.request.Request(
+                target, data=body.encode(), headers={'Content-Type': 'application/json'}, method='POST',
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        elif target:
+            with self._lock, open(target, 'a', encoding='utf-8') as f:
+                f.write(body + '\n')
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = _Exporter(settings.TRACING_QUEUE_SIZE)
+        return _exporter
+
+
+# ---------------------------------------------------------------
+# Requêtes HTTP et SQL
+# ---------------------------------------------------------------
+def _db_span(execute, sql, params, many, context):
+    """execute_wrapper : un span par requête SQL (texte normalisé, sans les valeurs)"""
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    statement = normalize_sql(sql)
+    operation = statement.split(' ', 1)[0].upper()
+    table = _TABLE_RE.search(statement)
+    name = f'{operation} {table.group(1)}' if table else operation
+    connection = context['connection']
+    with span(name, KIND_CLIENT, **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.operation': operation,
+        'db.statement': statement[:STATEMENT_MAX_CHARS],
+        'db.executemany': many or None,
+    }):
+        return execute(sql, params, many, context)
+
+
+@functools.lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def trusted_source(request):
+    """Vrai si la requête vient d'une adresse de TRACING_TRUSTED_PROXIES"""
+    proxies = settings.TRACING_TRUSTED_PROXIES
+    if not proxies:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in network for network in _networks(tuple(proxies)))
+
+
+def _sampled(request):
+    """(trace_id, parent_span_id) si la requête est échantillonnée, sinon None"""
+    match = _TRACEPARENT_RE.match(request.headers.get('traceparent', ''))
+    # Un client quelconque ne décide ni du traçage (coût, volume exporté) ni de l'id de trace
+    if match and trusted_source(request):
+        if int(match.group(3), 16) & 1:
+            return match.group(1), match.group(2)
+        return None
+    rate = settings.TRACING_SAMPLE_RATE
+    if rate >= 1 or (rate > 0 and random.random() < rate):
+        return f'{random.getrandbits(128):032x}', None
+    return None
+
+
+class TracingMiddleware:
+    """
+    Span racine des requêtes échantillonnées (à placer après
+    RequestContextMiddleware pour reprendre le request id), avec un span par
+    requête SQL. Sans TRACING_EXPORT, le middleware n'est pas chargé.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRACING_EXPORT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = _sampled(request)
+        if sampled is None:
+            return self.get_response(request)
+
+        trace = _Trace(sampled[0])
+        root = trace.root = Span(trace, request.method, sampled[1], KIND_SERVER, {
+            'http.request.method': request.method,
+            'url.path': request.path,
+            'request.id': getattr(request, 'request_id', None),
+        })
+        with root, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_db_span))
+            response = self.get_response(request)
+            route = route_name(request)
+            root.name = f'{request.method} {route}'
+            root.set_attribute('http.route', route)
+            root.set_attribute('http.response.status_code', response.status_code)
+            user = getattr(request, 'user', None)
+            if user is not None and getattr(user, 'is_authenticated', False):
+                root.set_attribute('enduser.id', str(user.id))
+            if response.status_code >= 500:
+                root.status = {'code': STATUS_ERROR, 'message': ''}
+        if trace.dropped:
+            root.set_attribute('tracing.dropped_spans', trace.dropped)
+
+        response['X-Trace-ID'] = trace.trace_id
+        get_exporter().submit(trace)
+        return response
+
+
+class TracedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication avec un span autour de la vérification du jeton (et de la lecture de l'utilisateur)"""
+
+    def authenticate(self, request):
+        with span('auth.jwt'):
+            return super().authenticate(request)
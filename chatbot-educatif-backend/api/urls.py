@@ -1,11 +1,12 @@
 # api/urls.py - CORRIGEZ CE FICHIER
 from django.urls import path
 from . import views
-from .authentication import register, login, logout, get_profile, update_profile
+from .authentication import register, bulk_register, login, logout, get_profile, update_profile
 
 urlpatterns = [
     # Authentication
     path('auth/register/', register, name='register'),
+    path('auth/bulk-register/', bulk_register, name='bulk_register'),
     path('auth/login/', login, name='login'),
     path('auth/logout/', logout, name='logout'),
     path('auth/profile/', get_profile, name='get_profile'),
@@ -16,7 +17,14 @@ urlpatterns = [
     path('conversation/<int:conversation_id>/', views.get_conversation, name='get_conversation'),
     path('conversations/', views.get_user_conversations, name='get_user_conversations'),
     path('conversation/<int:conversation_id>/delete/', views.delete_conversation, name='delete_conversation'),
+    path('sync/', views.sync_changes, name='sync'),
+    path('export/', views.export_history, name='export'),
     
     # Health check
     path('health/', views.health_check, name='health_check'),
+    path('health/live/', views.health_live, name='health_live'),
+    path('health/ready/', views.health_ready, name='health_ready'),
+    
+    # Métriques Prometheus
+    path('metrics/', views.metrics_endpoint, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Comptabilité de la consommation de l'IA et budgets quotidiens.
+
+Les compteurs du jour sont tenus dans le cache (lecture rapide pour contrôler
+les budgets avant l'appel Groq) et accumulés en mémoire, puis confiés par lots
+à la file de tâches qui les écrit dans `DailyUsage` : le chemin du chat
+n'attend aucune de ces écritures.
+
+Le cache doit être partagé entre les workers (CACHE_URL, contrôle api.E001).
+Un compteur absent du cache (redémarrage, éviction) est reconstitué depuis
+`DailyUsage` et les compteurs de ce processus pas encore écrits ; seuls les
+lots déjà enfilés mais pas encore traités par le worker échappent au calcul.
+
+À l'arrêt d'un worker gunicorn, les compteurs en mémoire sont enfilés par
+le hook `worker_exit` (gunicorn.conf.py), tant que Django est encore chargé.
+"""
+import logging
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import taskqueue
+from .models import DailyUsage
+
+logger = logging.getLogger(__name__)
+
+# Les compteurs du cache couvrent la journée en cours (+ marge)
+COUNTER_TIMEOUT = 60 * 60 * 48
+
+_pending = {}
+# Jetons pas encore écrits par niveau de classe : {(niveau, jour): jetons}
+_pending_classes = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _user_key(user_id, day):
+    return f"usage:user:{day.isoformat()}:{user_id}"
+
+
+def _class_key(class_level, day):
+    return f"usage:class:{day.isoformat()}:{class_level}"
+
+
+def _user_tokens(user_id, day):
+    """Jetons consommés par l'élève ce jour-là, d'après la base et les compteurs non écrits"""
+    row = DailyUsage.objects.filter(user_id=user_id, date=day).values_list('prompt_tokens', 'completion_tokens').first()
+    total = sum(row) if row else 0
+    with _pending_lock:
+        counters = _pending.get((user_id, day))
+        if counters:
+            total += counters[1] + counters[2]
+    return total
+
+
+def _class_tokens(class_level, day):
+    """Jetons consommés par les élèves d'un niveau ce jour-là (base et compteurs non écrits)"""
+    total = DailyUsage.objects.filter(date=day, user__profile__class_level=class_level).aggregate(
+        tokens=Sum(F('prompt_tokens') + F('completion_tokens')),
+    )['tokens'] or 0
+    with _pending_lock:
+        total += _pending_classes.get((class_level, day), 0)
+    return total
+
+
+def _counter(key, load):
+    """Compteur du cache, reconstitué par `load()` s'il est absent"""
+    value = cache.get(key)
+    if value is None:
+        # add : un autre worker a pu le reconstituer (et l'incrémenter) entre-temps
+        cache.add(key, load(), COUNTER_TIMEOUT)
+        value = cache.get(key, 0)
+    return value
+
+
+def _incr(key, amount, load):
+    """Incrémente un compteur du cache en le reconstituant au besoin"""
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, load(), COUNTER_TIMEOUT)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # La clé a expiré entre add() et incr()
+        cache.set(key, amount, COUNTER_TIMEOUT)
+        return amount
+
+
+def check_budget(user_id, class_level=None):
+    """
+    Vérifie les budgets quotidiens avant un appel à l'IA ; `class_level` est
+    le niveau du profil de l'élève (pas celui, facultatif, de la requête).
+    Retourne None si l'appel est autorisé, sinon un message d'erreur.
+    """
+    user_budget = settings.USAGE_USER_DAILY_TOKENS
+    class_budget = settings.USAGE_CLASS_DAILY_TOKENS.get(class_level) if class_level else None
+    if not user_budget and not class_budget:
+        return None
+
+    day = timezone.localdate()
+    if user_budget and _counter(_user_key(user_id, day), lambda: _user_tokens(user_id, day)) >= user_budget:
+        return "Tu as atteint ta limite quotidienne de questions. Reviens demain ! 📚"
+    if class_budget and _counter(_class_key(class_level, day), lambda: _class_tokens(class_level, day)) >= class_budget:
+        return "La limite quotidienne de ta classe est atteinte. Reviens demain ! 📚"
+    return None
+
+
+def record_usage(user_id, class_level, usage):
+    """
+    Enregistre la consommation d'un appel (dict retourné par
+    GeminiService.generate_response_with_usage).
+    """
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    completion_tokens = usage.get('completion_tokens') or 0
+    latency_ms = usage.get('latency_ms') or 0
+    total = prompt_tokens + completion_tokens
+    day = timezone.localdate()
+
+    # Compteurs du cache (seulement pour les budgets configurés) d'abord :
+    # une reconstitution ne compte pas deux fois cet appel
+    if total and settings.USAGE_USER_DAILY_TOKENS:
+        _incr(_user_key(user_id, day), total, lambda: _user_tokens(user_id, day))
+    if total and class_level and settings.USAGE_CLASS_DAILY_TOKENS.get(class_level):
+        _incr(_class_key(class_level, day), total, lambda: _class_tokens(class_level, day))
+
+    with _pending_lock:
+        counters = _pending.setdefault((user_id, day), [0, 0, 0, 0])
+        counters[0] += 1
+        counters[1] += prompt_tokens
+        counters[2] += completion_tokens
+        counters[3] += latency_ms
+        if class_level and total:
+            _pending_classes[class_level, day] = _pending_classes.get((class_level, day), 0) + total
+        should_flush = (
+            len(_pending) >= settings.USAGE_FLUSH_BATCH_SIZE
+            or time.monotonic() - _last_flush >= settings.USAGE_FLUSH_INTERVAL
+        )
+
+    if should_flush:
+        flush_usage()
+
+
+def flush_usage():
+    """
+    Enfile les compteurs accumulés depuis le dernier lot (tâche `usage.flush`) :
+    la requête qui déclenche le lot n'ajoute qu'un INSERT, le worker fait les écritures
+    """
+    global _pending, _pending_classes, _last_flush
+    with _pending_lock:
+        batch, _pending = _pending, {}
+        _pending_classes = {}
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+
+    rows = [[user_id, day.isoformat(), *counters] for (user_id, day), counters in batch.items()]
+    try:
+        taskqueue.enqueue('usage.flush', {'rows': rows})
+    except Exception as e:
+        logger.error("Erreur lors de l'enfilage de la consommation: %s", e)
+        return 0
+
+    return len(batch)
+
+
+@taskqueue.task('usage.flush', batch=True)
+def write_usage(payloads):
+    """Écrit en base les lots enfilés par flush_usage (fusionnés par utilisateur et par jour)"""
+    totals = {}
+    for payload in payloads:
+        for user_id, day, *counters in payload['rows']:
+            current = totals.setdefault((user_id, date.fromisoformat(day)), [0, 0, 0, 0])
+            for i, value in enumerate(counters):
+                current[i] += value
+
+    DailyUsage.objects.bulk_create(
+        [DailyUsage(user_id=user_id, date=day) for user_id, day in totals],
+        ignore_conflicts=True,
+    )
+    for (user_id, day), (requests, prompt, completion, latency) in totals.items():
+        DailyUsage.objects.filter(user_id=user_id, date=day).update(
+            requests=F('requests') + requests,
+            prompt_tokens=F('prompt_tokens') + prompt,
+            completion_tokens=F('completion_tokens') + completion,
+            llm_latency_ms=F('llm_latency_ms') + latency,
+        )
@@ -1,21 +1,32 @@
-from rest_framework.decorators import api_view, permission_classes
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 import logging
 
-from .models import Conversation, Message
+from .models import Conversation, Message, Tombstone
 from .serializers import (
     ChatRequestSerializer,
     ChatResponseSerializer,
-    ConversationSerializer
+    ConversationSerializer,
+    ConversationSummarySerializer
 )
 from .gemini_service import get_gemini_service
+from . import export, health, logs, metrics, payload_cache, precomputed, profile_cache, purge, summaries, sync, tracing, usage
+from .conditional import make_etag, not_modified, set_validators, variant_etag
 
 logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@tracing.traced('view.chat')
 def chat(request):
     """
     Envoyer un message et recevoir une réponse de l'IA
@@ -41,8 +52,19 @@ def chat(request):
     conversation_id = data.get('conversation_id')
     
     user = request.user
+    # Le budget de classe suit le niveau du profil : le champ class_level de la requête est facultatif
+    profile = profile_cache.get(user.id)['profile']
+    budget_class_level = profile['class_level'] if profile else None
     
     try:
+        # Vérifier les budgets quotidiens avant d'appeler l'IA (et avant toute écriture)
+        budget_error = usage.check_budget(user.id, budget_class_level)
+        if budget_error:
+            return Response(
+                {'error': budget_error, 'conversation_id': conversation_id},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        
         # Récupérer ou créer la conversation
         if conversation_id:
             conversation = Conversation.objects.get(id=conversation_id, user=user)
@@ -58,17 +80,31 @@ def chat(request):
             subject=subject
         )
         
-        logger.info(f"Message reçu de {user.username}: {message}")
+        logger.info(
+            "Message reçu (conversation %s, %d caractères)", conversation.id, len(message),
+            extra={'class_level': class_level, 'subject': subject}
+        )
+        if logs.sample_content():
+            logger.info("Contenu du message: %s", logs.truncate(message))
         
-        # Générer la réponse avec Gemini
-        gemini_service = get_gemini_service()
-        context = {
-            'class_level': class_level,
-            'subject': subject,
-        }
-        ai_response = gemini_service.generate_response(message, context)
+        # Question fréquente déjà traitée cette nuit : pas d'appel à l'IA
+        answer = precomputed.lookup(message, class_level, subject)
+        if answer is not None:
+            ai_response = answer.answer
+            llm_usage = {'prompt_tokens': None, 'completion_tokens': None, 'latency_ms': None}
+        else:
+            # Générer la réponse avec Gemini
+            gemini_service = get_gemini_service()
+            context = {
+                'class_level': class_level,
+                'subject': subject,
+            }
+            ai_response, llm_usage = gemini_service.generate_response_with_usage(message, context)
         
-        logger.info(f"Réponse IA générée pour {user.username}")
+        logger.info(
+            "Réponse IA générée (%d caractères)", len(ai_response),
+            extra={'llm_latency_ms': llm_usage['latency_ms'], 'completion_tokens': llm_usage['completion_tokens']}
+        )
         
         # Sauvegarder la réponse de l'IA
         ai_message = Message.objects.create(
@@ -76,8 +112,19 @@ def chat(request):
             content=ai_response,
             is_user=False,
             class_level=class_level,
-            subject=subject
+            subject=subject,
+            prompt_tokens=llm_usage['prompt_tokens'],
+            completion_tokens=llm_usage['completion_tokens'],
+            llm_latency_ms=llm_usage['latency_ms'],
+            precomputed=answer is not None
         )
+        usage.record_usage(user.id, budget_class_level, llm_usage)
+        
+        # La conversation change : nouvel ETag et visible pour la synchronisation.
+        # Titre et aperçu locaux dans la même requête
+        previous_count = conversation.message_count
+        message_count = summaries.record_exchange(conversation, message)
+        summaries.schedule_summary(conversation, previous_count, message_count)
         
         # Retourner la réponse
         response_data = {
@@ -94,7 +141,7 @@ def chat(request):
             status=status.HTTP_404_NOT_FOUND
         )
     except Exception as e:
-        logger.error(f"Erreur lors du traitement du message: {e}", exc_info=True)
+        logger.error("Erreur lors du traitement du message: %s", e, exc_info=True)
         return Response(
             {'error': 'Erreur lors du traitement de votre message'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -102,6 +149,7 @@ def chat(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@tracing.traced('view.get_conversation')
 def get_conversation(request, conversation_id):
     """
     Récupérer une conversation avec tous ses messages
@@ -111,8 +159,20 @@ def get_conversation(request, conversation_id):
     """
     try:
         conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-        serializer = ConversationSerializer(conversation)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        version = make_etag(conversation.id, conversation.updated_at.isoformat(), *_user_version(conversation.user_id))
+        encoding = payload_cache.accepted_encoding(request)
+        etag = variant_etag(version, encoding)
+        cached = not_modified(request, etag=etag, last_modified=conversation.updated_at)
+        if cached is not None:
+            return cached
+        
+        # JSON déjà sérialisé et compressé, reconstruit seulement si la version a changé
+        payload = payload_cache.get_payload(conversation, version)
+        response = HttpResponse(payload_cache.body_for(payload, encoding), content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return set_validators(response, etag=etag, last_modified=conversation.updated_at)
     except Conversation.DoesNotExist:
         return Response(
             {'error': 'Conversation introuvable'},
@@ -121,19 +181,104 @@ def get_conversation(request, conversation_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@tracing.traced('view.get_user_conversations')
 def get_user_conversations(request):
     """
     Récupérer toutes les conversations de l'utilisateur
     
-    GET /api/conversations/
+    GET /api/conversations/?compact=1
     Headers: Authorization: Bearer <access_token>
+    Avec compact=1 : [{"id", "title", "summary", "message_count", "created_at", "updated_at"}]
     """
-    conversations = Conversation.objects.filter(user=request.user)
+    # Version de la liste : nombre de conversations et dernière mise à jour
+    # (les annotations ne passent pas par le manager qui masque les conversations supprimées)
+    visible = Q(conversations__deleted_at__isnull=True)
+    user = (
+        User.objects
+        .annotate(
+            conversation_count=Count('conversations', filter=visible),
+            last_update=Max('conversations__updated_at', filter=visible),
+        )
+        .get(pk=request.user.pk)
+    )
+    compact = request.query_params.get('compact') in ('1', 'true')
+    etag = make_etag(
+        user.conversation_count, user.last_update and user.last_update.isoformat(), compact, *_user_version(user.id)
+    )
+    cached = not_modified(request, etag=etag)
+    if cached is not None:
+        return cached
+    
+    if compact:
+        # Une ligne étroite par conversation, sans les messages
+        conversations = (
+            Conversation.objects
+            .filter(user=request.user)
+            .only(*ConversationSummarySerializer.Meta.fields)
+        )
+        response = Response(ConversationSummarySerializer(conversations, many=True).data, status=status.HTTP_200_OK)
+        return set_validators(response, etag=etag)
+    
+    conversations = (
+        Conversation.objects
+        .filter(user=request.user)
+        .prefetch_related('messages', 'archive_blocks')
+    )
     serializer = ConversationSerializer(conversations, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    response = Response(serializer.data, status=status.HTTP_200_OK)
+    return set_validators(response, etag=etag)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@tracing.traced('view.sync_changes')
+def sync_changes(request):
+    """
+    Synchronisation incrémentale (clients hors ligne)
+    
+    GET /api/sync/?since=<sync_token>&limit=500
+    Headers: Authorization: Bearer <access_token>
+    Sans `since` : tout l'historique. Réponse: {
+        "conversations": [...],         // créées ou modifiées
+        "messages": [...],              // nouveaux messages
+        "deleted": {"conversations": [ids]},
+        "has_more": false,              // true : relancer avec sync_token
+        "sync_token": "..."             // à renvoyer à la prochaine synchronisation
+    }
+    """
+    try:
+        since = sync.decode_token(request.query_params.get('since'))
+        limit = min(int(request.query_params.get('limit', settings.SYNC_PAGE_SIZE)), settings.SYNC_PAGE_SIZE)
+    except (sync.InvalidSyncToken, ValueError):
+        return Response(
+            {'error': 'Paramètres de synchronisation invalides'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response(sync.changes_since(request.user, since, max(limit, 1)), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@tracing.traced('view.export_history')
+def export_history(request):
+    """
+    Exporter tout l'historique de l'utilisateur (NDJSON, produit au fil de l'eau)
+    
+    GET /api/export/?gzip=1
+    Headers: Authorization: Bearer <access_token>
+    Une ligne JSON par objet : {"type": "user" | "conversation" | "message", ...}
+    """
+    compress = request.query_params.get('gzip') in ('1', 'true')
+    filename = 'historique.ndjson.gz' if compress else 'historique.ndjson'
+    response = StreamingHttpResponse(
+        export.stream_export(request.user, compress=compress),
+        content_type='application/gzip' if compress else 'application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
+@tracing.traced('view.delete_conversation')
 def delete_conversation(request, conversation_id):
     """
     Supprimer une conversation
@@ -141,18 +286,34 @@ def delete_conversation(request, conversation_id):
     DELETE /api/conversation/<id>/
     Headers: Authorization: Bearer <access_token>
     """
-    try:
-        conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-        conversation.delete()
-        return Response(
-            {'message': 'Conversation supprimée avec succès'},
-            status=status.HTTP_200_OK
-        )
-    except Conversation.DoesNotExist:
+    # Suppression logique (un UPDATE) : les lignes sont effacées par purge_deleted
+    deleted = (
+        Conversation.objects
+        .filter(id=conversation_id, user=request.user)
+        .update(deleted_at=timezone.now())
+    )
+    if not deleted:
         return Response(
             {'error': 'Conversation introuvable'},
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    payload_cache.invalidate(conversation_id)
+    Tombstone.objects.create(user=request.user, object_type='conversation', object_id=conversation_id)
+    purge.schedule_purge()
+    return Response(
+        {'message': 'Conversation supprimée avec succès'},
+        status=status.HTTP_200_OK
+    )
+
+def _user_version(user_id):
+    """Champs de l'utilisateur imbriqués dans les conversations (pour les ETags)"""
+    user = profile_cache.get(user_id)
+    profile = user['profile']
+    return (
+        user['id'], user['username'], user['email'],
+        profile and (profile['phone'], profile['class_level'], profile['avatar']),
+    )
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -163,11 +324,57 @@ def health_check(request):
     GET /api/health/
     """
     gemini_service = get_gemini_service()
-    gemini_configured = gemini_service.model is not None
+    gemini_configured = gemini_service.model_name is not None
     
     return Response({
         'status': 'ok',
         'message': 'API Django fonctionne correctement',
         'gemini_configured': gemini_configured,
-        'database': 'MySQL',
-    })
\ No newline at end of file
+        'database': connection.vendor,
+    })
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_live(request):
+    """
+    Sonde de vivacité : le processus répond (aucune dépendance vérifiée)
+    
+    GET /api/health/live/
+    """
+    return Response({'status': 'ok'})
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_ready(request):
+    """
+    Sonde de disponibilité : base de données, cache, réplicas et client Groq
+    
+    GET /api/health/ready/
+    Réponse 503 si la base principale ou le cache est indisponible
+    (réplica en panne, disjoncteur Groq ouvert : 200, statut "degraded")
+    """
+    result = health.readiness()
+    return Response(
+        result,
+        status=status.HTTP_503_SERVICE_UNAVAILABLE if result['status'] == 'error' else status.HTTP_200_OK
+    )
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def metrics_endpoint(request):
+    """
+    Métriques au format Prometheus (agrégées sur tous les workers)
+    
+    GET /api/metrics/
+    Headers: X-Metrics-Token: <METRICS_TOKEN>  // si configuré
+    """
+    if settings.METRICS_TOKEN and request.headers.get('X-Metrics-Token') != settings.METRICS_TOKEN:
+        return Response(
+            {'error': 'Accès refusé'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return HttpResponse(metrics.render_latest(), content_type=metrics.CONTENT_TYPE)
\ No newline at end of file
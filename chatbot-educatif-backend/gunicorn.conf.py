@@ -0,0 +1,29 @@
+"""
+Configuration gunicorn (chargée depuis le dossier courant, sinon `gunicorn -c gunicorn.conf.py`).
+Les options de lancement (workers, bind...) restent sur la ligne de commande.
+"""
+import os
+
+
+def on_starting(server):
+    """Démarrage du maître : efface les instantanés de métriques du lancement précédent"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monprojet.settings')
+    from api import metrics
+
+    metrics.clear_snapshots()
+
+
+def worker_exit(server, worker):
+    """
+    Arrêt d'un worker (redémarrage, déploiement) : enfile la consommation pas
+    encore écrite et écrit le dernier instantané de ses métriques
+    """
+    from django.db import connections
+
+    from api import metrics, usage
+
+    try:
+        usage.flush_usage()
+    finally:
+        connections.close_all()
+        metrics.write_snapshot(force=True)
@@ -0,0 +1,8 @@
+"""MySQL avec le pool de connexions de monprojet.backends.pool"""
+from django.db.backends.mysql import base
+
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,254 @@
+"""
+Pool de connexions commun aux moteurs monprojet.backends.postgresql et
+monprojet.backends.mysql.
+
+Un pool par alias de base et par processus, partagé entre les threads :
+au plus MAX_SIZE connexions ouvertes (donc au plus MAX_SIZE x processus
+gunicorn vers le serveur). Django « ferme » la connexion en fin de requête
+(CONN_MAX_AGE = 0) : elle retourne au pool au lieu d'être fermée. Une
+connexion est vérifiée (ping) si elle est restée inutilisée plus de
+CHECK_AFTER secondes, et remplacée au-delà de MAX_LIFETIME secondes.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.utils import OperationalError
+
+from api import metrics
+
+DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5.0,  # secondes d'attente d'une connexion libre
+    'MAX_LIFETIME': 1800.0,  # secondes
+    'CHECK_AFTER': 30.0,  # secondes d'inactivité avant un ping
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, alias, max_size, timeout, max_lifetime, check_after):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.pid = os.getpid()
+        self.closed = False
+        self._idle = deque()  # (connexion, créée à, rendue à)
+        self._created = {}  # id(connexion) -> créée à
+        self._size = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _report(self):
+        metrics.DB_POOL_SIZE.set(self._size, alias=self.alias)
+        metrics.DB_POOL_IN_USE.set(self._in_use, alias=self.alias)
+
+    def _close(self, connection, reason):
+        self._created.pop(id(connection), None)
+        self._size -= 1
+        metrics.DB_POOL_DISCARDED.inc(alias=self.alias, reason=reason)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _checkout(self, deadline):
+        """Connexion libre (connexion, créée à, rendue à), ou None si une place est réservée pour en ouvrir une"""
+        with self._cond:
+            while True:
+                while self._idle:
+                    entry = self._idle.pop()  # la plus récemment rendue : encore « chaude »
+                    if time.monotonic() - entry[1] >= self.max_lifetime:
+                        self._close(entry[0], 'lifetime')
+                        continue
+                    self._in_use += 1
+                    return entry
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._in_use += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.DB_POOL_TIMEOUTS.inc(alias=self.alias)
+                    raise PoolTimeout(
+                        f"Aucune connexion libre sur '{self.alias}' après {self.timeout}s "
+                        f"({self.max_size} connexions utilisées)"
+                    )
+                self._cond.wait(remaining)
+
+    def acquire(self, connect, ping):
+        """
+        Connexion du pool (ou nouvelle connexion `connect()` s'il reste de la place).
+        `ping(connexion)` retourne False si la connexion ne répond plus.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            entry = self._checkout(deadline)
+            if entry is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created[id(connection)] = time.monotonic()
+                metrics.DB_POOL_CONNECTS.inc(alias=self.alias)
+                break
+            connection, _, released_at = entry
+            if time.monotonic() - released_at < self.check_after or ping(connection):
+                break
+            with self._cond:
+                self._in_use -= 1
+                self._close(connection, 'health_check')
+
+        metrics.DB_POOL_WAIT.observe(time.monotonic() - started, alias=self.alias)
+        with self._cond:
+            self._report()
+        return connection
+
+    def release(self, connection, reusable=True):
+        """Rend une connexion au pool (fermée si elle n'est plus utilisable ou trop ancienne)"""
+        with self._cond:
+            self._in_use -= 1
+            created = self._created.get(id(connection), 0)
+            if self.closed:
+                self._close(connection, 'closed')
+            elif not reusable:
+                self._close(connection, 'error')
+            elif time.monotonic() - created >= self.max_lifetime:
+                self._close(connection, 'lifetime')
+            else:
+                self._idle.append((connection, created, time.monotonic()))
+            self._report()
+            self._cond.notify()
+
+    def close_idle(self):
+        """Ferme les connexions libres (base de test supprimée, changement de fuseau...)"""
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop()[0], 'closed')
+            self._report()
+
+    def stats(self):
+        with self._cond:
+            return {'size': self._size, 'in_use': self._in_use, 'idle': len(self._idle), 'max_size': self.max_size}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _target(settings_dict):
+    return tuple(settings_dict.get(key) for key in ('NAME', 'HOST', 'PORT', 'USER'))
+
+
+def get_pool(alias, settings_dict):
+    """Pool de l'alias pour ce processus (un nouveau pool après un fork ou un changement de base)"""
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is not None and pool.target != _target(settings_dict):
+            # Base de test créée ou supprimée : les connexions libres visent l'ancienne base
+            pool.closed = True
+            pool.close_idle()
+            pool = None
+        if pool is None or pool.pid != os.getpid():
+            # Les connexions héritées du processus parent ne sont pas réutilisées
+            options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = ConnectionPool(
+                alias,
+                max_size=int(options['MAX_SIZE']),
+                timeout=float(options['TIMEOUT']),
+                max_lifetime=float(options['MAX_LIFETIME']),
+                check_after=float(options['CHECK_AFTER']),
+            )
+            pool.target = _target(settings_dict)
+            _pools[alias] = pool
+        return pool
+
+
+def discard_pool(alias):
+    with _pools_lock:
+        pool = _pools.pop(alias, None)
+    if pool is not None and pool.pid == os.getpid():
+        pool.closed = True
+        pool.close_idle()
+
+
+class PooledConnectionMixin:
+    """
+    À placer avant le DatabaseWrapper d'un moteur Django : get_new_connection()
+    emprunte au pool, _close() y rend la connexion.
+    """
+
+    def connection_pool(self):
+        if self.alias == NO_DB_ALIAS:
+            # Connexion sans base (création de la base de test) : jamais mise en commun
+            return None
+        return get_pool(self.alias, self.settings_dict)
+
+    def reuse_connection(self, connection):
+        """Prépare l'état du wrapper pour une connexion reprise du pool"""
+
+    def ping_connection(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # Hors autocommit, le SELECT a ouvert une transaction
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        opened = []
+
+        def connect():
+            opened.append(super(PooledConnectionMixin, self).get_new_connection(conn_params))
+            return opened[0]
+
+        try:
+            connection = pool.acquire(connect, self.ping_connection)
+        except PoolTimeout as e:
+            raise OperationalError(str(e)) from e
+        if not opened:
+            self.reuse_connection(connection)
+        self._pool = pool
+        return connection
+
+    def _close(self):
+        pool = getattr(self, '_pool', None)
+        if self.connection is None or pool is None:
+            return super()._close()
+
+        connection, self._pool = self.connection, None
+        # Fermée au milieu d'un atomic() : Django garde la référence, elle ne doit pas resservir
+        reusable = not self.in_atomic_block
+        if reusable and self.errors_occurred:
+            reusable = self.is_usable()
+        if reusable and not self.autocommit:
+            try:
+                connection.rollback()
+            except Exception:
+                reusable = False
+        pool.release(connection, reusable)
+
+    def close_pool(self):
+        discard_pool(self.alias)
+        parent = getattr(super(), 'close_pool', None)
+        if parent is not None:
+            parent()
@@ -0,0 +1,12 @@
+"""PostgreSQL (psycopg2) avec le pool de connexions de monprojet.backends.pool"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    def reuse_connection(self, connection):
+        # Fixé par get_new_connection() de Django pour une nouvelle connexion
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = IsolationLevel(options.get('isolation_level', IsolationLevel.READ_COMMITTED))
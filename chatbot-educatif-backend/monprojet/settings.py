@@ -80,6 +80,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestContextMiddleware',
+    'api.tracing.TracingMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  
@@ -89,6 +93,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'monprojet.urls'
@@ -155,6 +160,52 @@ else:
         }
     }
 
+# Réplicas en lecture seule (api.replicas), séparées par des virgules.
+# En local : DATABASE_REPLICA_URLS=sqlite:////chemin/copie.sqlite3
+DATABASE_REPLICA_URLS = [url.strip() for url in config('DATABASE_REPLICA_URLS', default='').split(',') if url.strip()]
+for index, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{index}'] = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    # Tests : les réplicas pointent sur la base de test principale
+    DATABASES[f'replica{index}']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Après une écriture, les lectures du même client restent sur le primaire (secondes)
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+# Un réplica en panne est écarté des lectures de tous les workers pendant ce délai (secondes)
+DATABASE_REPLICA_RETRY_SECONDS = config('DATABASE_REPLICA_RETRY_SECONDS', default=30, cast=int)
+
+# Pool de connexions par processus (monprojet.backends.pool), 0 pour le désactiver.
+# Au plus DB_POOL_SIZE x workers connexions par base : à accorder avec max_connections.
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=0, cast=int)
+if DB_POOL_SIZE > 0:
+    POOLED_ENGINES = {
+        'django.db.backends.postgresql': 'monprojet.backends.postgresql',
+        'django.db.backends.mysql': 'monprojet.backends.mysql',
+    }
+    for database in DATABASES.values():
+        if database['ENGINE'] in POOLED_ENGINES:
+            database['ENGINE'] = POOLED_ENGINES[database['ENGINE']]
+            # Connexion rendue au pool à chaque fin de requête ; le pool fait les vérifications
+            database['CONN_MAX_AGE'] = 0
+            database['CONN_HEALTH_CHECKS'] = False
+            database['POOL'] = {
+                'MAX_SIZE': DB_POOL_SIZE,
+                'TIMEOUT': config('DB_POOL_TIMEOUT', default=5.0, cast=float),
+                'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+                'CHECK_AFTER': config('DB_POOL_CHECK_AFTER', default=30.0, cast=float),
+            }
+
+# Cache partagé entre les workers gunicorn (budgets, profils, conversations) :
+# redis://hôte:6379/0 (paquet redis) ou memcached://hôte:11211 (paquet pymemcache).
+# Vide : cache local à chaque processus (un seul worker, ou développement)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL[len('memcached://'):],
+    }}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -216,7 +267,7 @@ else:
 # ========== REST FRAMEWORK ==========
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.tracing.TracedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -238,6 +289,153 @@ SIMPLE_JWT = {
     "http://127.0.0.1:8000",
 ]"""
 
+# ========== INSCRIPTION GROUPÉE ==========
+# POST /api/auth/bulk-register/ (personnel) : élèves par envoi, processus de hachage (0 = un par CPU)
+BULK_REGISTER_MAX_ROWS = config('BULK_REGISTER_MAX_ROWS', default=1000, cast=int)
+BULK_REGISTER_HASH_WORKERS = config('BULK_REGISTER_HASH_WORKERS', default=0, cast=int)
+
+# ========== CONSOMMATION IA ==========
+# Budgets quotidiens en tokens (0 = illimité). Avec plusieurs workers, exige CACHE_URL
+# (contrôle api.E001) : sinon chaque processus compte de son côté
+USAGE_USER_DAILY_TOKENS = config('USAGE_USER_DAILY_TOKENS', default=0, cast=int)
+# Budget par niveau de classe, cumulé sur tous ses élèves. Ex: "cm1:200000,cm2:200000"
+USAGE_CLASS_DAILY_TOKENS = {
+    level.strip(): int(tokens)
+    for level, tokens in (
+        item.split(':') for item in config('USAGE_CLASS_DAILY_TOKENS', default='').split(',') if item
+    )
+}
+# Contrôles à ignorer, séparés par des virgules (ex. api.E001 avec un seul worker)
+SILENCED_SYSTEM_CHECKS = [check.strip() for check in config('SILENCED_SYSTEM_CHECKS', default='').split(',') if check.strip()]
+# Écriture des compteurs en base par lots
+USAGE_FLUSH_BATCH_SIZE = config('USAGE_FLUSH_BATCH_SIZE', default=50, cast=int)
+USAGE_FLUSH_INTERVAL = config('USAGE_FLUSH_INTERVAL', default=30, cast=int)  # secondes
+
+# ========== CACHE DES CONVERSATIONS ==========
+# JSON des conversations stocké compressé (api.payload_cache)
+CONVERSATION_CACHE_TIMEOUT = config('CONVERSATION_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)  # secondes
+CONVERSATION_CACHE_GZIP_LEVEL = config('CONVERSATION_CACHE_GZIP_LEVEL', default=6, cast=int)
+CONVERSATION_CACHE_BROTLI_QUALITY = config('CONVERSATION_CACHE_BROTLI_QUALITY', default=5, cast=int)  # si brotli est installé
+
+# ========== CACHE DES PROFILS ==========
+# Utilisateur + profil sérialisés (api.profile_cache), réécrits à chaque modification.
+# Sans CACHE_URL, les autres workers ne voient ni l'écriture ni l'effacement : durée courte
+PROFILE_CACHE_TIMEOUT = config(
+    'PROFILE_CACHE_TIMEOUT', default=60 * 60 * 24 if CACHE_URL else 60, cast=int,
+)  # secondes
+
+# ========== TITRES ET RÉSUMÉS ==========
+# Résumé des conversations par l'IA (file de tâches) ; sinon titre et aperçu locaux seulement
+CONVERSATION_SUMMARY_LLM = config('CONVERSATION_SUMMARY_LLM', default=False, cast=bool)
+# Mise à jour du résumé tous les N messages
+CONVERSATION_SUMMARY_EVERY = config('CONVERSATION_SUMMARY_EVERY', default=10, cast=int)
+
+# ========== RÉPONSES PRÉCALCULÉES ==========
+# Le chat sert les réponses de PrecomputedAnswer (manage.py warm_answers) sans appeler l'IA
+PRECOMPUTED_ANSWERS_ENABLED = config('PRECOMPUTED_ANSWERS_ENABLED', default=True, cast=bool)
+PRECOMPUTED_TTL_DAYS = config('PRECOMPUTED_TTL_DAYS', default=7, cast=int)
+# Heures creuses (heure locale) pendant lesquelles warm_answers peut appeler l'IA
+PRECOMPUTED_WARM_WINDOW = config('PRECOMPUTED_WARM_WINDOW', default='22:00-06:00')
+PRECOMPUTED_WARM_RATE = config('PRECOMPUTED_WARM_RATE', default=20, cast=float)  # appels par minute
+PRECOMPUTED_WARM_CONCURRENCY = config('PRECOMPUTED_WARM_CONCURRENCY', default=2, cast=int)
+PRECOMPUTED_WARM_MAX_CALLS = config('PRECOMPUTED_WARM_MAX_CALLS', default=500, cast=int)
+
+# ========== SYNCHRONISATION ==========
+# Nombre maximum de messages par réponse de /api/sync/
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=500, cast=int)
+# Fenêtre renvoyée à chaque synchronisation (transactions encore en cours)
+SYNC_SAFETY_MARGIN = config('SYNC_SAFETY_MARGIN', default=5, cast=int)  # secondes
+
+# ========== EXPORT ==========
+# Lignes lues par aller-retour en base et taille des blocs envoyés au client
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_BUFFER_SIZE = config('EXPORT_BUFFER_SIZE', default=64 * 1024, cast=int)  # octets
+
+# ========== TÂCHES D'ARRIÈRE-PLAN ==========
+# File en base exécutée par `manage.py run_tasks` (api.taskqueue)
+TASKS_BATCH_SIZE = config('TASKS_BATCH_SIZE', default=100, cast=int)  # tâches d'un même type par lot
+TASKS_MAX_ATTEMPTS = config('TASKS_MAX_ATTEMPTS', default=5, cast=int)
+TASKS_RETRY_BACKOFF = config('TASKS_RETRY_BACKOFF', default=10, cast=int)  # secondes, doublé à chaque échec
+TASKS_RETRY_BACKOFF_MAX = config('TASKS_RETRY_BACKOFF_MAX', default=3600, cast=int)  # secondes
+TASKS_POLL_INTERVAL = config('TASKS_POLL_INTERVAL', default=1, cast=float)  # secondes, file vide
+TASKS_LOCK_TIMEOUT = config('TASKS_LOCK_TIMEOUT', default=600, cast=int)  # secondes avant de reprendre une tâche
+TASKS_KEEP_FINISHED = config('TASKS_KEEP_FINISHED', default=60 * 60 * 24 * 7, cast=int)  # secondes
+
+# ========== SUPPRESSIONS ==========
+# Délai avant l'effacement réel d'une conversation supprimée (api.purge)
+PURGE_GRACE_PERIOD = config('PURGE_GRACE_PERIOD', default=3600, cast=int)  # secondes
+# Durée maximale d'une purge lancée par la file de tâches
+PURGE_TIME_BUDGET = config('PURGE_TIME_BUDGET', default=60, cast=float)  # secondes
+
+# ========== MÉTRIQUES ==========
+# Dossier partagé entre les workers gunicorn (vide = un seul processus)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)  # secondes
+# Si défini, /api/metrics/ exige l'en-tête X-Metrics-Token
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# ========== PROFILAGE SQL ==========
+# Développement / tests uniquement : enregistre chaque requête SQL par requête HTTP
+QUERY_PROFILER_ENABLED = config('QUERY_PROFILER_ENABLED', default=DEBUG, cast=bool)
+# Nombre de répétitions d'une même requête à partir duquel on signale un N+1
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = config('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+
+# ========== TRACES ==========
+# Spans des requêtes échantillonnées au format OTLP/JSON (api.tracing) :
+# fichier (une ligne par lot) ou URL OTLP/HTTP ; vide = traces désactivées
+TRACING_EXPORT = config('TRACING_EXPORT', default='')
+# Fraction des requêtes tracées
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.01, cast=float)
+# Adresses (IP ou réseaux, ex: "10.0.0.0/8,127.0.0.1") dont l'en-tête traceparent est suivi
+# à la place de TRACING_SAMPLE_RATE ; vide = ignoré (un client forcerait sinon le traçage)
+TRACING_TRUSTED_PROXIES = [
+    proxy.strip() for proxy in config('TRACING_TRUSTED_PROXIES', default='').split(',') if proxy.strip()
+]
+TRACING_SERVICE_NAME = config('TRACING_SERVICE_NAME', default='chatbot-educatif-backend')
+# Traces en attente d'écriture au-delà desquelles on abandonne
+TRACING_QUEUE_SIZE = config('TRACING_QUEUE_SIZE', default=1000, cast=int)
+
+# ========== SONDES DE SANTÉ ==========
+# Durée de mise en cache du résultat de /api/health/ready/
+HEALTH_CACHE_SECONDS = config('HEALTH_CACHE_SECONDS', default=5, cast=float)
+
+# ========== JOURNALISATION ==========
+# JSON sur stdout, écrit par un thread d'arrière-plan (api.logs)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+# Contenu des messages : tronqué, et journalisé pour une fraction des requêtes seulement
+LOG_CONTENT_MAX_CHARS = config('LOG_CONTENT_MAX_CHARS', default=200, cast=int)
+LOG_CONTENT_SAMPLE_RATE = config('LOG_CONTENT_SAMPLE_RATE', default=0.0, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'api.logs.RequestContextFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'api.logs.JSONFormatter'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'api.logs.BackgroundStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
+            'filters': ['request_context'],
+        },
+    },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['background'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # ========== LANGUE ==========
 LANGUAGE_CODE = 'fr-fr'
 TIME_ZONE = 'Africa/Ouagadougou'